@@ -0,0 +1,283 @@
+# benchmark_stats.py
+# Streaming, fixed-memory statistics for the benchmarks: log-linear (HDR-style) latency
+# histograms, frame rate over sliding windows, and a side thread sampling CPU and RSS at a fixed
+# rate. Reports are plain dicts so they can be dumped as JSON and compared between runs:
+#
+#   python3 benchmark_stats.py compare base.json run.json [--threshold 0.1]
+
+import argparse
+import json
+import os
+import sys
+import platform
+import threading
+import time
+
+import psutil
+
+# -----------------------------------
+# Latency histogram
+# -----------------------------------
+class LatencyHistogram:
+    # Values are recorded in seconds and bucketed in whole nanoseconds. Below sub_buckets ns
+    # every value has its own bucket; above that each power of two is split into sub_buckets / 2
+    # linear buckets, so the relative error stays under 1 / (sub_buckets / 2) (< 0.8% with the
+    # default) over the whole range while the bucket count stays fixed.
+    def __init__(self, highest_s=60.0, sub_bucket_bits=8):
+        self.sub_bits = sub_bucket_bits
+        self.sub_buckets = 1 << sub_bucket_bits
+        self.half = self.sub_buckets >> 1
+        self.highest = int(highest_s * 1e9)
+        self.counts = [0] * (self._index(self.highest) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, ns):
+        if ns < self.sub_buckets:
+            return ns
+        shift = ns.bit_length() - self.sub_bits
+        return self.sub_buckets + (shift - 1) * self.half + (ns >> shift) - self.half
+
+    # Midpoint of the values that share a bucket
+    def _value(self, index):
+        if index < self.sub_buckets:
+            return index
+        shift = (index - self.sub_buckets) // self.half + 1
+        mantissa = (index - self.sub_buckets) % self.half + self.half
+        return (mantissa << shift) + ((1 << shift) >> 1)
+
+    def record(self, seconds):
+        ns = int(seconds * 1e9)
+        if ns < 0:
+            ns = 0
+        elif ns > self.highest:
+            ns = self.highest
+        self.counts[self._index(ns)] += 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+        if self.min is None or ns < self.min:
+            self.min = ns
+
+    # q in percent, result in seconds
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        rank = max(1, int(q / 100 * self.count + 0.5))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self._value(index), self.max) / 1e9
+        return self.max / 1e9
+
+    def merge(self, other):
+        for index, n in enumerate(other.counts):
+            self.counts[index] += n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+
+    def summary(self, scale=1e3):
+        # Milliseconds by default
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "min": self.min / 1e9 * scale,
+            "mean": self.total / self.count / 1e9 * scale,
+            "p50": self.percentile(50) * scale,
+            "p90": self.percentile(90) * scale,
+            "p99": self.percentile(99) * scale,
+            "p99.9": self.percentile(99.9) * scale,
+            "max": self.max / 1e9 * scale,
+        }
+
+# -----------------------------------
+# Frame rate over sliding windows
+# -----------------------------------
+class FrameRateWindow:
+    # Frames are counted in one-second slots of a ring covering the longest window. Complete
+    # seconds also feed the min/max one-second rate of the whole run.
+    def __init__(self, windows=(1, 10, 60)):
+        self.windows = tuple(sorted(windows))
+        self.slots = [0] * self.windows[-1]
+        self.current = None
+        self.start = None
+        self.frames = 0
+        self.first = None
+        self.last = None
+        self.min_fps = None
+        self.max_fps = 0
+
+    def tick(self, t):
+        second = int(t)
+        if self.current is None:
+            self.current = self.start = second
+            self.first = t
+        n = len(self.slots)
+        while self.current < second:
+            # Close the second that just ended; the first one is partial and not counted
+            if self.current > self.start:
+                done = self.slots[self.current % n]
+                self.min_fps = done if self.min_fps is None else min(self.min_fps, done)
+                self.max_fps = max(self.max_fps, done)
+            self.current += 1
+            if second - self.current >= n:
+                # Stalled for longer than the ring: every slot is stale
+                self.slots = [0] * n
+                self.min_fps = 0
+                self.current = second
+                break
+            self.slots[self.current % n] = 0
+        self.slots[second % n] += 1
+        self.frames += 1
+        self.last = t
+
+    # Mean frame rate over the last `seconds` complete seconds
+    def fps(self, seconds):
+        if self.current is None:
+            return 0.0
+        seconds = min(seconds, len(self.slots) - 1, self.current - self.start - 1)
+        if seconds <= 0:
+            return 0.0
+        total = sum(self.slots[(self.current - k) % len(self.slots)] for k in range(1, seconds + 1))
+        return total / seconds
+
+    def summary(self):
+        duration = (self.last - self.first) if self.frames > 1 else 0.0
+        report = {
+            "mean": (self.frames - 1) / duration if duration > 0 else 0.0,
+            "min_1s": self.min_fps or 0,
+            "max_1s": self.max_fps,
+        }
+        for seconds in self.windows:
+            report[f"last_{seconds}s"] = self.fps(seconds)
+        return report
+
+# -----------------------------------
+# CPU / memory sampler
+# -----------------------------------
+class RunningStats:
+    __slots__ = ("count", "total", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+        return {"count": self.count, "mean": self.total / self.count, "min": self.min, "max": self.max}
+
+class ResourceSampler:
+    # System-wide CPU percent and the process RSS, sampled every `interval` seconds on a daemon
+    # thread instead of on every frame
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.process = psutil.Process(os.getpid())
+        self.cpu_percent = RunningStats()
+        self.rss_mb = RunningStats()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        # The first cpu_percent() call only sets the reference point
+        psutil.cpu_percent()
+        self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def sample(self):
+        self.cpu_percent.add(psutil.cpu_percent())
+        self.rss_mb.add(self.process.memory_info().rss / (1024 * 1024))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if not self.cpu_percent.count:
+            self.sample()
+
+# -----------------------------------
+# Reports
+# -----------------------------------
+def run_metadata():
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+    }
+
+def write_report(report, path):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+# (section, key, direction): +1 when a larger value is worse, -1 when a smaller one is
+COMPARED_METRICS = [
+    ("callback_ms", "p50", 1), ("callback_ms", "p90", 1), ("callback_ms", "p99", 1),
+    ("callback_ms", "p99.9", 1), ("callback_ms", "mean", 1),
+    ("interval_ms", "p99", 1), ("interval_ms", "p99.9", 1),
+    ("fps", "mean", -1), ("fps", "min_1s", -1),
+    ("cpu_percent", "mean", 1), ("rss_mb", "max", 1),
+]
+
+# Returns a list of (metric, base, new, relative change, regressed)
+def compare_reports(base, new, threshold=0.10):
+    rows = []
+    for section, key, direction in COMPARED_METRICS:
+        a = base.get(section, {}).get(key)
+        b = new.get(section, {}).get(key)
+        if a is None or b is None:
+            continue
+        if a:
+            change = (b - a) / a
+        else:
+            change = float("inf") if b > 0 else 0.0
+        rows.append((f"{section}.{key}", a, b, change, change * direction > threshold))
+    return rows
+
+def print_comparison(rows, threshold):
+    print(f"{'metric':<20} | {'base':>10} | {'new':>10} | {'change':>8} |")
+    for metric, a, b, change, regressed in rows:
+        flag = "REGRESSION" if regressed else ""
+        print(f"{metric:<20} | {a:>10.3f} | {b:>10.3f} | {change * 100:>+7.1f}% | {flag}")
+    regressions = sum(r[4] for r in rows)
+    print(f"{regressions} regression(s) above {threshold * 100:.0f}%")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark report tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compare = commands.add_parser("compare", help="flag regressions between two JSON reports")
+    compare.add_argument("base")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float, default=0.10,
+                         help="relative change counted as a regression (default 0.10)")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    # Non-zero exit so CI can fail on a regression
+    sys.exit(1 if print_comparison(compare_reports(base, new, args.threshold), args.threshold) else 0)
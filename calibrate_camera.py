@@ -1,65 +1,222 @@
 # calibrate_camera.py — Updated to only save valid chessboard images (KRTLUK002)
+#
+# Chessboard corners are detected on a process pool and cached per image content in
+# corner_cache.json next to the images, so recalibrating after adding a few captures only
+# processes the new ones. After solving, the per-image reprojection error is reported and images
+# far above the median are dropped and the calibration solved again.
+#
+#   python3 calibrate_camera.py                         # capture, then calibrate (needs a display)
+#   python3 calibrate_camera.py --images DIR --headless # calibrate existing captures, no display
 
+import argparse
+import concurrent.futures
+import hashlib
+import json
 import cv2
 import numpy as np
 import os
 import sys
 import time
-from picamera2 import Picamera2
-from libcamera import Transform
 import glob
 
-def collect_calibration_points(image_glob, board_size, square_size, criteria):
+# Next to the scripts, where pothole_detection.py and calibrate_distance.py look for them
+base_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SAVE_DIR = os.path.join(base_dir, "checkerboard_images")
+DEFAULT_OUTPUT = os.path.join(base_dir, "new_camera_calibration.npz")
+CORNER_CACHE = "corner_cache.json"
+CORNER_FLAGS = cv2.CALIB_CB_FAST_CHECK | cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_NORMALIZE_IMAGE
+
+# An image is an outlier when its error exceeds OUTLIER_FACTOR x the median and OUTLIER_MIN_PX
+OUTLIER_FACTOR = 2.0
+OUTLIER_MIN_PX = 0.5
+MIN_IMAGES = 5
+MAX_REJECTION_ROUNDS = 3
+
+# -----------------------------------
+# Corner detection
+# -----------------------------------
+def image_digest(fname):
+    with open(fname, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def _init_worker():
+    # One OpenCV thread per process; the pool provides the parallelism
+    cv2.setNumThreads(1)
+
+# Runs in a pool worker. Returns (image_size, corners as an Nx2 list or None)
+def detect_corners(fname, board_size, criteria):
+    img = cv2.imread(fname, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return None, None
+    found, corners = cv2.findChessboardCornersSB(img, board_size, CORNER_FLAGS)
+    if not found:
+        return img.shape[::-1], None
+    corners = cv2.cornerSubPix(img, corners, (11, 11), (-1, -1), criteria)
+    return img.shape[::-1], corners.reshape(-1, 2).tolist()
+
+def load_corner_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_corner_cache(path, cache):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp, path)
+
+# Returns {fname: (image_size, corners or None)} for the readable images, detecting on `workers`
+# processes whatever the cache doesn't already hold
+def find_all_corners(images, board_size, criteria, workers=None, cache_path=None):
+    cache = load_corner_cache(cache_path) if cache_path else {}
+    board = f"{board_size[0]}x{board_size[1]}"
+    keys = {fname: f"{image_digest(fname)}:{board}" for fname in images}
+    todo = [fname for fname in images if keys[fname] not in cache]
+
+    start = time.perf_counter()
+    if todo:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            results = pool.map(detect_corners, todo, [board_size] * len(todo), [criteria] * len(todo),
+                               chunksize=max(1, len(todo) // (4 * (workers or os.cpu_count() or 1))))
+            for fname, (size, corners) in zip(todo, results):
+                if size is None:
+                    print(f"Warning: failed to load {fname}", file=sys.stderr)
+                    continue
+                cache[keys[fname]] = {"size": list(size), "corners": corners}
+        if cache_path:
+            save_corner_cache(cache_path, cache)
+    print(f"Corners: {len(images) - len(todo)} images cached, {len(todo)} detected "
+          f"in {time.perf_counter() - start:.2f} s")
+    return {fname: (tuple(cache[keys[fname]]["size"]), cache[keys[fname]]["corners"])
+            for fname in images if keys[fname] in cache}
+
+def show_corners(fname, board_size, corners):
+    img = cv2.imread(fname)
+    cv2.drawChessboardCorners(img, board_size, np.array(corners, np.float32).reshape(-1, 1, 2), True)
+    cv2.imshow('Corners', img)
+    cv2.waitKey(100)
+
+def collect_calibration_points(image_glob, board_size, square_size, criteria, workers=None,
+                               headless=False, use_cache=True):
     objp = np.zeros((board_size[0]*board_size[1], 3), np.float32)
     objp[:, :2] = np.indices(board_size).T.reshape(-1, 2) * square_size
 
     objpoints = []
     imgpoints = []
+    names = []
 
-    images = glob.glob(image_glob)
+    images = sorted(glob.glob(image_glob))
     if not images:
         print(f"No images found with pattern: {image_glob}", file=sys.stderr)
         sys.exit(1)
 
-    for fname in images:
-        img = cv2.imread(fname)
-        if img is None:
-            print(f"Warning: failed to load {fname}", file=sys.stderr)
-            continue
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-        flags = cv2.CALIB_CB_FAST_CHECK | cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_NORMALIZE_IMAGE
-        found, corners = cv2.findChessboardCornersSB(gray, board_size, flags)
-
-        if not found:
+    cache_path = os.path.join(os.path.dirname(images[0]), CORNER_CACHE) if use_cache else None
+    image_size = None
+    for fname, (size, corners) in find_all_corners(images, board_size, criteria, workers, cache_path).items():
+        if corners is None:
             print(f"Chessboard not found in {fname}")
             continue
-
-        corners = cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), criteria)
+        if image_size is not None and size != image_size:
+            print(f"Warning: skipping {fname}, {size[0]}x{size[1]} differs from {image_size[0]}x{image_size[1]}",
+                  file=sys.stderr)
+            continue
+        image_size = size
         objpoints.append(objp)
-        imgpoints.append(corners)
-
-        cv2.drawChessboardCorners(img, board_size, corners, found)
-        cv2.imshow('Corners', img)
-        cv2.waitKey(100)
+        imgpoints.append(np.array(corners, np.float32).reshape(-1, 1, 2))
+        names.append(fname)
+        if not headless:
+            show_corners(fname, board_size, corners)
 
-    cv2.destroyAllWindows()
-    return objpoints, imgpoints, gray.shape[::-1]
+    if not headless:
+        cv2.destroyAllWindows()
+    return objpoints, imgpoints, image_size, names
 
+# -----------------------------------
+# Solving and reprojection error
+# -----------------------------------
 def calibrate_camera(objpoints, imgpoints, image_size):
     if not objpoints:
         raise RuntimeError("No corners were detected in any image.")
     rms, K, dist, rvecs, tvecs = cv2.calibrateCamera(objpoints, imgpoints, image_size, None, None)
     return rms, K, dist, rvecs, tvecs
 
+# Rotation matrices for a stack of Rodrigues vectors, (N, 3) -> (N, 3, 3)
+def rodrigues(rvecs):
+    rvecs = np.asarray(rvecs, dtype=np.float64).reshape(-1, 3)
+    theta = np.linalg.norm(rvecs, axis=1)
+    safe = np.where(theta > 1e-12, theta, 1.0)
+    k = rvecs / safe[:, None]
+    kx, ky, kz = k[:, 0], k[:, 1], k[:, 2]
+    zero = np.zeros_like(kx)
+    cross = np.stack([zero, -kz, ky, kz, zero, -kx, -ky, kx, zero], axis=1).reshape(-1, 3, 3)
+    s = np.sin(theta)[:, None, None]
+    c = np.cos(theta)[:, None, None]
+    R = np.eye(3) + s * cross + (1 - c) * cross @ cross
+    R[theta <= 1e-12] = np.eye(3)
+    return R
+
+# cv2.projectPoints for every image at once, for the 4/5/8-coefficient distortion models that
+# calibrateCamera returns by default: (N, P, 3) board points -> (N, P, 2) pixels
+def project_points(objpoints, rvecs, tvecs, K, dist):
+    d = np.zeros(8)
+    coeffs = np.asarray(dist, dtype=np.float64).ravel()
+    d[:len(coeffs)] = coeffs
+    k1, k2, p1, p2, k3, k4, k5, k6 = d
+    cam = np.einsum("nij,npj->npi", rodrigues(rvecs), objpoints) + np.asarray(tvecs).reshape(-1, 1, 3)
+    x = cam[..., 0] / cam[..., 2]
+    y = cam[..., 1] / cam[..., 2]
+    r2 = x * x + y * y
+    radial = (1 + r2 * (k1 + r2 * (k2 + r2 * k3))) / (1 + r2 * (k4 + r2 * (k5 + r2 * k6)))
+    xd = x * radial + 2 * p1 * x * y + p2 * (r2 + 2 * x * x)
+    yd = y * radial + p1 * (r2 + 2 * y * y) + 2 * p2 * x * y
+    return np.stack([K[0, 0] * xd + K[0, 1] * yd + K[0, 2], K[1, 1] * yd + K[1, 2]], axis=-1)
+
+# RMS reprojection error of each image in pixels
+def per_image_errors(objpoints, imgpoints, rvecs, tvecs, K, dist):
+    objpoints = np.asarray(objpoints, dtype=np.float64)
+    observed = np.asarray(imgpoints, dtype=np.float64).reshape(len(objpoints), -1, 2)
+    if np.asarray(dist).size in (4, 5, 8):
+        projected = project_points(objpoints, rvecs, tvecs, K, dist)
+    else:
+        projected = np.stack([cv2.projectPoints(o, r, t, K, dist)[0].reshape(-1, 2)
+                              for o, r, t in zip(objpoints, rvecs, tvecs)])
+    return np.sqrt(((observed - projected) ** 2).sum(axis=-1).mean(axis=1))
+
 def compute_reprojection_error(objpoints, imgpoints, rvecs, tvecs, K, dist):
-    total_error = 0
-    for objp, imgp, rvec, tvec in zip(objpoints, imgpoints, rvecs, tvecs):
-        proj, _ = cv2.projectPoints(objp, rvec, tvec, K, dist)
-        total_error += cv2.norm(imgp, proj, cv2.NORM_L2) / len(proj)
-    return total_error / len(objpoints)
+    return float(per_image_errors(objpoints, imgpoints, rvecs, tvecs, K, dist).mean())
+
+# Solves, drops images whose error is far above the median and solves again, until no image is
+# dropped, MIN_IMAGES would be undercut or MAX_REJECTION_ROUNDS is reached. max_error (px)
+# replaces the relative threshold.
+def calibrate_with_outlier_rejection(objpoints, imgpoints, image_size, names, max_error=None):
+    objpoints, imgpoints, names = list(objpoints), list(imgpoints), list(names)
+    for round_ in range(MAX_REJECTION_ROUNDS + 1):
+        rms, K, dist, rvecs, tvecs = calibrate_camera(objpoints, imgpoints, image_size)
+        errors = per_image_errors(objpoints, imgpoints, rvecs, tvecs, K, dist)
+        limit = max_error if max_error is not None else max(OUTLIER_FACTOR * np.median(errors), OUTLIER_MIN_PX)
+        keep = errors <= limit
+        if keep.all() or round_ == MAX_REJECTION_ROUNDS or keep.sum() < MIN_IMAGES:
+            return rms, K, dist, rvecs, tvecs, errors, names
+        for name, error in zip(names, errors):
+            if error > limit:
+                print(f"[DROPPED] {name}: {error:.3f} px > {limit:.3f} px")
+        objpoints = [o for o, k in zip(objpoints, keep) if k]
+        imgpoints = [p for p, k in zip(imgpoints, keep) if k]
+        names = [n for n, k in zip(names, keep) if k]
 
+def print_errors(names, errors):
+    print("Per-image reprojection error (RMS px):")
+    for name, error in sorted(zip(names, errors), key=lambda item: -item[1]):
+        print(f"  {error:7.3f}  {os.path.basename(name)}")
+
+# -----------------------------------
+# Capture
+# -----------------------------------
 def capture_checkerboard_images(num_images, board_size, save_dir):
+    from picamera2 import Picamera2
+
     print(f"Capturing {num_images} valid chessboard images using PiCamera...")
     os.makedirs(save_dir, exist_ok=True)
 
@@ -69,6 +226,8 @@ def capture_checkerboard_images(num_images, board_size, save_dir):
     picam2.start()
     time.sleep(2)
 
+    # Continue numbering after the captures already in the directory, so they stay cached
+    existing = len(glob.glob(os.path.join(save_dir, "chessboard_*.jpg")))
     count = 0
     while count < num_images:
         frame = picam2.capture_array()
@@ -82,7 +241,7 @@ def capture_checkerboard_images(num_images, board_size, save_dir):
             gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
             found, corners = cv2.findChessboardCornersSB(gray, board_size)
             if found:
-                filename = os.path.join(save_dir, f"chessboard_{count:02d}.jpg")
+                filename = os.path.join(save_dir, f"chessboard_{existing + count:02d}.jpg")
                 cv2.imwrite(filename, frame)
                 print(f"[SAVED] {filename}")
                 count += 1
@@ -96,29 +255,49 @@ def capture_checkerboard_images(num_images, board_size, save_dir):
     cv2.destroyAllWindows()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chessboard camera calibration")
+    parser.add_argument("--images", help="calibrate the captures in this directory instead of capturing new ones")
+    parser.add_argument("--capture", type=int, help="number of images to capture (asked when not given)")
+    parser.add_argument("--save-dir", default=DEFAULT_SAVE_DIR, help="where captures are stored")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT, help="calibration file to write")
+    parser.add_argument("--headless", action="store_true", help="no preview windows")
+    parser.add_argument("--workers", type=int, help="corner detection processes (default: one per CPU)")
+    parser.add_argument("--max-error", type=float, help="drop images above this RMS error in px")
+    parser.add_argument("--no-cache", action="store_true", help="ignore and don't update corner_cache.json")
+    args = parser.parse_args()
+
     board_size = (4, 4)       # For a 5×5 squares checkerboard
     square_size = 19.0        # mm
     criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
-    save_dir = "/home/lukea/hailo-rpi5-examples/basic_pipelines/checkerboard_images"
+    headless = args.headless or (sys.platform.startswith("linux") and not os.environ.get("DISPLAY")
+                                 and not os.environ.get("WAYLAND_DISPLAY"))
+    save_dir = args.images or args.save_dir
 
-    try:
-        num_images = int(input("How many valid images should be captured? "))
-    except ValueError:
-        print("Invalid input.")
-        sys.exit(1)
-
-    capture_checkerboard_images(num_images, board_size, save_dir)
+    if not args.images:
+        if headless:
+            print("Capturing needs a display; use --images DIR to calibrate existing captures.")
+            sys.exit(1)
+        num_images = args.capture
+        if num_images is None:
+            try:
+                num_images = int(input("How many valid images should be captured? "))
+            except ValueError:
+                print("Invalid input.")
+                sys.exit(1)
+        capture_checkerboard_images(num_images, board_size, save_dir)
 
-    objpoints, imgpoints, img_size = collect_calibration_points(f"{save_dir}/*.jpg", board_size, square_size, criteria)
+    objpoints, imgpoints, img_size, names = collect_calibration_points(
+        os.path.join(save_dir, "*.jpg"), board_size, square_size, criteria,
+        workers=args.workers, headless=headless, use_cache=not args.no_cache)
 
     print(f"[DEBUG] Number of valid detections: {len(objpoints)}")
-    rms, K, dist, rvecs, tvecs = calibrate_camera(objpoints, imgpoints, img_size)
-    print(f"RMS reprojection error: {rms:.4f}")
+    rms, K, dist, rvecs, tvecs, errors, names = calibrate_with_outlier_rejection(
+        objpoints, imgpoints, img_size, names, args.max_error)
+    print_errors(names, errors)
+    print(f"RMS reprojection error: {rms:.4f} ({len(names)} images)")
     print("Camera matrix:\n", K)
     print("Distortion coefficients:\n", dist.ravel())
+    print(f"Mean reprojection error (per image): {errors.mean():.4f} px")
 
-    mean_error = compute_reprojection_error(objpoints, imgpoints, rvecs, tvecs, K, dist)
-    print(f"Mean reprojection error (per image): {mean_error:.4f} px")
-
-    np.savez("/home/lukea/hailo-rpi5-examples/basic_pipelines/new_camera_calibration.npz", K=K, dist=dist)
-    print("Calibration saved to new_camera_calibration.npz")
+    np.savez(args.out, K=K, dist=dist)
+    print(f"Calibration saved to {args.out}")
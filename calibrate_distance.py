@@ -7,6 +7,7 @@ import os
 from picamera2 import Picamera2
 from libcamera import Transform
 import time
+from ground_plane import ground_homography
 
 # Maximum display size
 MAX_DISPLAY_W, MAX_DISPLAY_H = 800, 800
@@ -15,9 +16,23 @@ MAX_DISPLAY_W, MAX_DISPLAY_H = 800, 800
 base_dir = os.path.dirname(os.path.abspath(__file__))
 calibration_file = os.path.join(base_dir, "new_camera_calibration.npz")
 
+# Resolution of the preview frames K was calibrated on (calibrate_camera.py); the clicked corners
+# are rescaled to it so they can be undistorted and the homography refers to the same pixels
+CALIBRATION_SIZE = (640, 480)
+
 # Will hold the four clicked points (in original-image coordinates)
 orig_points = []
 
+# Ground-plane homography for the undistorted CALIBRATION_SIZE frame, from the four corners
+# clicked on the captured image
+def road_homography(points, K, dist, image_w, image_h, width_mm, length_mm):
+    scale = np.array([CALIBRATION_SIZE[0] / image_w, CALIBRATION_SIZE[1] / image_h])
+    points = np.asarray(points, dtype=np.float64) * scale
+    undistorted = cv2.undistortPoints(points.reshape(-1, 1, 2), K, dist, P=K).reshape(-1, 2)
+    H = ground_homography(undistorted, width_mm, length_mm)
+    print(f"Ground-plane homography:\n{H}")
+    return H
+
 def click_event(event, x, y, flags, param):
     global orig_points, display_img, scale
     if event == cv2.EVENT_LBUTTONDOWN and len(orig_points) < 4:
@@ -45,17 +60,27 @@ def click_event(event, x, y, flags, param):
                 print("Invalid number. Exiting.")
                 exit(1)
 
+            try:
+                ref_real_world_length_mm = float(input("Enter the real-world length of your reference object in millimeters, top edge to bottom edge (e.g. 297 for A4): "))
+            except ValueError:
+                print("Invalid number. Exiting.")
+                exit(1)
+
             mm_per_pixel = ref_real_world_width_mm / avg_px_width
             print(f"Average mm per pixel: {mm_per_pixel:.6f} mm/px")
 
             # Save to existing calibration file
             try:
                 data = np.load(calibration_file)
+                H = road_homography(orig_points, data["K"], data["dist"], img.shape[1], img.shape[0],
+                                    ref_real_world_width_mm, ref_real_world_length_mm)
                 np.savez(calibration_file, 
                          K=data["K"], 
                          dist=data["dist"], 
                          mm_per_pixel=mm_per_pixel, 
-                         ref_pixel_width=avg_px_width)
+                         ref_pixel_width=avg_px_width,
+                         H=H,
+                         image_size=np.array(CALIBRATION_SIZE))
                 print(f"Calibration updated in {calibration_file}")
             except Exception as e:
                 print(f"[ERROR] Could not save mm_per_pixel: {e}")
@@ -64,6 +89,8 @@ def click_event(event, x, y, flags, param):
 
 if __name__ == "__main__":
     print("Place reference object in view of the camera.")
+    print("Lay it flat on the road a few metres ahead; a ~1 m x 1 m rectangle gives a much more")
+    print("accurate ground plane than an A4 sheet, whose corners are only a few pixels apart.")
     print("Press 'k' to capture the image when ready.")
 
     picam2 = Picamera2()
@@ -0,0 +1,207 @@
+# clip_buffer.py
+# Short video clips around each logged pothole, so a road crew sees more than one crop.
+# ClipRing keeps the last few seconds of a stream's frames, downscaled into one array allocated
+# up front: its size is a hard memory cap and the callback only pays a cv2.resize into the next
+# slot, at the clip frame rate rather than the camera's. When a pothole is logged, ClipRecorder
+# waits for the post-event frames and hands the clip's range of slots to ClipEncoder, whose
+# thread copies them out and writes the clip. Nothing on the frame path ever waits for the
+# encoder: every slot carries the sequence number of its frame, so a slot the ring overwrote
+# before the encoder copied it is detected and left out, and a clip the encoder has no room for
+# is dropped and counted.
+
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+log = logging.getLogger("pothole.clips")
+
+# Tried in order: MPEG-4 plays in most players, MJPEG AVI can always be written by OpenCV
+CODECS = (("mp4v", ".mp4"), ("MJPG", ".avi"))
+
+class ClipRing:
+    def __init__(self, seconds=8.0, fps=10.0, size=(320, 240), max_bytes=16 * 2**20):
+        width, height = size
+        frame_bytes = width * height * 3
+        self.fps = fps
+        self.size = (width, height)
+        self.slots = max(2, min(int(seconds * fps), max_bytes // frame_bytes))
+        self.frames = np.zeros((self.slots, height, width, 3), dtype=np.uint8)
+        self.times = np.zeros(self.slots)
+        self.seqs = np.full(self.slots, -1, dtype=np.int64)
+        self.seq = -1  # sequence number of the newest frame
+        self._next_due = None
+
+    @property
+    def nbytes(self):
+        return self.frames.nbytes
+
+    @property
+    def seconds(self):
+        return self.slots / self.fps
+
+    # True when the frame at time t should go into the ring to keep the clip frame rate; a
+    # quarter interval of slack absorbs the jitter of camera timestamps
+    def due(self, t):
+        return self._next_due is None or t >= self._next_due - 0.25 / self.fps
+
+    def push(self, frame, t):
+        seq = self.seq + 1
+        slot = seq % self.slots
+        # Marked as being written, so a concurrent read of the old frame is seen to be torn
+        self.seqs[slot] = -1
+        cv2.resize(frame, self.size, dst=self.frames[slot], interpolation=cv2.INTER_AREA)
+        self.times[slot] = t
+        self.seqs[slot] = seq
+        self.seq = seq
+        due = (t if self._next_due is None else self._next_due) + 1.0 / self.fps
+        self._next_due = due if due > t else t + 1.0 / self.fps
+
+    # Sequence number of the oldest frame still held at or after time t
+    def first_since(self, t):
+        oldest = max(0, self.seq - self.slots + 1)
+        for seq in range(oldest, self.seq + 1):
+            if self.times[seq % self.slots] >= t:
+                return seq
+        return self.seq + 1
+
+    # Copies frame `seq` into out; False if it has been (or is being) overwritten
+    def read(self, seq, out):
+        slot = seq % self.slots
+        if self.seqs[slot] != seq:
+            return False
+        np.copyto(out, self.frames[slot])
+        return self.seqs[slot] == seq
+
+class ClipEncoder:
+    # One thread writing the clips of all streams. At most max_pending clips wait for it; the
+    # frames of the clip in hand are copied into a buffer of one ring's size, so memory stays
+    # within the rings plus that buffer however far behind the encoder is.
+    def __init__(self, directory, fps=10.0, max_pending=2, codecs=CODECS):
+        self.directory = directory
+        self.fps = fps
+        os.makedirs(directory, exist_ok=True)
+        self.fourcc, self.extension = self._probe(codecs)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._buffers = {}  # ring frames shape -> copy buffer
+        self.clips_written = 0
+        self.clips_dropped = 0
+        self.frames_written = 0
+        self.frames_lost = 0
+        self.encode_s = 0.0
+        self._thread = threading.Thread(target=self._run, name="clip-encoder", daemon=True)
+        self._thread.start()
+
+    def _probe(self, codecs):
+        for fourcc, extension in codecs:
+            fd, path = tempfile.mkstemp(suffix=extension, dir=self.directory)
+            os.close(fd)
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), self.fps, (16, 16))
+            ok = writer.isOpened()
+            writer.release()
+            os.remove(path)
+            if ok:
+                return fourcc, extension
+        raise RuntimeError("OpenCV can't write any of the clip codecs " + ", ".join(c for c, _ in codecs))
+
+    # Never blocks: False (and the clip is dropped) when the encoder is still busy
+    def submit(self, ring, first_seq, last_seq, path):
+        try:
+            self._queue.put_nowait((ring, first_seq, last_seq, path))
+            return True
+        except queue.Full:
+            self.clips_dropped += 1
+            log.warning("Clip encoder busy, dropped %s", os.path.basename(path))
+            return False
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            try:
+                self._write(*job)
+            except Exception as e:
+                log.error("Clip %s not written: %s", job[3], e)
+
+    def _write(self, ring, first_seq, last_seq, path):
+        start = time.perf_counter()
+        buffer = self._buffers.get(ring.frames.shape)
+        if buffer is None:
+            buffer = self._buffers[ring.frames.shape] = np.empty_like(ring.frames)
+        # Copy first, while the frames are still in the ring; encode at leisure afterwards
+        count = 0
+        for seq in range(max(first_seq, last_seq - ring.slots + 1), last_seq + 1):
+            if ring.read(seq, buffer[count]):
+                count += 1
+        self.frames_lost += (last_seq - first_seq + 1) - count
+        if not count:
+            return
+        root, extension = os.path.splitext(path)
+        partial = f"{root}.part{extension}"
+        writer = cv2.VideoWriter(partial, cv2.VideoWriter_fourcc(*self.fourcc), ring.fps, ring.size)
+        try:
+            for frame in buffer[:count]:
+                writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+        finally:
+            writer.release()
+        # Appears under its final name only once complete
+        os.replace(partial, path)
+        self.clips_written += 1
+        self.frames_written += count
+        self.encode_s += time.perf_counter() - start
+
+    def stats(self):
+        return {
+            "clips_written": self.clips_written,
+            "clips_dropped": self.clips_dropped,
+            "frames_written": self.frames_written,
+            "frames_lost": self.frames_lost,
+            "encode_ms": self.encode_s / self.clips_written * 1000 if self.clips_written else 0.0,
+            "buffer_mb": sum(b.nbytes for b in self._buffers.values()) / 1e6,
+        }
+
+    # Writes the clips already handed over, then stops the thread
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+class ClipRecorder:
+    # One per stream. request() names the clip of a pothole seen at event_time and returns its
+    # path relative to link_dir (for the detection record); the clip is handed to the encoder
+    # once the ring holds the frames up to event_time + post_s.
+    def __init__(self, ring, encoder, link_dir, pre_s=2.0, post_s=2.0, prefix=""):
+        self.ring = ring
+        self.encoder = encoder
+        self.link_dir = link_dir
+        self.pre_s = pre_s
+        self.post_s = post_s
+        self.prefix = prefix
+        self.pending = []  # (start time, end time, path)
+        self.requested = 0
+
+    def request(self, event_time, name):
+        path = os.path.join(self.encoder.directory, f"{self.prefix}{name}{self.encoder.extension}")
+        self.pending.append((event_time - self.pre_s, event_time + self.post_s, path))
+        self.requested += 1
+        return os.path.relpath(path, self.link_dir)
+
+    # Called from the callback with the frame at time t when ring.due(t)
+    def push(self, frame, t):
+        self.ring.push(frame, t)
+        if self.pending and self.pending[0][1] <= t:
+            self._hand_over(t)
+
+    def _hand_over(self, t):
+        while self.pending and self.pending[0][1] <= t:
+            start_t, _, path = self.pending.pop(0)
+            self.encoder.submit(self.ring, self.ring.first_since(start_t), self.ring.seq, path)
+
+    # At shutdown: the pending clips with whatever post-event frames arrived
+    def flush(self):
+        self._hand_over(float("inf"))
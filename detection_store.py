@@ -0,0 +1,286 @@
+# detection_store.py
+# Indexed detection store. Metadata goes to SQLite in WAL mode so the web UI can read while the
+# detector writes; JPEG crops go to an append-only blob segment file and are addressed by
+# (image_offset, image_length), so readers only load the images they actually show.
+#
+#   python3 detection_store.py migrate pothole_log.csv      # one-shot import of an old CSV log
+#   python3 detection_store.py export pothole_export.csv    # CSV with base64 images, old layout
+
+import argparse
+import base64
+import csv
+import fcntl
+import os
+import sqlite3
+import sys
+import threading
+
+from record_writer import CSV_HEADER, encode_jpeg
+
+DEFAULT_DB = "pothole_log.db"
+
+FIELDS = ["timestamp", "latitude", "longitude", "altitude", "area_m2", "confidence", "frame", "track_id",
+          "stream", "clip_path", "sightings", "vehicles", "last_seen"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    latitude REAL,
+    longitude REAL,
+    altitude REAL,
+    area_m2 REAL,
+    confidence REAL,
+    frame INTEGER,
+    track_id INTEGER,
+    image_offset INTEGER,
+    image_length INTEGER,
+    stream TEXT,
+    clip_path TEXT,
+    sightings INTEGER,
+    vehicles TEXT,
+    last_seen TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_detections_timestamp ON detections(timestamp);
+CREATE INDEX IF NOT EXISTS idx_detections_position ON detections(latitude, longitude);
+"""
+# Columns added after the first release, as (name, type); older databases get them on open.
+# sightings, vehicles and last_seen are set when logs of several vehicles are merged (NULL: one
+# sighting at timestamp by the vehicle the store belongs to, or for synced records by the device
+# that sent them).
+ADDED_COLUMNS = [("stream", "TEXT"), ("clip_path", "TEXT"), ("sightings", "INTEGER"), ("vehicles", "TEXT"),
+                 ("last_seen", "TEXT")]
+
+def blob_path_for(db_path):
+    return os.path.splitext(db_path)[0] + ".blob"
+
+def _float_or_none(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _int_or_none(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+class DetectionStore:
+    def __init__(self, path=DEFAULT_DB, blob_path=None, readonly=False):
+        self.path = path
+        self.blob_path = blob_path or blob_path_for(path)
+        self.readonly = readonly
+        self._lock = threading.RLock()
+
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            self.blob = None
+        else:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+            self._add_columns()
+            self.conn.commit()
+            self.blob = open(self.blob_path, "ab")
+            self.blob.seek(0, os.SEEK_END)
+        self.conn.row_factory = sqlite3.Row
+        self._blob_fd = None
+
+    def _add_columns(self):
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(detections)")}
+        for name, kind in ADDED_COLUMNS:
+            if name not in existing:
+                self.conn.execute(f"ALTER TABLE detections ADD COLUMN {name} {kind}")
+
+    # ---- writing ---- #
+    # The detector and the web UI's log upload may both append: the lock keeps each image whole
+    # and its offset the true end of the file
+    def append_image(self, jpeg):
+        if not jpeg:
+            return None, None
+        with self._lock:
+            self.blob.flush()
+            fcntl.flock(self.blob, fcntl.LOCK_EX)
+            try:
+                offset = self.blob.seek(0, os.SEEK_END)
+                self.blob.write(jpeg)
+                self.blob.flush()
+            finally:
+                fcntl.flock(self.blob, fcntl.LOCK_UN)
+            return offset, len(jpeg)
+
+    def add(self, record, jpeg=None):
+        offset, length = self.append_image(jpeg)
+        values = [record.get(field) for field in FIELDS] + [offset, length]
+        with self._lock:
+            cursor = self.conn.execute(
+                f"INSERT INTO detections ({', '.join(FIELDS)}, image_offset, image_length) "
+                f"VALUES ({', '.join('?' * (len(FIELDS) + 2))})", values)
+            return cursor.lastrowid
+
+    # One more sighting of a logged pothole, by vehicle at time seen (ISO). A record without
+    # vehicles was logged here, by local_vehicle, which is kept as its first vehicle.
+    def add_sighting(self, record_id, vehicle, seen, local_vehicle):
+        with self._lock:
+            self.conn.execute(
+                "UPDATE detections SET sightings = coalesce(sightings, 1) + 1, "
+                "vehicles = CASE WHEN coalesce(vehicles, '') = '' THEN "
+                "CASE WHEN ?1 = ?4 THEN ?1 ELSE ?4 || ',' || ?1 END "
+                "WHEN instr(',' || vehicles || ',', ',' || ?1 || ',') THEN vehicles ELSE vehicles || ',' || ?1 END, "
+                "last_seen = CASE WHEN ?2 > coalesce(last_seen, timestamp) THEN ?2 ELSE coalesce(last_seen, timestamp) END "
+                "WHERE id = ?3", (vehicle, seen, record_id, local_vehicle))
+
+    # Images are made durable before the metadata that points at them
+    def commit(self, fsync=False):
+        with self._lock:
+            if self.blob is not None:
+                self.blob.flush()
+                if fsync:
+                    os.fsync(self.blob.fileno())
+            self.conn.commit()
+
+    # ---- reading ---- #
+    def read_blob(self, offset, length):
+        if offset is None or not length:
+            return None
+        with self._lock:
+            if self._blob_fd is None:
+                if self.blob is not None:
+                    self.blob.flush()
+                self._blob_fd = os.open(self.blob_path, os.O_RDONLY)
+        return os.pread(self._blob_fd, length, offset)
+
+    def read_image(self, record_id):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT image_offset, image_length FROM detections WHERE id = ?", (record_id,)).fetchone()
+        if row is None:
+            return None
+        return self.read_blob(row["image_offset"], row["image_length"])
+
+    def get(self, record_id):
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM detections WHERE id = ?", (record_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    # Streams records in id order without loading the table; where is an extra SQL condition on
+    # the detections columns with its params
+    def iter_records(self, after_id=0, batch_size=1000, where=None, params=()):
+        condition = f"id > ? AND ({where})" if where else "id > ?"
+        while True:
+            with self._lock:
+                rows = self.conn.execute(
+                    f"SELECT * FROM detections WHERE {condition} ORDER BY id LIMIT ?",
+                    (after_id, *params, batch_size)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
+            after_id = rows[-1]["id"]
+
+    def last_id(self):
+        with self._lock:
+            return self.conn.execute("SELECT MAX(id) FROM detections").fetchone()[0] or 0
+
+    def count(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM detections").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self.blob is not None:
+                self.blob.close()
+            if self._blob_fd is not None:
+                os.close(self._blob_fd)
+                self._blob_fd = None
+            self.conn.close()
+
+# -----------------------------------
+# RecordWriter sink
+# -----------------------------------
+class StoreSink:
+    def __init__(self, store):
+        self.store = store
+
+    # Runs on a worker thread, outside the commit lock
+    def prepare(self, record, crop):
+        jpeg = encode_jpeg(crop) if crop is not None and crop.size else None
+        return record, jpeg
+
+    def write_batch(self, rows):
+        for record, jpeg in rows:
+            self.store.add(record, jpeg)
+
+    def commit(self, fsync=False):
+        self.store.commit(fsync)
+
+    def close(self):
+        self.store.close()
+
+# -----------------------------------
+# CSV migration and export
+# -----------------------------------
+def _open_csv_reader(f):
+    # base64 crops are far larger than csv's default 128 KiB field limit
+    csv.field_size_limit(sys.maxsize)
+    return csv.DictReader(f)
+
+def migrate_csv(csv_path, store, batch_size=1000):
+    count = 0
+    with open(csv_path, newline="") as f:
+        for row in _open_csv_reader(f):
+            if not (row.get("timestamp") and row.get("latitude") and row.get("longitude")):
+                continue
+            record = {
+                "timestamp": row["timestamp"],
+                "latitude": _float_or_none(row["latitude"]),
+                "longitude": _float_or_none(row["longitude"]),
+                "altitude": _float_or_none(row.get("altitude")),
+                "area_m2": _float_or_none(row.get("area_m2")),
+                "confidence": _float_or_none(row.get("confidence")),
+                "frame": _int_or_none(row.get("frame")),
+                "track_id": _int_or_none(row.get("track_id")),
+            }
+            image = row.get("image_base64") or ""
+            jpeg = base64.b64decode(image) if image else None
+            store.add(record, jpeg)
+            count += 1
+            if count % batch_size == 0:
+                store.commit()
+    store.commit(fsync=True)
+    return count
+
+def export_csv(store, csv_path):
+    count = 0
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for record in store.iter_records():
+            jpeg = store.read_blob(record["image_offset"], record["image_length"])
+            row = [record[field] for field in CSV_HEADER[:-1]]
+            row.append(base64.b64encode(jpeg).decode("utf-8") if jpeg else "")
+            writer.writerow(row)
+            count += 1
+    return count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pothole detection store utilities")
+    parser.add_argument("--db", default=DEFAULT_DB, help="detection store path")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = commands.add_parser("migrate", help="import a pothole_log.csv into the store")
+    migrate_parser.add_argument("csv_path")
+    export_parser = commands.add_parser("export", help="export the store as a pothole_log.csv")
+    export_parser.add_argument("csv_path")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        store = DetectionStore(args.db)
+        count = migrate_csv(args.csv_path, store)
+        print(f"Migrated {count} records from {args.csv_path} into {args.db}")
+    else:
+        store = DetectionStore(args.db, readonly=True)
+        count = export_csv(store, args.csv_path)
+        print(f"Exported {count} records from {args.db} to {args.csv_path}")
+    store.close()
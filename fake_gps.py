@@ -0,0 +1,239 @@
+# fake_gps.py
+# Serial-port stand-in for the SIM7600 GPS modem, used to exercise the GPS code on a dev box
+# without the HAT attached. The fake vehicle drives a straight line at a constant speed.
+# FakeATModem answers AT commands in-process; FakeNMEADevice streams NMEA sentences on a
+# pseudo-terminal that pyserial opens like the real NMEA port:
+#
+#   with FakeNMEADevice(rate_hz=10) as device:
+#       ser = serial.Serial(device.port, timeout=0.2)
+
+import math
+import os
+import threading
+import time
+
+EARTH_RADIUS_M = 6371000
+
+def to_nmea(value, is_lat):
+    hemisphere = ('N' if value >= 0 else 'S') if is_lat else ('E' if value >= 0 else 'W')
+    value = abs(value)
+    degrees = int(value)
+    minutes = (value - degrees) * 60
+    width = 2 if is_lat else 3
+    return f"{degrees:0{width}d}{minutes:09.6f}", hemisphere
+
+class FakeTrack:
+    def __init__(self, lat=-33.9576, lon=18.4612, alt=45.0, speed_mps=12.0, heading_deg=90.0):
+        self.lat0 = lat
+        self.lon0 = lon
+        self.alt = alt
+        self.speed_mps = speed_mps
+        self.heading = math.radians(heading_deg)
+        self.t0 = time.monotonic()
+
+    def position(self, t=None):
+        elapsed = (time.monotonic() if t is None else t) - self.t0
+        d = self.speed_mps * elapsed
+        north = d * math.cos(self.heading)
+        east = d * math.sin(self.heading)
+        lat = self.lat0 + math.degrees(north / EARTH_RADIUS_M)
+        lon = self.lon0 + math.degrees(east / (EARTH_RADIUS_M * math.cos(math.radians(self.lat0))))
+        return lat, lon, self.alt
+
+class FakeATModem:
+    # Answers AT+CGPSINFO after response_delay seconds. Implements the subset of the pyserial
+    # API used by log_gps_info and gps_service.
+    def __init__(self, track=None, response_delay=0.1, has_fix=True, timeout=1):
+        self.track = track or FakeTrack()
+        self.response_delay = response_delay
+        self.has_fix = has_fix
+        self.timeout = timeout
+        self.writes = 0
+        self._pending = []  # (ready_time, line)
+        self._cond = threading.Condition()
+        self.is_open = True
+
+    def _cgpsinfo_line(self):
+        if not self.has_fix:
+            return b'+CGPSINFO: ,,,,,,,,\r\n'
+        lat, lon, alt = self.track.position()
+        lat_s, ns = to_nmea(lat, True)
+        lon_s, ew = to_nmea(lon, False)
+        now = time.gmtime()
+        date = time.strftime("%d%m%y", now)
+        utc = time.strftime("%H%M%S", now) + ".0"
+        return f"+CGPSINFO: {lat_s},{ns},{lon_s},{ew},{date},{utc},{alt:.1f},{self.track.speed_mps * 1.943844:.1f},\r\n".encode()
+
+    def write(self, data):
+        self.writes += 1
+        ready = time.monotonic() + self.response_delay
+        replies = []
+        for command in data.split(b'\r'):
+            command = command.strip()
+            if not command:
+                continue
+            if command == b'AT+CGPSINFO':
+                replies += [b'\r\n', self._cgpsinfo_line(), b'\r\n', b'OK\r\n']
+            else:
+                replies += [b'OK\r\n']
+        with self._cond:
+            self._pending.extend((ready, line) for line in replies)
+            self._cond.notify_all()
+        return len(data)
+
+    @property
+    def in_waiting(self):
+        now = time.monotonic()
+        with self._cond:
+            return sum(len(line) for ready, line in self._pending if ready <= now)
+
+    def readline(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._pending and self._pending[0][0] <= now:
+                    return self._pending.pop(0)[1]
+                if now >= deadline:
+                    return b''
+                wait = deadline - now
+                if self._pending:
+                    wait = min(wait, self._pending[0][0] - now)
+                self._cond.wait(wait)
+
+    def readlines(self):
+        # pyserial's readlines() returns once the port has been quiet for `timeout`
+        lines = []
+        while True:
+            line = self.readline()
+            if not line:
+                return lines
+            lines.append(line)
+
+    def read(self, size=1):
+        data = b''
+        while len(data) < size:
+            line = self.readline()
+            if not line:
+                break
+            data += line
+        if len(data) > size:
+            with self._cond:
+                self._pending.insert(0, (0.0, data[size:]))
+            data = data[:size]
+        return data
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._pending.clear()
+
+    flushInput = reset_input_buffer
+
+    def close(self):
+        self.is_open = False
+
+def _sentence(body):
+    checksum = 0
+    for byte in body.encode():
+        checksum ^= byte
+    return f"${body}*{checksum:02X}\r\n".encode()
+
+# RMC, GGA and VTG sentences of the fix epoch at time t (time.monotonic()), UTC stamped from the
+# wall clock with millisecond resolution so 10 Hz epochs stay distinct
+def nmea_sentences(track, t=None, talker="GN"):
+    t = time.monotonic() if t is None else t
+    lat, lon, alt = track.position(t)
+    lat_s, ns = to_nmea(lat, True)
+    lon_s, ew = to_nmea(lon, False)
+    wall = time.time() - (time.monotonic() - t)
+    now = time.gmtime(wall)
+    utc = time.strftime("%H%M%S", now) + f"{wall % 1:.2f}"[1:]
+    date = time.strftime("%d%m%y", now)
+    knots = track.speed_mps * 1.943844
+    kmh = track.speed_mps * 3.6
+    heading = math.degrees(track.heading) % 360
+    return [
+        _sentence(f"{talker}RMC,{utc},A,{lat_s},{ns},{lon_s},{ew},{knots:.2f},{heading:.1f},{date},,,A"),
+        _sentence(f"{talker}GGA,{utc},{lat_s},{ns},{lon_s},{ew},1,12,0.8,{alt:.1f},M,32.5,M,,"),
+        _sentence(f"{talker}VTG,{heading:.1f},T,,M,{knots:.2f},N,{kmh:.2f},K,A"),
+    ]
+
+# Splits recorded sentences into epochs: a new epoch starts when RMC/GGA carry a new UTC time
+def _epochs(lines):
+    epochs = []
+    utc = None
+    for line in lines:
+        fields = line.split(b',')
+        if fields[0][-3:] in (b'RMC', b'GGA') and len(fields) > 1 and fields[1] != utc:
+            utc = fields[1]
+            epochs.append([])
+        if epochs:
+            epochs[-1].append(line if line.endswith(b'\n') else line.rstrip() + b'\r\n')
+    return epochs
+
+class FakeNMEADevice:
+    # Streams one epoch of sentences every 1 / rate_hz s on a pseudo-terminal; `port` is the path
+    # to open with pyserial. With corrupt_every=n every n-th sentence gets a flipped byte, and
+    # lines (bytes sentences, e.g. a recorded log) are replayed in a loop instead of the track.
+    def __init__(self, track=None, rate_hz=10.0, corrupt_every=0, lines=None):
+        import tty
+
+        self.track = track or FakeTrack()
+        self.rate_hz = rate_hz
+        self.corrupt_every = corrupt_every
+        self.recorded = _epochs(lines) if lines else None
+        self.epochs = 0
+        self.sentences = 0
+        self.sent_at = []  # time.monotonic() each epoch was written
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="fake-nmea", daemon=True)
+        self._thread.start()
+        return self
+
+    def _epoch(self, t):
+        if self.recorded is None:
+            return nmea_sentences(self.track, t)
+        return self.recorded[self.epochs % len(self.recorded)]
+
+    def _run(self):
+        interval = 1.0 / self.rate_hz
+        next_epoch = time.monotonic()
+        while not self._stop.is_set():
+            t = time.monotonic()
+            data = b""
+            for sentence in self._epoch(t):
+                self.sentences += 1
+                if self.corrupt_every and self.sentences % self.corrupt_every == 0:
+                    sentence = sentence[:7] + bytes([sentence[7] ^ 0x20]) + sentence[8:]
+                data += sentence
+            try:
+                os.write(self._master, data)
+            except OSError:
+                break
+            self.sent_at.append(t)
+            self.epochs += 1
+            next_epoch += interval
+            self._stop.wait(max(0.0, next_epoch - time.monotonic()))
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
@@ -0,0 +1,113 @@
+# frame_path_benchmark.py
+# Per-frame allocations and time of the callback's pixel path, before and after the frame-access
+# layer:
+#   before - get_numpy_from_buffer copy, remap into a new frame, cvtColor into a new frame,
+#            crops encoded through a PIL image
+#   after  - read-only view of the mapped buffer, remap into a reused frame, cvtColor into a
+#            preallocated ring slot, crops encoded by cv2.imencode straight from the array
+# Allocations are measured with tracemalloc, which sees NumPy/OpenCV arrays and Python objects
+# but not memory libjpeg allocates internally. "peak KB" is the most memory a frame had
+# allocated at once on top of what was live before it.
+
+import time
+import tracemalloc
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from lazy_frame import FrameRing, LazyFrame
+from record_writer import encode_jpeg
+from replay import ReplayBuffer
+from undistortion import Undistorter
+
+WIDTH, HEIGHT = 640, 480
+BOX = (260, 300, 120, 80)  # x, y, w, h of the pothole crop
+FRAMES = 200
+READ = 1  # stands in for Gst.MapFlags.READ; ReplayBuffer ignores it
+
+def copy_out(buffer, format, width, height):
+    return buffer.frame.copy()
+
+def annotate(frame):
+    x, y, w, h = BOX
+    cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+    cv2.putText(frame, "pothole 0.87", (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+
+def pil_jpeg(crop):
+    buffered = BytesIO()
+    Image.fromarray(crop).save(buffered, format="JPEG")
+    return buffered.getvalue()
+
+# ---- before ---- #
+def display_before(buffer, undistorter, state):
+    raw = copy_out(buffer, "RGB", WIDTH, HEIGHT)
+    frame = undistorter.undistort_frame(raw)
+    annotate(frame)
+    x, y, w, h = BOX
+    crop = frame[y:y + h, x:x + w].copy()
+    state.append(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+    return pil_jpeg(crop)
+
+def headless_before(buffer, undistorter, state):
+    raw = copy_out(buffer, "RGB", WIDTH, HEIGHT)
+    return pil_jpeg(undistorter.undistort_crop(raw, *BOX))
+
+# ---- after ---- #
+def display_after(buffer, undistorter, state):
+    work, ring = state
+    pixels = LazyFrame(buffer, "RGB", WIDTH, HEIGHT, copy_out, map_flags=READ)
+    raw = pixels.full()
+    frame = work.next(raw.shape)
+    undistorter.undistort_frame(raw, out=frame)
+    annotate(frame)
+    x, y, w, h = BOX
+    crop = frame[y:y + h, x:x + w].copy()
+    cv2.cvtColor(frame, cv2.COLOR_RGB2BGR, dst=ring.next(frame.shape))
+    pixels.release()
+    return encode_jpeg(crop)
+
+def headless_after(buffer, undistorter, state):
+    pixels = LazyFrame(buffer, "RGB", WIDTH, HEIGHT, copy_out, map_flags=READ)
+    crop = undistorter.undistort_crop_rows(pixels.rows, WIDTH, HEIGHT, *BOX)
+    pixels.release()
+    return encode_jpeg(crop)
+
+def profile(path, buffers, undistorter, state):
+    path(buffers[0], undistorter, state)  # warm-up: maps, ring slots
+    peaks = []
+    tracemalloc.start()
+    for buffer in buffers:
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        path(buffer, undistorter, state)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - current)
+        if isinstance(state, list):
+            state.clear()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for buffer in buffers:
+        path(buffer, undistorter, state)
+        if isinstance(state, list):
+            state.clear()
+    ms = (time.perf_counter() - start) / len(buffers) * 1000
+    return np.mean(peaks) / 1024, max(peaks) / 1024, ms
+
+if __name__ == "__main__":
+    undistorter = Undistorter.from_file()
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 255, (HEIGHT, WIDTH, 3), dtype=np.uint8) for _ in range(8)]
+    buffers = [ReplayBuffer(i, frames[i % len(frames)], []) for i in range(FRAMES)]
+
+    print(f"--- Frame path per frame, {WIDTH}x{HEIGHT} RGB ({WIDTH * HEIGHT * 3 / 1024:.0f} KB), "
+          f"one {BOX[2]}x{BOX[3]} crop encoded ---")
+    print(f"{'path':<18} | {'peak KB':>8} | {'max KB':>8} | {'ms':>6}")
+    for name, before, after in [("display", display_before, display_after),
+                                ("headless", headless_before, headless_after)]:
+        for label, path, state in [("before", before, []),
+                                   ("after", after, (FrameRing(count=1), FrameRing()) if after is display_after else None)]:
+            peak_kb, max_kb, ms = profile(path, buffers, undistorter, state)
+            print(f"{f'{name} {label}':<18} | {peak_kb:>8.1f} | {max_kb:>8.1f} | {ms:>6.3f}")
@@ -0,0 +1,479 @@
+# geo_export.py
+# Exports the pothole log for GIS tools: GeoJSON, a GeoPackage (SQLite with an R*Tree spatial
+# index, opens in QGIS/ArcGIS/ogr2ogr) or GeoParquet / Arrow (needs pyarrow). Records are streamed
+# from the detection store (or a legacy pothole_log.csv) in id order and written one at a time or
+# in fixed-size batches, so memory stays flat however long the log is. Images are left out unless
+# asked for: --images DIR writes them as <id>.jpg files that the records link to, --images embed
+# stores the JPEG bytes in the GeoPackage/Parquet file.
+#
+# --incremental keeps the read position in <output>.state.json and only exports the records added
+# since the last run: appended to the GeoJSON and GeoPackage files, as a new part file of a
+# Parquet/Arrow dataset directory.
+#
+#   python3 geo_export.py potholes.geojson --since 2024-05-01 --bbox=-0.2,51.4,0.1,51.6 --min-area 0.05
+#   python3 geo_export.py potholes.gpkg --images crops/ --incremental
+#   python3 geo_export.py potholes.parquet --source pothole_log.csv
+
+import argparse
+import base64
+import csv
+import datetime
+import json
+import os
+import sqlite3
+import struct
+import sys
+import time
+
+from detection_store import DEFAULT_DB, DetectionStore
+
+PROPERTIES = ["timestamp", "altitude", "area_m2", "confidence", "frame", "track_id", "stream", "clip_path"]
+FORMATS = {".geojson": "geojson", ".json": "geojson", ".gpkg": "gpkg", ".parquet": "parquet",
+           ".arrow": "arrow", ".feather": "arrow"}
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+# Local naive time, the form the detector writes its timestamps in
+def parse_time(value):
+    t = datetime.datetime.fromisoformat(value)
+    return t.astimezone().replace(tzinfo=None) if t.tzinfo else t
+
+# Little-endian WKB point
+def wkb_point(lon, lat):
+    return struct.pack("<BIdd", 1, 1, lon, lat)
+
+# -----------------------------------
+# Filters
+# -----------------------------------
+class Filters:
+    # bbox is (min_lon, min_lat, max_lon, max_lat); since/until are datetimes
+    def __init__(self, since=None, until=None, bbox=None, min_area=None):
+        self.since = since
+        self.until = until
+        self.bbox = bbox
+        self.min_area = min_area
+
+    # The position and area filters as SQL on the store, so the position index does the work
+    def sql(self):
+        clauses, params = [], []
+        if self.bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = self.bbox
+            clauses.append("latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?")
+            params += [min_lat, max_lat, min_lon, max_lon]
+        if self.min_area is not None:
+            clauses.append("area_m2 >= ?")
+            params.append(self.min_area)
+        return " AND ".join(clauses) or None, params
+
+    def accept(self, record):
+        if self.bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = self.bbox
+            if not (min_lat <= record["latitude"] <= max_lat and min_lon <= record["longitude"] <= max_lon):
+                return False
+        if self.min_area is not None and (record["area_m2"] is None or record["area_m2"] < self.min_area):
+            return False
+        if self.since is not None or self.until is not None:
+            try:
+                t = parse_time(record["timestamp"])
+            except (TypeError, ValueError):
+                return False
+            if (self.since is not None and t < self.since) or (self.until is not None and t >= self.until):
+                return False
+        return True
+
+# -----------------------------------
+# Sources
+# -----------------------------------
+# Both yield (record, load_image) in id order, where load_image() returns the JPEG bytes or None,
+# and keep in .cursor the position to resume from once the iteration is done.
+class StoreSource:
+    def __init__(self, path):
+        self.store = DetectionStore(path, readonly=True)
+        self.cursor = None
+
+    def records(self, cursor, filters):
+        after_id = cursor or 0
+        # Records committed while the export runs are left for the next run
+        last_id = self.store.last_id()
+        where, params = filters.sql()
+        where = f"id <= ? AND ({where})" if where else "id <= ?"
+        for row in self.store.iter_records(after_id, where=where, params=[last_id, *params]):
+            yield row, (lambda row=row: self.store.read_blob(row["image_offset"], row["image_length"]))
+        self.cursor = max(after_id, last_id)
+
+    def close(self):
+        self.store.close()
+
+class CSVSource:
+    # Records are numbered by data row; the cursor is the byte offset and row number reached
+    def __init__(self, path):
+        self.path = path
+        self.cursor = None
+
+    def records(self, cursor, filters):
+        csv.field_size_limit(sys.maxsize)
+        offset, number = cursor or (0, 0)
+        with open(self.path, "rb") as f:
+            header = next(csv.reader([f.readline().decode("utf-8")]), None)
+            if not header:
+                self.cursor = cursor
+                return
+            offset = max(offset, f.tell())
+            f.seek(offset)
+            while True:
+                line = f.readline()
+                # A line without its newline is still being written; it is picked up next run
+                if not line or not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                values = next(csv.reader([line.decode("utf-8", errors="replace")]), None)
+                if not values:
+                    continue
+                number += 1
+                row = dict(zip(header, values))
+                record = {
+                    "id": number,
+                    "timestamp": row.get("timestamp", ""),
+                    "latitude": _float(row.get("latitude")),
+                    "longitude": _float(row.get("longitude")),
+                    "altitude": _float(row.get("altitude")),
+                    "area_m2": _float(row.get("area_m2")),
+                    "confidence": _float(row.get("confidence")),
+                    "frame": _int(row.get("frame")),
+                    "track_id": _int(row.get("track_id")),
+                    "stream": row.get("stream") or None,
+                    "clip_path": row.get("clip_path") or None,
+                }
+                image = row.get("image_base64") or ""
+                # Decoded only for the records that pass the filters and want their image
+                yield record, (lambda image=image: base64.b64decode(image) if image else None)
+        self.cursor = [offset, number]
+
+    def close(self):
+        pass
+
+# -----------------------------------
+# Writers
+# -----------------------------------
+# write(record, image) takes the record's properties and its image: None, a path relative to the
+# output's directory, or JPEG bytes (embedded). close() returns the state the next incremental run
+# resumes the file with.
+class GeoJSONWriter:
+    HEAD = b'{"type": "FeatureCollection", "features": [\n'
+    TAIL = b"\n]}\n"
+
+    # Appending truncates the closing brackets (state["tail"]) and carries on writing features
+    def __init__(self, path, state=None):
+        self.path = path
+        if state:
+            self.f = open(path, "r+b")
+            self.f.seek(state["tail"])
+            self.f.truncate()
+            self.features = state["features"]
+        else:
+            self.f = open(path, "wb")
+            self.f.write(self.HEAD)
+            self.features = 0
+
+    def write(self, record, image):
+        properties = {"id": record["id"]}
+        properties.update((key, record.get(key)) for key in PROPERTIES)
+        if isinstance(image, str):
+            properties["image"] = image
+        feature = {"type": "Feature", "id": record["id"],
+                   "geometry": {"type": "Point", "coordinates": [record["longitude"], record["latitude"]]},
+                   "properties": properties}
+        if self.features:
+            self.f.write(b",\n")
+        self.f.write(json.dumps(feature, separators=(",", ":")).encode("utf-8"))
+        self.features += 1
+
+    def close(self):
+        tail = self.f.tell()
+        self.f.write(self.TAIL)
+        self.f.close()
+        return {"tail": tail, "features": self.features}
+
+    # An append cut short is truncated again by the next run, which resumes from the old state
+    def abort(self):
+        self.close()
+
+GPKG_APPLICATION_ID = 0x47504B47  # "GPKG"
+GPKG_VERSION = 10300
+WGS84_WKT = ('GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,'
+             'AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,'
+             'AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],'
+             'AUTHORITY["EPSG","4326"]]')
+
+GPKG_SCHEMA = f"""
+CREATE TABLE gpkg_spatial_ref_sys (
+    srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY, organization TEXT NOT NULL,
+    organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL, description TEXT);
+INSERT INTO gpkg_spatial_ref_sys VALUES
+    ('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined', NULL),
+    ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined', NULL),
+    ('WGS 84 geodetic', 4326, 'EPSG', 4326, '{WGS84_WKT}', 'longitude/latitude on WGS 84');
+CREATE TABLE gpkg_contents (
+    table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL, identifier TEXT UNIQUE,
+    description TEXT DEFAULT '', last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')),
+    min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE,
+    srs_id INTEGER REFERENCES gpkg_spatial_ref_sys(srs_id));
+CREATE TABLE gpkg_geometry_columns (
+    table_name TEXT NOT NULL, column_name TEXT NOT NULL, geometry_type_name TEXT NOT NULL,
+    srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL,
+    PRIMARY KEY (table_name, column_name));
+CREATE TABLE gpkg_extensions (
+    table_name TEXT, column_name TEXT, extension_name TEXT NOT NULL, definition TEXT NOT NULL,
+    scope TEXT NOT NULL, UNIQUE (table_name, column_name, extension_name));
+CREATE TABLE potholes (
+    fid INTEGER PRIMARY KEY, geom BLOB, timestamp TEXT, altitude REAL, area_m2 REAL, confidence REAL,
+    frame INTEGER, track_id INTEGER, stream TEXT, clip_path TEXT, image_path TEXT, image BLOB);
+CREATE VIRTUAL TABLE rtree_potholes_geom USING rtree(id, minx, maxx, miny, maxy);
+INSERT INTO gpkg_contents (table_name, data_type, identifier, description, srs_id)
+    VALUES ('potholes', 'features', 'potholes', 'Detected potholes', 4326);
+INSERT INTO gpkg_geometry_columns VALUES ('potholes', 'geom', 'POINT', 4326, 0, 0);
+INSERT INTO gpkg_extensions VALUES ('potholes', 'geom', 'gpkg_rtree_index',
+    'http://www.geopackage.org/spec120/#extension_rtree', 'write-only');
+PRAGMA application_id = {GPKG_APPLICATION_ID};
+PRAGMA user_version = {GPKG_VERSION};
+"""
+
+class GeoPackageWriter:
+    # GeoPackage binary header: magic, version 0, little-endian without envelope, SRS id
+    GEOMETRY_HEADER = struct.pack("<2sBBi", b"GP", 0, 1, 4326)
+
+    # The whole run is one transaction: an interrupted export leaves the file as it was
+    def __init__(self, path, state=None):
+        self.path = path
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        if not state:
+            self.conn.executescript(GPKG_SCHEMA)
+        self.conn.execute("BEGIN")
+        self.extent = None
+
+    def write(self, record, image):
+        lon, lat = record["longitude"], record["latitude"]
+        cursor = self.conn.execute(
+            "INSERT OR REPLACE INTO potholes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [record["id"], self.GEOMETRY_HEADER + wkb_point(lon, lat)] +
+            [record.get(key) for key in PROPERTIES] +
+            [image if isinstance(image, str) else None, image if isinstance(image, bytes) else None])
+        self.conn.execute("INSERT OR REPLACE INTO rtree_potholes_geom VALUES (?, ?, ?, ?, ?)",
+                          (cursor.lastrowid, lon, lon, lat, lat))
+        if self.extent is None:
+            self.extent = [lon, lat, lon, lat]
+        else:
+            extent = self.extent
+            extent[0], extent[1] = min(extent[0], lon), min(extent[1], lat)
+            extent[2], extent[3] = max(extent[2], lon), max(extent[3], lat)
+
+    def close(self):
+        if self.extent is not None:
+            self.conn.execute(
+                "UPDATE gpkg_contents SET min_x = min(coalesce(min_x, ?1), ?1), min_y = min(coalesce(min_y, ?2), ?2), "
+                "max_x = max(coalesce(max_x, ?3), ?3), max_y = max(coalesce(max_y, ?4), ?4), "
+                "last_change = strftime('%Y-%m-%dT%H:%M:%fZ','now') WHERE table_name = 'potholes'", self.extent)
+        self.conn.execute("COMMIT")
+        self.conn.close()
+        return {"created": True}
+
+    def abort(self):
+        self.conn.execute("ROLLBACK")
+        self.conn.close()
+
+class ArrowWriter:
+    # GeoParquet (WKB geometry column plus the "geo" schema metadata) or an Arrow IPC file, written
+    # in record batches of batch_size rows
+    def __init__(self, path, kind="parquet", batch_size=4096):
+        try:
+            import pyarrow as pa
+            import pyarrow.ipc
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet and Arrow export need pyarrow (pip install pyarrow)")
+        self.pa = pa
+        geo = {"version": "1.0.0", "primary_column": "geometry",
+               "columns": {"geometry": {"encoding": "WKB", "geometry_types": ["Point"]}}}
+        self.schema = pa.schema([
+            ("id", pa.int64()), ("geometry", pa.binary()), ("latitude", pa.float64()), ("longitude", pa.float64()),
+            ("timestamp", pa.string()), ("altitude", pa.float64()), ("area_m2", pa.float64()),
+            ("confidence", pa.float64()), ("frame", pa.int64()), ("track_id", pa.int64()),
+            ("stream", pa.string()), ("clip_path", pa.string()), ("image_path", pa.string()), ("image", pa.binary()),
+        ], metadata={"geo": json.dumps(geo)})
+        if kind == "parquet":
+            self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression="zstd")
+        else:
+            self.sink = pa.OSFile(path, "wb")
+            self.writer = pyarrow.ipc.new_file(self.sink, self.schema)
+        self.kind = kind
+        self.batch_size = batch_size
+        self.columns = {name: [] for name in self.schema.names}
+
+    def write(self, record, image):
+        columns = self.columns
+        columns["id"].append(record["id"])
+        columns["geometry"].append(wkb_point(record["longitude"], record["latitude"]))
+        for key in ("latitude", "longitude", *PROPERTIES):
+            columns[key].append(record.get(key))
+        columns["image_path"].append(image if isinstance(image, str) else None)
+        columns["image"].append(image if isinstance(image, bytes) else None)
+        if len(columns["id"]) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if self.columns["id"]:
+            self.writer.write_batch(self.pa.record_batch(list(self.columns.values()), schema=self.schema))
+            for values in self.columns.values():
+                values.clear()
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+        if self.kind != "parquet":
+            self.sink.close()
+        return {}
+
+    def abort(self):
+        self.close()
+
+# -----------------------------------
+# Export
+# -----------------------------------
+def state_path_for(output):
+    return output.rstrip("/\\") + ".state.json"
+
+def load_state(output):
+    try:
+        with open(state_path_for(output)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_state(output, state):
+    path = state_path_for(output)
+    with open(path + ".part", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".part", path)
+
+# Where this run writes, and the writer state it appends with. Without --incremental, and for a
+# file the state doesn't describe, everything goes to a temporary file replaced at the end.
+def _target(output, kind, state, incremental):
+    if not incremental:
+        return output + ".part", None, output
+    if kind in ("parquet", "arrow"):
+        os.makedirs(output, exist_ok=True)
+        part = state.get("parts", 0)
+        return os.path.join(output, f"part-{part:05d}.{kind}"), None, None
+    if state.get("writer") and os.path.exists(output):
+        return output, state["writer"], None
+    return output + ".part", None, output
+
+def export(source, output, kind, filters=None, images=None, incremental=False):
+    filters = filters or Filters()
+    state = load_state(output) if incremental else {}
+    path, writer_state, final = _target(output, kind, state, incremental)
+    if kind == "geojson":
+        writer = GeoJSONWriter(path, writer_state)
+    elif kind == "gpkg":
+        if final is not None and os.path.exists(path):
+            os.remove(path)
+        writer = GeoPackageWriter(path, writer_state)
+    else:
+        writer = ArrowWriter(path, kind)
+    if images not in (None, "embed"):
+        os.makedirs(images, exist_ok=True)
+    link_dir = os.path.dirname(os.path.abspath(output.rstrip("/\\")))
+
+    counts = {"exported": 0, "filtered": 0, "no_position": 0, "images": 0}
+    start = time.perf_counter()
+    try:
+        for record, load_image in source.records(state.get("cursor"), filters):
+            if record["latitude"] is None or record["longitude"] is None:
+                counts["no_position"] += 1
+                continue
+            if not filters.accept(record):
+                counts["filtered"] += 1
+                continue
+            image = None
+            if images is not None:
+                jpeg = load_image()
+                if jpeg and images == "embed":
+                    image = jpeg
+                elif jpeg:
+                    image_path = os.path.join(images, f"{record['id']}.jpg")
+                    with open(image_path, "wb") as f:
+                        f.write(jpeg)
+                    image = os.path.relpath(image_path, link_dir)
+                counts["images"] += image is not None
+            writer.write(record, image)
+            counts["exported"] += 1
+    except BaseException:
+        writer.abort()
+        if final is not None or kind in ("parquet", "arrow"):
+            os.remove(path)
+        raise
+    writer_state = writer.close()
+    if final is not None:
+        os.replace(path, final)
+    if incremental:
+        parts = state.get("parts", 0)
+        if kind in ("parquet", "arrow"):
+            if counts["exported"]:
+                parts += 1
+            else:
+                os.remove(path)
+        save_state(output, {"cursor": source.cursor, "writer": writer_state, "parts": parts})
+    counts["seconds"] = time.perf_counter() - start
+    return counts
+
+def parse_bbox(value):
+    bbox = tuple(float(v) for v in value.split(","))
+    if len(bbox) != 4:
+        raise argparse.ArgumentTypeError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    return bbox
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the pothole log to GeoJSON, GeoPackage or GeoParquet")
+    parser.add_argument("output", help="output path; the format follows the extension "
+                                       "(.geojson, .gpkg, .parquet, .arrow)")
+    parser.add_argument("--source", default=DEFAULT_DB, help="detection store (.db) or legacy pothole_log.csv")
+    parser.add_argument("--format", choices=sorted(set(FORMATS.values())), help="override the extension")
+    parser.add_argument("--since", type=parse_time, help="only records at or after this ISO time")
+    parser.add_argument("--until", type=parse_time, help="only records before this ISO time")
+    parser.add_argument("--bbox", type=parse_bbox, help="min_lon,min_lat,max_lon,max_lat (--bbox=... when negative)")
+    parser.add_argument("--min-area", type=float, help="minimum area_m2")
+    parser.add_argument("--images", metavar="DIR|embed",
+                        help="write crops as DIR/<id>.jpg, or embed them (GeoPackage/Parquet/Arrow)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only export records added since the last --incremental run")
+    args = parser.parse_args()
+
+    kind = args.format or FORMATS.get(os.path.splitext(args.output.rstrip("/\\"))[1].lower())
+    if kind is None:
+        parser.error("unknown output format, use --format")
+    if args.images == "embed" and kind == "geojson":
+        parser.error("GeoJSON can't embed images, give --images a directory")
+    if not os.path.exists(args.source):
+        parser.error(f"{args.source} not found")
+    source = CSVSource(args.source) if args.source.lower().endswith(".csv") else StoreSource(args.source)
+    try:
+        counts = export(source, args.output, kind, Filters(args.since, args.until, args.bbox, args.min_area),
+                        args.images, args.incremental)
+    except RuntimeError as e:
+        parser.error(str(e))
+    finally:
+        source.close()
+    rate = counts["exported"] / counts["seconds"] if counts["seconds"] else 0.0
+    print(f"Exported {counts['exported']} records ({counts['images']} images) to {args.output} in "
+          f"{counts['seconds']:.2f} s, {rate:.0f} records/s; {counts['filtered']} filtered out, "
+          f"{counts['no_position']} without a position")
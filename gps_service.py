@@ -0,0 +1,284 @@
+# gps_service.py
+# Background GPS fix service. A worker thread owns the modem and keeps the most recent fixes in a
+# timestamped ring buffer, so the detection callback can ask "where were we at time T" without
+# ever touching the serial port. Fixes come from the NMEA sentences the receiver streams at its
+# native rate, or from AT+CGPSINFO polling where no stream is available.
+
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+
+from log_gps_info import parse_cgpsinfo
+from nmea import EpochAssembler, NMEAStreamParser
+
+log = logging.getLogger("pothole.gps")
+
+# t is time.monotonic() seconds at which the fix was received; streamed fixes also carry speed
+# and heading
+Fix = namedtuple("Fix", ["t", "lat", "lon", "alt", "speed_mps", "heading_deg"], defaults=(None, None))
+
+NO_FIX = (None, None, None)
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+# -----------------------------------
+# Fix sources
+# -----------------------------------
+class ATPollSource:
+    # Polls a SIM7600-style modem with AT+CGPSINFO. Instead of a fixed sleep, the reply is read
+    # line by line until the modem answers OK/ERROR or the timeout expires. With opener (a callable
+    # returning the serial port) the port is found and opened on the service thread, so probing
+    # the modem doesn't hold up startup.
+    def __init__(self, ser=None, timeout=1.5, opener=None):
+        self.ser = ser
+        self.timeout = timeout
+        self.opener = opener
+
+    def start(self):
+        if self.ser is None:
+            self.ser = self.opener()
+        self.ser.write(b'AT+CGPS=1,1\r')
+        self._read_reply()
+
+    def _read_reply(self):
+        lines = []
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            line = self.ser.readline()
+            if not line:
+                continue
+            lines.append(line)
+            stripped = line.strip()
+            if stripped == b'OK' or stripped.startswith(b'ERROR'):
+                break
+        return lines
+
+    def read_fix(self):
+        self.ser.write(b'AT+CGPSINFO\r')
+        lines = self._read_reply()
+        received = time.monotonic()
+        lat, lon, alt = parse_cgpsinfo(lines)
+        if lat is None or lon is None:
+            return None
+        return Fix(received, lat, lon, _to_float(alt))
+
+    def close(self):
+        if self.ser is not None:
+            self.ser.close()
+            if self.opener is not None:
+                self.ser = None
+
+class NMEAStreamSource:
+    # Reads the sentences the receiver streams on its NMEA port and returns one merged fix per
+    # epoch, timestamped when its first sentence was read. enable (optional) is called first to
+    # switch the stream on, e.g. AT+CGPS=1 on the AT port. start() fails unless a sentence with
+    # a valid checksum arrives within probe_s, so a FallbackSource can move on to polling.
+    streaming = True
+
+    def __init__(self, ser=None, opener=None, enable=None, probe_s=3.0, read_timeout=0.5):
+        self.ser = ser
+        self.opener = opener
+        self.enable = enable
+        self.probe_s = probe_s
+        self.read_timeout = read_timeout
+        self.parser = NMEAStreamParser()
+        self.assembler = EpochAssembler()
+        self._fixes = deque()
+
+    def start(self):
+        if self.enable is not None:
+            self.enable()
+        if self.ser is None:
+            self.ser = self.opener()
+        deadline = time.monotonic() + self.probe_s
+        while not self.parser.sentences:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"no NMEA sentences within {self.probe_s:g} s")
+            self._read()
+
+    def _read(self):
+        data = self.ser.read(self.ser.in_waiting or 1)
+        if not data:
+            return
+        received = time.monotonic()
+        for sentence in self.parser.feed(data):
+            merged = self.assembler.add(sentence, received)
+            if merged is not None:
+                t, fix = merged
+                self._fixes.append(Fix(t, fix.lat, fix.lon, fix.alt, fix.speed_mps, fix.heading_deg))
+
+    def read_fix(self):
+        deadline = time.monotonic() + self.read_timeout
+        while not self._fixes and time.monotonic() < deadline:
+            self._read()
+        return self._fixes.popleft() if self._fixes else None
+
+    def stats(self):
+        return self.parser.stats()
+
+    def close(self):
+        if self.ser is not None:
+            self.ser.close()
+            if self.opener is not None:
+                self.ser = None
+
+class FallbackSource:
+    # Uses the first source that starts, in order of preference (the NMEA stream, then polling)
+    def __init__(self, *sources):
+        self.sources = sources
+        self.active = None
+
+    @property
+    def streaming(self):
+        return getattr(self.active, "streaming", False)
+
+    def start(self):
+        errors = []
+        for source in self.sources:
+            try:
+                source.start()
+            except Exception as e:
+                errors.append(f"{type(source).__name__}: {e}")
+                log.warning("GPS source %s unavailable: %s", type(source).__name__, e)
+                if isinstance(source, NMEAStreamSource):
+                    source.close()
+                continue
+            self.active = source
+            log.info("GPS fixes from %s", type(source).__name__)
+            return
+        raise RuntimeError("; ".join(errors))
+
+    def read_fix(self):
+        return self.active.read_fix()
+
+    def close(self):
+        for source in self.sources:
+            try:
+                source.close()
+            except Exception:
+                pass
+
+# -----------------------------------
+# Service
+# -----------------------------------
+class GPSService:
+    def __init__(self, source, poll_interval=0.2, capacity=600, max_age=5.0, max_extrapolation=2.0,
+                 retry_interval=5.0):
+        self.source = source
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self.max_age = max_age
+        self.max_extrapolation = max_extrapolation
+        self._fixes = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.fix_count = 0
+        self.empty_polls = 0
+        self.errors = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="gps-service", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        try:
+            self.source.close()
+        except Exception:
+            pass
+
+    def _run(self):
+        # A modem that isn't up yet is retried; until then position_at() reports no fix
+        while not self._stop.is_set():
+            try:
+                self.source.start()
+                break
+            except Exception as e:
+                self.errors += 1
+                log.error("GPS source start failed, retrying in %.0f s: %s", self.retry_interval, e)
+                self._stop.wait(self.retry_interval)
+        while not self._stop.is_set():
+            try:
+                fix = self.source.read_fix()
+            except Exception as e:
+                self.errors += 1
+                log.error("GPS read failed: %s", e)
+                fix = None
+            if fix is not None:
+                self.add_fix(fix)
+            else:
+                self.empty_polls += 1
+            # A streaming source paces itself on the port
+            if self.poll_interval and not getattr(self.source, "streaming", False):
+                self._stop.wait(self.poll_interval)
+
+    def add_fix(self, fix):
+        with self._lock:
+            # Sources may deliver late; keep the buffer ordered by time
+            if self._fixes and fix.t < self._fixes[-1].t:
+                return
+            self._fixes.append(fix)
+            self.fix_count += 1
+
+    def latest(self):
+        with self._lock:
+            return self._fixes[-1] if self._fixes else None
+
+    # Returns (lat, lon, alt) at monotonic time t, or (None, None, None) when no usable fix exists.
+    # Frames normally land between the newest two fixes or just after the newest one, so the
+    # buffer is scanned from the newest end.
+    def position_at(self, t):
+        with self._lock:
+            if not self._fixes:
+                return NO_FIX
+            newest = self._fixes[-1]
+            if t >= newest.t:
+                if t - newest.t > self.max_age:
+                    return NO_FIX
+                if len(self._fixes) < 2:
+                    return newest.lat, newest.lon, newest.alt
+                before, after = self._fixes[-2], newest
+                # Extrapolate along the last leg for a short horizon, then hold the last fix
+                t = min(t, newest.t + self.max_extrapolation)
+            else:
+                after = None
+                before = None
+                for fix in reversed(self._fixes):
+                    if fix.t <= t:
+                        before = fix
+                        break
+                    after = fix
+                if before is None:
+                    oldest = self._fixes[0]
+                    if oldest.t - t > self.max_age:
+                        return NO_FIX
+                    return oldest.lat, oldest.lon, oldest.alt
+
+        span = after.t - before.t
+        if span <= 0:
+            return after.lat, after.lon, after.alt
+        if span > 2 * self.max_age:
+            # Fix was lost in between, interpolating across the gap would be a guess
+            nearest = before if t - before.t <= after.t - t else after
+            if abs(nearest.t - t) > self.max_age:
+                return NO_FIX
+            return nearest.lat, nearest.lon, nearest.alt
+
+        a = (t - before.t) / span
+        lat = before.lat + a * (after.lat - before.lat)
+        lon = before.lon + a * (after.lon - before.lon)
+        if before.alt is not None and after.alt is not None:
+            alt = before.alt + a * (after.alt - before.alt)
+        else:
+            alt = after.alt if a >= 0.5 else before.alt
+        return lat, lon, alt
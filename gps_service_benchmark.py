@@ -0,0 +1,53 @@
+# gps_service_benchmark.py
+# Compares the time the detection callback spends on GPS tagging with the old blocking
+# get_gps_coordinates() path against a lookup on the background GPS service, for several
+# simulated modem response delays. Runs entirely against the fake modem.
+
+import statistics
+import time
+
+from fake_gps import FakeATModem, FakeTrack
+from gps_service import ATPollSource, GPSService
+from log_gps_info import get_gps_coordinates
+
+DETECTIONS_PER_FRAME = 3
+
+def blocking_callback(modem):
+    # Old behaviour: one modem round trip per detection
+    for _ in range(DETECTIONS_PER_FRAME):
+        get_gps_coordinates(modem)
+
+def service_callback(gps):
+    # New behaviour: one non-blocking lookup tags every detection in the frame
+    lat, lon, alt = gps.position_at(time.monotonic())
+    return [(lat, lon, alt)] * DETECTIONS_PER_FRAME
+
+def measure(fn, arg, frames):
+    samples = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        fn(arg)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+def summary(samples):
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return f"mean {statistics.mean(samples):9.3f} ms | p99 {p99:9.3f} ms | max {samples[-1]:9.3f} ms"
+
+if __name__ == "__main__":
+    track = FakeTrack()
+    print(f"--- GPS tagging cost per frame ({DETECTIONS_PER_FRAME} detections) ---")
+    for delay in (0.05, 0.3, 0.8):
+        modem = FakeATModem(track, response_delay=delay, timeout=0.05)
+        old = measure(blocking_callback, modem, 2)
+
+        gps = GPSService(ATPollSource(FakeATModem(track, response_delay=delay)), poll_interval=0.0).start()
+        while gps.latest() is None:
+            time.sleep(0.01)
+        new = measure(service_callback, gps, 20000)
+        gps.stop()
+
+        print(f"modem delay {delay * 1000:4.0f} ms")
+        print(f"  blocking get_gps_coordinates : {summary(old)}")
+        print(f"  GPSService.position_at       : {summary(new)} ({gps.fix_count} fixes buffered)")
@@ -0,0 +1,101 @@
+# ground_plane.py
+# Metric size estimation on the road plane. calibrate_distance.py fits a homography H from
+# undistorted image pixels to road-plane millimetres using the four clicked corners of a reference
+# rectangle lying on the ground. At runtime the plane position of every pixel corner is
+# precomputed once per resolution, so the ground area of all boxes in a frame is one gather of
+# their corners from that table and one vectorized cross product.
+
+import cv2
+import numpy as np
+
+# Plane coordinates of the reference corners, in the click order TL, TR, BR, BL
+def reference_rectangle(width_mm, length_mm):
+    return np.array([[0, 0], [width_mm, 0], [width_mm, length_mm], [0, length_mm]], dtype=np.float64)
+
+# Homography from 4 image points (TL, TR, BR, BL, undistorted pixels) to the plane in mm
+def ground_homography(image_points, width_mm, length_mm):
+    src = np.asarray(image_points, dtype=np.float32).reshape(4, 2)
+    dst = reference_rectangle(width_mm, length_mm).astype(np.float32)
+    H = cv2.getPerspectiveTransform(src, dst).astype(np.float64)
+    # H is only defined up to scale; pick the sign that puts the road side of the horizon at w > 0
+    centre = src.mean(axis=0)
+    if H[2, 0] * centre[0] + H[2, 1] * centre[1] + H[2, 2] < 0:
+        H = -H
+    return H
+
+# Maps Nx2 pixels through H; points on or beyond the horizon come back as NaN
+def apply_homography(H, points):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    projected = points @ H[:, :2].T + H[:, 2]
+    w = projected[:, 2:3]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        plane = projected[:, :2] / w
+    plane[w[:, 0] <= 0] = np.nan
+    return plane
+
+# Half the cross product of two diagonals in mm is the area in mm2; scaling both by this gives m2
+AREA_SCALE = (0.5e-6) ** 0.5
+
+# (x_min, y_min, x_max, y_max) boxes @ this matrix -> flat table index of their corners TL, TR,
+# BR, BL in a frame `width` pixels wide
+def corner_index_matrix(width):
+    stride = width + 1
+    return np.array([[1, 0, 0, 1],
+                     [stride, stride, 0, 0],
+                     [0, 1, 1, 0],
+                     [0, 0, stride, stride]], dtype=np.int64)
+
+class GroundPlane:
+    def __init__(self, H, image_size):
+        self.H = np.asarray(H, dtype=np.float64)
+        self.image_size = tuple(int(v) for v in image_size)
+        self._luts = {}  # (width, height) -> (corner table, corner_index_matrix)
+
+    @classmethod
+    def from_calibration(cls, data):
+        if "H" not in data or "image_size" not in data:
+            return None
+        return cls(data["H"], data["image_size"])
+
+    # H for another resolution of the same field of view
+    def homography_for(self, width, height):
+        sx = width / self.image_size[0]
+        sy = height / self.image_size[1]
+        return self.H @ np.diag([1 / sx, 1 / sy, 1.0])
+
+    # Plane position of every pixel corner as one flat complex64 table (x + iy, mm * AREA_SCALE)
+    # indexed by y * (width + 1) + x; 2.4 MB at 640x480
+    def lut(self, width, height):
+        lut = self._luts.get((width, height))
+        if lut is None:
+            H = self.homography_for(width, height)
+            xs, ys = np.meshgrid(np.arange(width + 1, dtype=np.float64), np.arange(height + 1, dtype=np.float64))
+            plane = apply_homography(H, np.stack([xs.ravel(), ys.ravel()], axis=1))
+            # Scaled so that the cross product below comes out as the area in m2
+            plane *= AREA_SCALE
+            table = np.empty(len(plane), dtype=np.complex64)
+            table.real = plane[:, 0]
+            table.imag = plane[:, 1]
+            lut = (table, corner_index_matrix(width))
+            self._luts[(width, height)] = lut
+        return lut
+
+    # Nx4 integer (x_min, y_min, x_max, y_max) boxes clipped to the frame -> ground areas in m2.
+    # The box outline is a quadrilateral on the road and its area is half the cross product of
+    # the diagonals, exact for a planar road: with corners as complex numbers, Im(conj(d1) * d2).
+    # All corners of all boxes are one gather from the table. Boxes reaching above the horizon
+    # get NaN.
+    def box_areas_m2(self, boxes, width, height):
+        table, corners = self.lut(width, height)
+        z = table.take(np.asarray(boxes, dtype=np.int64).reshape(-1, 4) @ corners)
+        diagonals = z[:, :2] - z[:, 2:]  # TL - BR, TR - BL
+        return np.absolute((diagonals[:, 0].conj() * diagonals[:, 1]).imag, dtype=np.float64)
+
+# The original estimate, one formula for all boxes: mm_per_pixel is rescaled by ref_pixel_width / w,
+# so area = w * h * (mm_per_pixel * ref_pixel_width / w)^2
+def legacy_box_areas_m2(boxes, mm_per_pixel, ref_pixel_width):
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    w = boxes[:, 2] - boxes[:, 0]
+    h = boxes[:, 3] - boxes[:, 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(w > 0, h * (float(mm_per_pixel) * float(ref_pixel_width)) ** 2 / w / 1e6, 0.0)
@@ -0,0 +1,139 @@
+# lazy_frame.py
+# Deferred access to the pixels of a GstBuffer. Most frames carry no pothole and nobody is
+# watching the preview, so the callback reads the ROI metadata first and only touches pixels when
+# a track wants a crop or a viewer is attached. Packed RGB buffers are then mapped read-only and
+# used as a NumPy view for the rest of the callback, so remap reads straight from pipeline memory
+# and nothing is copied. When mapping is not possible a crop copies only the raw rows its
+# undistortion map reads (Gst.Buffer.extract_dup()), and only a display frame copies everything.
+#
+# FrameRing holds the preallocated output frames the display path remaps and converts into.
+
+import numpy as np
+
+# Bytes per pixel of the packed formats whose rows can be extracted directly
+PACKED_FORMATS = {"RGB": 3, "BGR": 3, "RGBA": 4, "BGRA": 4, "RGBx": 4, "BGRx": 4}
+
+class FrameAccounting:
+    # Pixel bytes copied out of buffers, against what copying every frame in full would cost
+    def __init__(self):
+        self.frames = 0
+        self.mapped = 0
+        self.full_frames = 0
+        self.bands = 0
+        self.bytes_copied = 0
+        self.frame_bytes = 0
+
+    def summary(self):
+        return {
+            "frames": self.frames,
+            "mapped": self.mapped,
+            "full_frames": self.full_frames,
+            "crop_bands": self.bands,
+            "mb_copied": self.bytes_copied / 1e6,
+            "mb_eager": self.frame_bytes / 1e6,
+            "copied_share": self.bytes_copied / self.frame_bytes if self.frame_bytes else 0.0,
+        }
+
+class LazyFrame:
+    # extract is get_numpy_from_buffer(buffer, format, width, height), used for copies. With
+    # map_flags (Gst.MapFlags.READ) packed buffers are mapped instead; the view is only valid
+    # until release(), which the callback calls before returning the buffer to the pipeline.
+    def __init__(self, buffer, format, width, height, extract, stats=None, map_flags=None):
+        self.buffer = buffer
+        self.format = format
+        self.width = width
+        self.height = height
+        self.extract = extract
+        self.stats = stats
+        self.map_flags = map_flags
+        self.channels = PACKED_FORMATS.get(format)
+        self._frame = None
+        self._view = None
+        self._map_info = None
+        if stats is not None:
+            stats.frames += 1
+            stats.frame_bytes += width * height * (self.channels or 3)
+
+    # True while crops can still be served from row bands instead of the full frame
+    @property
+    def banded(self):
+        return self._frame is None and self.channels is not None
+
+    # Read-only (height, width, channels) view of the mapped buffer, or None if it can't be mapped
+    def view(self):
+        if self._view is None and self._map_info is None and self.channels and self.map_flags is not None:
+            ok, info = self.buffer.map(self.map_flags)
+            if not ok:
+                self.map_flags = None
+                return None
+            self._map_info = info
+            data = np.frombuffer(info.data, dtype=np.uint8)
+            stride = len(data) // self.height
+            row_bytes = self.width * self.channels
+            if stride < row_bytes:
+                self.release()
+                self.map_flags = None
+                return None
+            rows = data[:stride * self.height].reshape(self.height, stride)
+            self._view = rows[:, :row_bytes].reshape(self.height, self.width, self.channels)
+            if self.stats is not None:
+                self.stats.mapped += 1
+        return self._view
+
+    def release(self):
+        if self._map_info is not None:
+            self._view = None
+            self.buffer.unmap(self._map_info)
+            self._map_info = None
+
+    # The whole frame: the mapped view when possible, otherwise a copy
+    def full(self):
+        if self._frame is not None:
+            return self._frame
+        view = self.view()
+        return view if view is not None else self.copy()
+
+    # The whole frame copied out of the buffer, once
+    def copy(self):
+        if self._frame is None:
+            self._frame = self.extract(self.buffer, self.format, self.width, self.height)
+            if self._frame is not None and self.stats is not None:
+                self.stats.full_frames += 1
+                self.stats.bytes_copied += self._frame.nbytes
+        return self._frame
+
+    # Raw rows [top, bottom) at full width: a slice of the mapped view, otherwise copied straight
+    # from the buffer. The stride is taken from the buffer size so padded rows are handled.
+    def rows(self, top, bottom):
+        view = self.view()
+        if view is not None:
+            return view[top:bottom]
+        if not self.banded:
+            frame = self.full()
+            return frame[top:bottom] if frame is not None else None
+        stride = self.buffer.get_size() // self.height
+        row_bytes = self.width * self.channels
+        data = self.buffer.extract_dup(top * stride, (bottom - top) * stride)
+        if stride < row_bytes or len(data) < (bottom - top) * stride:
+            self.channels = None
+            return self.rows(top, bottom)
+        if self.stats is not None:
+            self.stats.bands += 1
+            self.stats.bytes_copied += len(data)
+        band = np.frombuffer(data, dtype=np.uint8).reshape(bottom - top, stride)
+        return band[:, :row_bytes].reshape(bottom - top, self.width, self.channels)
+
+class FrameRing:
+    # Preallocated output frames reused round-robin. Whatever set_frame() handed a slot to (the
+    # display queue, the preview encoder) can read it until `count` newer frames were rendered.
+    def __init__(self, count=6):
+        self.count = count
+        self._slots = {}  # shape -> list of arrays
+        self._next = 0
+
+    def next(self, shape):
+        slots = self._slots.get(shape)
+        if slots is None:
+            slots = self._slots[shape] = [np.empty(shape, dtype=np.uint8) for _ in range(self.count)]
+        self._next = (self._next + 1) % self.count
+        return slots[self._next]
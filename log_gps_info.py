@@ -1,6 +1,6 @@
 # log_gps_info.py
+# pyserial is imported when a port is first opened, so the parsers here can be imported cheaply
 
-import serial
 import time
 import csv
 import glob
@@ -21,16 +21,26 @@ def nmea_to_decimal(coord, direction):
         decimal *= -1
     return decimal
 
-def find_port():
+# Sends an AT command and reads the reply until OK/ERROR or the timeout, instead of sleeping
+def at_command(ser, command, timeout=1.0):
+    ser.write(command)
+    response = b""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response += ser.read(ser.in_waiting or 1)
+        if b"OK" in response or b"ERROR" in response:
+            break
+    return response.decode(errors='ignore')
+
+def find_port(baudrate=115200):
+    import serial
+
     for port in glob.glob("/dev/ttyUSB*"):
         try:
-            ser = serial.Serial(port, baudrate=115200, timeout=1)
-            ser.write(b'AT\r')
-            time.sleep(1)
-            ser.flushInput()
-            ser.write(b'AT+CGPSINFO\r')
-            time.sleep(1)
-            response = ser.read(ser.in_waiting).decode(errors='ignore')
+            ser = serial.Serial(port, baudrate=baudrate, timeout=0.1)
+            at_command(ser, b'AT\r')
+            ser.reset_input_buffer()
+            response = at_command(ser, b'AT+CGPSINFO\r')
             ser.close()
             if "+CGPSINFO:" in response or "OK" in response:
                 print(f"Found GPS on port {port}")
@@ -40,25 +50,62 @@ def find_port():
             continue
     raise RuntimeError("No port found for GPS")
 
-port = find_port()
-ser = serial.Serial(port, baudrate=115200, timeout=1)
-time.sleep(2)
+# Port streaming NMEA sentences on its own (the modem's NMEA port), found by listening
+def find_nmea_port(baudrate=115200, listen_s=1.5, exclude=()):
+    import serial
+    from nmea import NMEAStreamParser
 
-def get_gps_coordinates():
+    for port in glob.glob("/dev/ttyUSB*"):
+        if port in exclude:
+            continue
+        try:
+            with serial.Serial(port, baudrate=baudrate, timeout=0.1) as probe:
+                parser = NMEAStreamParser()
+                deadline = time.monotonic() + listen_s
+                while time.monotonic() < deadline and not parser.sentences:
+                    parser.feed(probe.read(probe.in_waiting or 1))
+            if parser.sentences:
+                print(f"Found NMEA stream on port {port}")
+                return port
+        except Exception as e:
+            print(f"port {port} not ready: {e}")
+    raise RuntimeError("No port found streaming NMEA")
+
+# The modem port is opened on first use so importing this module never touches the serial bus.
+# A known port skips the probe.
+ser = None
+
+def get_serial(port=None, baudrate=115200):
+    global ser
+    if ser is None or not ser.is_open:
+        import serial
+
+        port = port or find_port(baudrate)
+        ser = serial.Serial(port, baudrate=baudrate, timeout=1)
+        time.sleep(2)
+    return ser
+
+# Parses the lines of an AT+CGPSINFO response into (lat, lon, alt)
+def parse_cgpsinfo(lines):
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode(errors='ignore')
+        if '+CGPSINFO: ' in line:
+            parts = line.strip().split(":")[1].split(",")
+            if len(parts) >= 7 and parts[0].strip() != '':
+                lat = nmea_to_decimal(parts[0].strip(), parts[1])
+                lon = nmea_to_decimal(parts[2], parts[3])
+                alt = parts[6]
+                return lat, lon, alt
+    return None, None, None
+
+def get_gps_coordinates(port=None):
     try:
-        ser.write(b'AT+CGPS=1,1\r')
-        ser.write(b'AT+CGPSINFO\r')
+        port = port or get_serial()
+        port.write(b'AT+CGPS=1,1\r')
+        port.write(b'AT+CGPSINFO\r')
         time.sleep(1)
-        response = ser.readlines()
-        
-        for line in response:
-            if b'+CGPSINFO: ' in line:
-                parts = line.decode().strip().split(":")[1].split(",")
-                if len(parts) >= 7 and parts[0] != '':
-                    lat = nmea_to_decimal(parts[0], parts[1])
-                    lon = nmea_to_decimal(parts[2], parts[3])
-                    alt = parts[6]
-                    return lat, lon, alt
+        return parse_cgpsinfo(port.readlines())
 
     except Exception as e:
         print(f"[GPS ERROR] {e}")
@@ -84,6 +131,6 @@ if __name__ == '__main__':
                 time.sleep(3)
         except KeyboardInterrupt:
             print("Stopped.")
-            ser.close()
+            get_serial().close()
 
             
@@ -0,0 +1,48 @@
+# multi_source.py
+# Detection pipeline for several sources sharing one Hailo-8. hailoroundrobin interleaves the
+# sources' frames into a single inference + tracker + callback chain and tags every buffer with
+# the sink pad it came in on ("sink_0", "sink_1", ...), which the callback reads back with
+# roi.get_stream_id() to pick the stream's context. hailostreamrouter then splits the frames by
+# that id again, one display (or fakesink) branch per source.
+
+from hailo_apps_infra.detection_pipeline import GStreamerDetectionApp
+from hailo_apps_infra.gstreamer_helper_pipelines import (
+    DISPLAY_PIPELINE,
+    INFERENCE_PIPELINE,
+    INFERENCE_PIPELINE_WRAPPER,
+    QUEUE,
+    SOURCE_PIPELINE,
+    TRACKER_PIPELINE,
+    USER_CALLBACK_PIPELINE,
+)
+
+class MultiSourceDetectionApp(GStreamerDetectionApp):
+    # streams are the config's stream entries, in hailoroundrobin pad order; the hailo app's own
+    # options (HEF, thresholds, --use-frame, --disable-sync ...) apply to all of them
+    def __init__(self, app_callback, user_data, streams, display=False):
+        self.streams = streams
+        self.display = display
+        super().__init__(app_callback, user_data)
+
+    def get_pipeline_string(self):
+        detection = INFERENCE_PIPELINE(
+            hef_path=self.hef_path,
+            post_process_so=self.post_process_so,
+            post_function_name=self.post_function_name,
+            batch_size=self.batch_size,
+            config_json=self.labels_json,
+            additional_params=self.thresholds_str)
+        routes = " ".join(f'src_{i}::input-streams="<sink_{i}>"' for i in range(len(self.streams)))
+        pipeline = (f"hailoroundrobin mode=1 name=robin ! {INFERENCE_PIPELINE_WRAPPER(detection)} ! "
+                    f"{TRACKER_PIPELINE(class_id=1)} ! {USER_CALLBACK_PIPELINE()} ! "
+                    f"hailostreamrouter name=router {routes} ")
+        for i, stream in enumerate(self.streams):
+            source = SOURCE_PIPELINE(stream["source"], self.video_width, self.video_height, name=f"source_{i}")
+            pipeline += f"{source} ! robin.sink_{i} "
+            if self.display:
+                sink = DISPLAY_PIPELINE(video_sink=self.video_sink, sync=self.sync, show_fps=self.show_fps,
+                                        name=f"hailo_display_{i}")
+            else:
+                sink = f"{QUEUE(name=f'sink_queue_{i}')} ! fakesink sync={self.sync}"
+            pipeline += f"router.src_{i} ! {sink} "
+        return pipeline
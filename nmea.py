@@ -0,0 +1,186 @@
+# nmea.py
+# NMEA 0183 sentence parsing for the GPS receiver ($GPRMC / $GPGGA / $GPVTG and their GN/GL
+# variants). parse_sentence() handles one line; NMEAStreamParser parses a raw byte stream as it
+# arrives from the receiver's NMEA port, and EpochAssembler merges the sentences of one fix epoch
+# into a single fix with position, altitude, speed and heading.
+
+from collections import namedtuple
+
+from log_gps_info import nmea_to_decimal
+
+# utc is "hhmmss.ss" as sent by the receiver, date "ddmmyy" (RMC only)
+NMEAFix = namedtuple("NMEAFix", ["kind", "utc", "date", "lat", "lon", "alt", "speed_mps", "heading_deg"])
+
+KNOTS_TO_MPS = 0.514444
+
+def checksum_ok(sentence):
+    if not sentence.startswith('$') or '*' not in sentence:
+        return False
+    body, _, checksum = sentence[1:].partition('*')
+    value = 0
+    for byte in body.encode('ascii', 'replace'):
+        value ^= byte
+    try:
+        return value == int(checksum[:2], 16)
+    except ValueError:
+        return False
+
+def _float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+# Returns an NMEAFix for a valid RMC/GGA sentence with a position or a VTG sentence with a
+# speed, otherwise None
+def parse_sentence(sentence):
+    sentence = sentence.strip()
+    if not checksum_ok(sentence):
+        return None
+    return parse_fields(sentence[1:sentence.index('*')].split(','))
+
+# Same, for the comma-separated fields between '$' and '*' of a checksummed sentence
+def parse_fields(fields):
+    kind = fields[0][2:]
+    try:
+        if kind == "RMC" and len(fields) >= 10:
+            if fields[2] != 'A' or not fields[3]:
+                return None
+            speed = _float(fields[7])
+            return NMEAFix("RMC", fields[1], fields[9],
+                           nmea_to_decimal(fields[3], fields[4]), nmea_to_decimal(fields[5], fields[6]), None,
+                           speed * KNOTS_TO_MPS if speed is not None else None, _float(fields[8]))
+        if kind == "GGA" and len(fields) >= 10:
+            if fields[6] in ('', '0') or not fields[2]:
+                return None
+            return NMEAFix("GGA", fields[1], None,
+                           nmea_to_decimal(fields[2], fields[3]), nmea_to_decimal(fields[4], fields[5]),
+                           _float(fields[9]), None, None)
+        if kind == "VTG" and len(fields) >= 9:
+            # Mode indicator N = data not valid (NMEA 2.3+)
+            if len(fields) >= 10 and fields[9] == 'N':
+                return None
+            kmh = _float(fields[7])
+            knots = _float(fields[5])
+            if kmh is not None:
+                speed = kmh / 3.6
+            elif knots is not None:
+                speed = knots * KNOTS_TO_MPS
+            else:
+                return None
+            return NMEAFix("VTG", None, None, None, None, None, speed, _float(fields[1]))
+    except ValueError:
+        return None
+    return None
+
+# -----------------------------------
+# Streaming
+# -----------------------------------
+# NMEA limits a sentence to 82 characters; a longer run without a line end is noise
+MAX_SENTENCE = 128
+
+class NMEAStreamParser:
+    # Incremental parser for the receiver's byte stream: feed() whatever the port returned and get
+    # back the fixes of the sentences it completed. A partial sentence waits for the rest of its
+    # line. Bytes outside sentences and sentences with a bad checksum are counted and skipped.
+    def __init__(self):
+        self._buffer = bytearray()
+        self.sentences = 0
+        self.checksum_errors = 0
+        self.discarded_bytes = 0
+
+    def feed(self, data):
+        buffer = self._buffer
+        buffer += data
+        fixes = []
+        start = 0
+        while True:
+            end = buffer.find(b'\n', start)
+            if end < 0:
+                break
+            line = bytes(buffer[start:end])
+            start = end + 1
+            fix = self._parse_line(line)
+            if fix is not None:
+                fixes.append(fix)
+        del buffer[:start]
+        if len(buffer) > MAX_SENTENCE:
+            # No line end in sight: keep only what could still be the start of a sentence
+            dollar = buffer.rfind(b'$')
+            drop = dollar if dollar > 0 and len(buffer) - dollar <= MAX_SENTENCE else len(buffer)
+            self.discarded_bytes += drop
+            del buffer[:drop]
+        return fixes
+
+    def _parse_line(self, line):
+        dollar = line.find(b'$')
+        if dollar < 0:
+            self.discarded_bytes += len(line) + 1
+            return None
+        if dollar:
+            self.discarded_bytes += dollar
+        star = line.find(b'*', dollar)
+        if star < 0 or len(line) < star + 3:
+            self.checksum_errors += 1
+            return None
+        body = line[dollar + 1:star]
+        value = 0
+        for byte in body:
+            value ^= byte
+        try:
+            ok = value == int(line[star + 1:star + 3], 16)
+        except ValueError:
+            ok = False
+        if not ok:
+            self.checksum_errors += 1
+            return None
+        self.sentences += 1
+        return parse_fields(body.decode('ascii', 'replace').split(','))
+
+    def stats(self):
+        return {"sentences": self.sentences, "checksum_errors": self.checksum_errors,
+                "discarded_bytes": self.discarded_bytes}
+
+class EpochAssembler:
+    # The receiver sends RMC, GGA and usually VTG for every fix epoch; RMC and GGA carry the epoch's
+    # UTC time, VTG doesn't and belongs to the epoch in progress. add() returns (t, merged fix) as
+    # soon as the epoch has a position, an altitude and a speed, or when the next epoch starts;
+    # t is the time passed with the epoch's first sentence.
+    def __init__(self):
+        self._epoch = None  # [utc, date, lat, lon, alt, speed, heading, emitted, t]
+
+    def add(self, fix, t=None):
+        epoch = self._epoch
+        done = None
+        if fix.utc is not None and (epoch is None or fix.utc != epoch[0]):
+            if epoch is not None and not epoch[7] and epoch[2] is not None:
+                done = self._merged(epoch)
+            epoch = self._epoch = [fix.utc, None, None, None, None, None, None, False, t]
+        elif epoch is None:
+            return None
+        if fix.date:
+            epoch[1] = fix.date
+        if fix.lat is not None:
+            epoch[2], epoch[3] = fix.lat, fix.lon
+        if fix.alt is not None:
+            epoch[4] = fix.alt
+        if fix.speed_mps is not None:
+            epoch[5] = fix.speed_mps
+        if fix.heading_deg is not None:
+            epoch[6] = fix.heading_deg
+        if done is None and not epoch[7] and epoch[2] is not None and epoch[4] is not None and epoch[5] is not None:
+            epoch[7] = True
+            done = self._merged(epoch)
+        return done
+
+    # The last epoch, if it had a position and hasn't been returned yet
+    def flush(self):
+        epoch, self._epoch = self._epoch, None
+        if epoch is not None and not epoch[7] and epoch[2] is not None:
+            return self._merged(epoch)
+        return None
+
+    @staticmethod
+    def _merged(epoch):
+        utc, date, lat, lon, alt, speed, heading, _, t = epoch
+        return t, NMEAFix("EPOCH", utc, date, lat, lon, alt, speed, heading)
@@ -0,0 +1,113 @@
+# nmea_benchmark.py
+# Streaming NMEA ingestion against AT+CGPSINFO polling:
+#   parser     - sentences/s of parse_sentence() over a recorded log read line by line, against
+#                NMEAStreamParser fed the same bytes in serial-sized and large chunks
+#   fix rate   - fixes/s reaching the GPS service from the fake NMEA device on a pseudo-terminal
+#                at 10 Hz, against polling the fake AT modem, and how far position_at() lands
+#                from where the fake vehicle really is
+#
+#   python3 nmea_benchmark.py                # generated 30 min recording
+#   python3 nmea_benchmark.py drive.nmea     # a recorded log
+
+import math
+import statistics
+import sys
+import time
+
+from fake_gps import EARTH_RADIUS_M, FakeATModem, FakeNMEADevice, FakeTrack, nmea_sentences
+from gps_service import ATPollSource, GPSService, NMEAStreamSource
+from nmea import EpochAssembler, NMEAStreamParser, parse_sentence
+
+RECORDING_EPOCHS = 18000  # 30 min at 10 Hz
+CHUNKS = (64, 4096)
+DURATION_S = 5.0
+SAMPLES = 200
+
+def generated_recording(track, epochs, rate_hz=10.0):
+    return b"".join(s for i in range(epochs) for s in nmea_sentences(track, track.t0 + i / rate_hz))
+
+def parse_lines(data):
+    fixes = 0
+    for line in data.decode(errors="replace").splitlines():
+        if parse_sentence(line) is not None:
+            fixes += 1
+    return fixes
+
+def parse_stream(data, chunk):
+    parser = NMEAStreamParser()
+    assembler = EpochAssembler()
+    epochs = 0
+    for start in range(0, len(data), chunk):
+        for fix in parser.feed(data[start:start + chunk]):
+            if assembler.add(fix) is not None:
+                epochs += 1
+    return parser, epochs
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def error_m(track, position, t):
+    lat, lon, _ = position
+    if lat is None:
+        return None
+    true_lat, true_lon, _ = track.position(t)
+    north = math.radians(lat - true_lat) * EARTH_RADIUS_M
+    east = math.radians(lon - true_lon) * EARTH_RADIUS_M * math.cos(math.radians(true_lat))
+    return math.hypot(north, east)
+
+def run_service(source, track, poll_interval):
+    gps = GPSService(source, poll_interval=poll_interval).start()
+    while gps.latest() is None:
+        time.sleep(0.01)
+    start_fixes = gps.fix_count
+    start = time.monotonic()
+    errors = []
+    while time.monotonic() - start < DURATION_S:
+        now = time.monotonic()
+        error = error_m(track, gps.position_at(now), now)
+        if error is not None:
+            errors.append(error)
+        time.sleep(DURATION_S / SAMPLES)
+    rate = (gps.fix_count - start_fixes) / (time.monotonic() - start)
+    gps.stop()
+    return rate, errors
+
+def report(name, rate, errors):
+    errors = sorted(errors)
+    p95 = errors[min(len(errors) - 1, int(len(errors) * 0.95))]
+    print(f"{name:<28} | {rate:>7.1f} | {statistics.mean(errors):>12.2f} | {p95:>11.2f}")
+
+if __name__ == "__main__":
+    import serial
+
+    track = FakeTrack()
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as f:
+            data = f.read()
+        label = sys.argv[1]
+    else:
+        data = generated_recording(track, RECORDING_EPOCHS)
+        label = f"generated, {RECORDING_EPOCHS} epochs"
+
+    print(f"--- NMEA parser, {label} ({len(data) / 1e6:.1f} MB) ---")
+    print(f"{'parser':<28} | {'sentences/s':>11} | {'MB/s':>6} | fixes")
+    fixes, seconds = timed(parse_lines, data)
+    lines = data.count(b"\n")
+    print(f"{'parse_sentence per line':<28} | {lines / seconds:>11.0f} | {len(data) / 1e6 / seconds:>6.1f} | {fixes} sentences")
+    for chunk in CHUNKS:
+        (parser, epochs), seconds = timed(parse_stream, data, chunk)
+        print(f"{f'stream, {chunk} B reads':<28} | {parser.sentences / seconds:>11.0f} | "
+              f"{len(data) / 1e6 / seconds:>6.1f} | {epochs} epochs, {parser.checksum_errors} bad checksums")
+
+    print(f"\n--- Fixes reaching the GPS service, vehicle at {track.speed_mps:.0f} m/s, {DURATION_S:.0f} s each ---")
+    print(f"{'source':<28} | {'fixes/s':>7} | {'mean error m':>12} | {'p95 error m':>11}")
+    for delay, interval in ((0.1, 0.2), (0.1, 0.0)):
+        rate, errors = run_service(ATPollSource(FakeATModem(track, response_delay=delay)), track, interval)
+        report(f"AT poll {interval * 1000:.0f} ms, {delay * 1000:.0f} ms reply", rate, errors)
+    for rate_hz in (5.0, 10.0):
+        with FakeNMEADevice(track, rate_hz=rate_hz) as device:
+            source = NMEAStreamSource(ser=serial.Serial(device.port, timeout=0.2))
+            rate, errors = run_service(source, track, 0.2)
+        report(f"NMEA stream {rate_hz:.0f} Hz", rate, errors)
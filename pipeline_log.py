@@ -0,0 +1,190 @@
+# pipeline_log.py
+# Logging for the detection pipeline, built on the standard logging module. Records pass a
+# rate limiter that lets each message template through at most once per interval and reports how
+# many repeats it swallowed, then land in an in-memory ring buffer that a background thread
+# formats and writes out. The callback therefore never blocks on stdout/journald, and a burst
+# that outruns the flusher drops the oldest records instead of stalling frames. Sending SIGUSR1
+# (or calling toggle_debug()) switches DEBUG on and off at runtime, which also lifts the rate
+# limit for full verbosity.
+
+import json
+import logging
+import signal
+import sys
+import threading
+from collections import deque
+
+LOGGER_NAME = "pothole"
+DEFAULT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_handler = None
+_rate_limit = None
+_base_level = logging.INFO
+
+# -----------------------------------
+# Rate limiting and deduplication
+# -----------------------------------
+class RateLimitFilter(logging.Filter):
+    # Keyed on logger, level and the unformatted message, so "No GPS fix at %s" is one message
+    # whatever its arguments. A record can pick its own interval with extra={"interval": s};
+    # interval 0 disables the limit for it.
+    def __init__(self, interval=5.0):
+        super().__init__()
+        self.interval = interval
+        self.bypass = False
+        self._seen = {}  # key -> [last emitted, suppressed since]
+        self._lock = threading.Lock()
+        self.suppressed_total = 0
+
+    def filter(self, record):
+        record.suppressed = 0
+        if self.bypass:
+            return True
+        interval = getattr(record, "interval", self.interval)
+        if not interval:
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = record.created
+        with self._lock:
+            state = self._seen.get(key)
+            if state is None:
+                self._seen[key] = [now, 0]
+                return True
+            if now - state[0] < interval:
+                state[1] += 1
+                self.suppressed_total += 1
+                return False
+            record.suppressed = state[1]
+            state[0] = now
+            state[1] = 0
+        return True
+
+# -----------------------------------
+# Ring buffer with asynchronous flush
+# -----------------------------------
+class RingBufferHandler(logging.Handler):
+    # emit() only appends the record; formatting and writing happen on the flusher thread
+    def __init__(self, target, capacity=4096, flush_interval=0.5):
+        super().__init__()
+        self.target = target
+        self.flush_interval = flush_interval
+        self.buffer = deque(maxlen=capacity)
+        self.dropped = 0
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="log-flusher", daemon=True)
+        self._thread.start()
+
+    # Unlike Handler.handle() this takes no lock, so a frame never waits on a flush in progress;
+    # deque appends are thread-safe on their own
+    def handle(self, record):
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record):
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append(record)
+        # Errors are written out promptly
+        if record.levelno >= logging.ERROR:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            dropped, self.dropped = self.dropped, 0
+            if dropped:
+                self.target.handle(logging.makeLogRecord({
+                    "name": LOGGER_NAME, "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": "%d log records dropped, the log ring buffer was full", "args": (dropped,)}))
+            while self.buffer:
+                try:
+                    record = self.buffer.popleft()
+                except IndexError:
+                    break
+                self.target.handle(record)
+            self.target.flush()
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=2.0)
+        self.flush()
+        super().close()
+
+class PipelineFormatter(logging.Formatter):
+    def format(self, record):
+        text = super().format(record)
+        if getattr(record, "suppressed", 0):
+            text += f" (+{record.suppressed} similar suppressed)"
+        return text
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line; extra={"fields": {...}} adds structured fields
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+# -----------------------------------
+# Setup
+# -----------------------------------
+def set_debug(enabled):
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(logging.DEBUG if enabled else _base_level)
+    if _rate_limit is not None:
+        _rate_limit.bypass = enabled
+    logger.warning("Debug logging %s", "enabled" if enabled else "disabled", extra={"interval": 0})
+
+def toggle_debug(*_):
+    set_debug(not logging.getLogger(LOGGER_NAME).isEnabledFor(logging.DEBUG))
+
+# Configures the "pothole" logger tree (pothole, pothole.gps, ...) and returns its ring handler
+def setup_logging(level=logging.INFO, stream=None, json_lines=False, rate_limit_s=5.0,
+                  capacity=4096, flush_interval=0.5, debug_signal=True):
+    global _handler, _rate_limit, _base_level
+    shutdown_logging()
+
+    target = logging.StreamHandler(stream or sys.stdout)
+    target.setFormatter(JsonFormatter() if json_lines else PipelineFormatter(DEFAULT_FORMAT))
+    _handler = RingBufferHandler(target, capacity=capacity, flush_interval=flush_interval)
+    _rate_limit = RateLimitFilter(rate_limit_s)
+    _handler.addFilter(_rate_limit)
+    _base_level = level if level > logging.DEBUG else logging.INFO
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.handlers[:] = [_handler]
+    logger.propagate = False
+    logger.setLevel(level)
+    _rate_limit.bypass = level <= logging.DEBUG
+
+    if debug_signal and hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, toggle_debug)
+    return _handler
+
+def shutdown_logging():
+    global _handler
+    if _handler is not None:
+        logging.getLogger(LOGGER_NAME).removeHandler(_handler)
+        _handler.close()
+        _handler = None
+
+def suppressed_count():
+    return _rate_limit.suppressed_total if _rate_limit is not None else 0
@@ -0,0 +1,84 @@
+# postprocess_benchmark.py
+# Crop scoring inline on the callback thread against the shared-memory worker pool with 1-4
+# workers, on synthetic frames where every detection needs its crop undistorted and scored (the
+# worst case: every detection a new best frame). Reports what the callback thread pays per frame,
+# how much of it is backpressure (waiting for a free slot), and the end-to-end rate until the
+# last crop is back. The pool can only beat inline scoring with
+# free cores: run it on the Pi 5, os.cpu_count() is printed with the results.
+#
+#   python3 postprocess_benchmark.py [--size 1280x720] [--detections 6] [--frames 300]
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from postprocess_pool import PostProcessPool
+from stream_context import Calibration
+from track_aggregator import sharpness
+from undistortion import DEFAULT_CALIBRATION
+
+CROP = (160, 120)
+
+def synthetic(size, detections, count):
+    width, height = size
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(4)]
+    boxes = []
+    for _ in range(count):
+        xs = rng.integers(0, width - CROP[0], detections)
+        ys = rng.integers(height // 2, height - CROP[1], detections)
+        boxes.append([(int(x), int(y)) + CROP for x, y in zip(xs, ys)])
+    return frames, boxes
+
+def run_inline(calibration, frames, boxes):
+    undistorter = calibration.undistorter
+    callback_s = 0.0
+    start = time.perf_counter()
+    for i, frame_boxes in enumerate(boxes):
+        t = time.perf_counter()
+        frame = frames[i % len(frames)]
+        for box in frame_boxes:
+            sharpness(undistorter.undistort_crop(frame, *box))
+        callback_s += time.perf_counter() - t
+    return callback_s, 0.0, time.perf_counter() - start, 0
+
+def run_pool(calibration, frames, boxes, workers):
+    pool = PostProcessPool(workers, backpressure="block", wait_s=0.05)
+    returned = 0
+    callback_s = 0.0
+    start = time.perf_counter()
+    for i, frame_boxes in enumerate(boxes):
+        t = time.perf_counter()
+        returned += len(pool.results())
+        pool.submit(frames[i % len(frames)], [(None, box) for box in frame_boxes], calibration)
+        callback_s += time.perf_counter() - t
+    pool.wait(timeout_s=60)
+    returned += len(pool.results())
+    elapsed = time.perf_counter() - start
+    dropped = pool.frames_dropped
+    waited_s = pool.wait_s_total
+    pool.close()
+    return callback_s, waited_s, elapsed, dropped
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crop scoring inline vs the worker pool")
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--detections", type=int, default=6)
+    parser.add_argument("--frames", type=int, default=300)
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+
+    calibration = Calibration.from_file(DEFAULT_CALIBRATION)
+    calibration.undistorter.maps(*size)  # built once up front, as after the first frame
+    frames, boxes = synthetic(size, args.detections, args.frames)
+
+    print(f"--- Crop scoring, {args.frames} frames {size[0]}x{size[1]}, {args.detections} "
+          f"{CROP[0]}x{CROP[1]} crops each, {os.cpu_count()} CPUs ---")
+    print(f"{'mode':<12} | {'callback ms/frame':>17} | {'waiting ms':>10} | {'frames/s':>8} | {'dropped':>7}")
+    for label, run in [("inline", lambda: run_inline(calibration, frames, boxes))] + \
+            [(f"pool {n}", lambda n=n: run_pool(calibration, frames, boxes, n)) for n in range(1, 5)]:
+        callback_s, waited_s, elapsed, dropped = run()
+        print(f"{label:<12} | {callback_s / args.frames * 1000:>17.3f} | {waited_s / args.frames * 1000:>10.3f} | "
+              f"{args.frames / elapsed:>8.1f} | {dropped:>7}")
@@ -0,0 +1,188 @@
+# postprocess_pool.py
+# Optional post-processing tier in worker processes, so crop undistortion and sharpness scoring
+# run on the Pi's other cores instead of under the GIL on the GStreamer streaming thread. For a
+# frame with crops to score the callback only copies the raw frame into a free slot of a
+# multiprocessing.shared_memory ring and queues the boxes; a worker remaps and scores the crops
+# from the slot and sends them back with the slot number on a completion queue, which the
+# callback drains without blocking at the top of every frame.
+#
+# When every slot is in use the callback waits up to wait_s for a completion ("block", which
+# pushes back on the pipeline's queues) or gives up on the frame's crops at once ("drop"); dropped
+# crops are counted and their tracks keep their earlier best frame.
+
+import contextlib
+import itertools
+import logging
+import multiprocessing as mp
+import queue
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+log = logging.getLogger("pothole.postprocess")
+
+def _worker(tasks, done):
+    import cv2
+
+    from track_aggregator import sharpness
+    from undistortion import Undistorter
+
+    cv2.setNumThreads(1)
+    shm = None
+    undistorters = {}
+    done.put((None, []))  # ready
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        shm_name, slot_bytes, slot, shape, calibration_key, K, dist, jobs = task
+        if shm is None or shm.name != shm_name:
+            if shm is not None:
+                shm.close()
+            shm = shared_memory.SharedMemory(name=shm_name)
+        undistorter = undistorters.get(calibration_key)
+        if undistorter is None:
+            undistorter = undistorters[calibration_key] = Undistorter(K, dist)
+        frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+        results = []
+        for job_id, (x, y, w, h) in jobs:
+            try:
+                crop = undistorter.undistort_crop(frame, x, y, w, h)
+            except Exception:
+                crop = None
+            results.append((job_id, sharpness(crop), crop))
+        del frame
+        done.put((slot, results))
+    if shm is not None:
+        shm.close()
+
+# A spawned process first re-imports the parent's __main__ (as __mp_main__). For the detector that
+# is pothole_detection.py with hailo, GStreamer and every subsystem behind it, none of which a
+# worker uses; while the workers start, this module stands in as __main__ so that is all they
+# import.
+@contextlib.contextmanager
+def _worker_main():
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = sys.modules[__name__]
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+class PostProcessPool:
+    def __init__(self, workers=3, slots=None, backpressure="block", wait_s=0.05):
+        context = mp.get_context("spawn")  # no fork of a process running GStreamer threads
+        self.tasks = context.Queue()
+        self.done = context.Queue()
+        self.slots = slots or 2 * workers
+        self.backpressure = backpressure
+        self.wait_s = wait_s
+        self._free = list(range(self.slots))
+        self._shm = None
+        self._slot_bytes = 0
+        self._contexts = {}  # job id -> caller's context, returned with the result
+        self._job_ids = itertools.count()
+        self._ready = []
+        self.frames_submitted = 0
+        self.frames_dropped = 0
+        self.frames_oversize = 0
+        self.crops_done = 0
+        self.wait_s_total = 0.0
+        self.workers = [context.Process(target=_worker, args=(self.tasks, self.done),
+                                        name=f"postprocess-{i}", daemon=True) for i in range(workers)]
+        with _worker_main():
+            for worker in self.workers:
+                worker.start()
+        # Workers import OpenCV first; frames submitted before they are up would only queue
+        for _ in self.workers:
+            self.done.get(timeout=60)
+
+    @property
+    def in_flight(self):
+        return self.slots - len(self._free)
+
+    # items are (context, (x, y, w, h)) boxes on the raw frame; each comes back from results() as
+    # (context, sharpness, crop). False when the frame was dropped: nothing will come back.
+    def submit(self, frame, items, calibration):
+        if self._shm is None:
+            self._slot_bytes = frame.nbytes
+            self._shm = shared_memory.SharedMemory(create=True, size=self._slot_bytes * self.slots)
+        if frame.nbytes > self._slot_bytes:
+            self.frames_oversize += 1
+            return False
+        slot = self._acquire()
+        if slot is None:
+            self.frames_dropped += 1
+            return False
+        view = np.ndarray(frame.shape, dtype=np.uint8, buffer=self._shm.buf, offset=slot * self._slot_bytes)
+        np.copyto(view, frame)
+        del view
+        jobs = []
+        for context, box in items:
+            job_id = next(self._job_ids)
+            self._contexts[job_id] = context
+            jobs.append((job_id, box))
+        self.tasks.put((self._shm.name, self._slot_bytes, slot, frame.shape, id(calibration),
+                        calibration.K, calibration.dist, jobs))
+        self.frames_submitted += 1
+        return True
+
+    def _acquire(self):
+        if not self._free:
+            self._drain(block=False)
+        if not self._free and self.backpressure == "block":
+            start = time.perf_counter()
+            self._drain(block=True)
+            self.wait_s_total += time.perf_counter() - start
+        return self._free.pop() if self._free else None
+
+    def _drain(self, block):
+        timeout = self.wait_s
+        while True:
+            try:
+                slot, results = self.done.get(timeout=timeout) if block else self.done.get_nowait()
+            except queue.Empty:
+                return
+            self._free.append(slot)
+            for job_id, crop_sharpness, crop in results:
+                self._ready.append((self._contexts.pop(job_id), crop_sharpness, crop))
+            self.crops_done += len(results)
+            block = False
+
+    # Completed crops since the last call, without waiting
+    def results(self):
+        self._drain(block=False)
+        ready, self._ready = self._ready, []
+        return ready
+
+    # Waits for the crops still in the workers (at shutdown); results() then has them all
+    def wait(self, timeout_s=5.0):
+        deadline = time.monotonic() + timeout_s
+        while self.in_flight and time.monotonic() < deadline:
+            self._drain(block=True)
+
+    def stats(self):
+        return {
+            "workers": len(self.workers),
+            "slots": self.slots,
+            "in_flight": self.in_flight,
+            "frames_submitted": self.frames_submitted,
+            "frames_dropped": self.frames_dropped,
+            "frames_oversize": self.frames_oversize,
+            "crops_done": self.crops_done,
+            "backpressure_wait_s": self.wait_s_total,
+        }
+
+    def close(self):
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join(timeout=5.0)
+            if worker.is_alive():
+                worker.terminate()
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
@@ -1,10 +1,40 @@
-from flask import Flask, render_template
-import socket, csv, os
+from flask import Flask, Response, abort, jsonify, render_template, request, send_file, url_for
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+import socket, os, sys, threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from pothole_index import PotholeIndex
+from cluster_pyramid import ClusterPyramid
+from thumbnail_cache import ThumbnailCache, digest
+from detection_store import DetectionStore
+from log_merge import merge_csv
+from startup import load_config
 
 app = Flask(__name__)
 CSV_PATH = os.path.abspath(
     os.path.join(os.path.dirname(__file__), "..", "..", "pothole_log.csv")
 )
+# The detector's store, from the same config it reads (pothole_detection.json or $POTHOLE_CONFIG)
+STORE_PATH = load_config()["db_path"]
+MAX_PAGE_SIZE = 1000
+THUMB_CACHE_DIR = os.path.join(os.path.dirname(STORE_PATH), "thumbs")
+# Images are revalidated with their ETag after a day; a record's crop never changes
+IMAGE_MAX_AGE_S = 86400
+
+# Built on first use, then refreshed incrementally as the detector appends records
+index = PotholeIndex(STORE_PATH, CSV_PATH)
+# Cluster counts per zoom level, fed by the same refreshes
+pyramid = ClusterPyramid()
+# Created on the first thumbnail request
+thumbnails = None
+# One log upload is merged at a time
+merge_lock = threading.Lock()
+UPLOAD_CHUNK_BYTES = 256 * 1024
+
+def refresh():
+    added = index.refresh()
+    if added:
+        pyramid.add_records(added)
 
 def has_internet(host="8.8.8.8", port=53, timeout=1):
     try:
@@ -14,26 +44,193 @@ def has_internet(host="8.8.8.8", port=53, timeout=1):
     except OSError:
         return False
 
+def record_json(record):
+    return {
+        "id": record.id,
+        "latitude": record.latitude,
+        "longitude": record.longitude,
+        "area": record.area,
+        "confidence": record.confidence,
+        "timestamp": record.timestamp,
+        "image_url": url_for("image", record_id=record.id, size="full") if record.image_ref else "",
+        "thumb_url": url_for("image", record_id=record.id, size="thumb") if record.image_ref else "",
+        "clip_url": url_for("clip", record_id=record.id) if record.clip else "",
+    }
+
 @app.route('/')
 def display():
     if not has_internet():
         return render_template('wifi_required.html'), 503
+    return render_template('display.html')
 
+# /api/potholes?bbox=min_lon,min_lat,max_lon,max_lat&limit=100&cursor=<id>&min_area=0.05
+@app.route('/api/potholes')
+def api_potholes():
     try:
-        records = []
-        with open(CSV_PATH, newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                # Only accept rows that have all expected fields and non-empty
-                if all(field in row and row[field].strip() for field in ["latitude", "longitude", "area_m2"]):
-                    records.append({
-                        "latitude": float(row["latitude"]),
-                        "longitude": float(row["longitude"]),
-                        "area": float(row["area_m2"]),
-                        "image_base64": row.get("image_base64", "")  # blank if missing
-                    })
-
-        print("DEBUG RECORDS →", records[:2])  # show first two records only
-        return render_template('display.html', records=records)
+        bbox = request.args.get("bbox")
+        bbox = parse_bbox(bbox) if bbox else None
+        limit = min(max(request.args.get("limit", 100, type=int), 1), MAX_PAGE_SIZE)
+        cursor = request.args.get("cursor", 0, type=int)
+        min_area = request.args.get("min_area", None, type=float)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    try:
+        refresh()
     except Exception as e:
-        return f"<h2>Error reading pothole CSV file: {e}</h2>", 500
+        return jsonify(error=f"Error reading pothole log: {e}"), 500
+    items, next_cursor, total = index.query(bbox, min_area, cursor, limit)
+    return jsonify(items=[record_json(r) for r in items], next_cursor=next_cursor, total=total)
+
+def parse_bbox(value):
+    bbox = tuple(float(v) for v in value.split(","))
+    if len(bbox) != 4:
+        raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    return bbox
+
+# Cluster summaries for one zoom level: /api/clusters?z=12&bbox=min_lon,min_lat,max_lon,max_lat
+@app.route('/api/clusters')
+def api_clusters():
+    try:
+        zoom = request.args.get("z", type=int)
+        if zoom is None or zoom < 0:
+            raise ValueError("z is required")
+        bbox = parse_bbox(request.args.get("bbox", "-180,-85,180,85"))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    try:
+        refresh()
+    except Exception as e:
+        return jsonify(error=f"Error reading pothole log: {e}"), 500
+    return jsonify(zoom=min(zoom, pyramid.max_zoom), max_zoom=pyramid.max_zoom, clusters=pyramid.viewport(zoom, bbox))
+
+# Cluster summaries for one Web Mercator tile
+@app.route('/api/clusters/<int:z>/<int:x>/<int:y>')
+def api_cluster_tile(z, x, y):
+    try:
+        refresh()
+    except Exception as e:
+        return jsonify(error=f"Error reading pothole log: {e}"), 500
+    return jsonify(zoom=min(z, pyramid.max_zoom), max_zoom=pyramid.max_zoom, clusters=pyramid.tile(z, x, y))
+
+# /img/<id>?size=thumb|full, with a strong ETag (hash of the crop) for conditional GETs
+@app.route('/img/<int:record_id>')
+def image(record_id):
+    global thumbnails
+    size = request.args.get("size", "full")
+    if size not in ("thumb", "full"):
+        abort(400)
+    refresh()
+    record = index.get(record_id)
+    jpeg = index.read_image(record) if record is not None else None
+    if jpeg is None:
+        abort(404)
+    key = digest(jpeg)
+    etag = key if size == "full" else f"{key}-t"
+    if request.if_none_match.contains(etag):
+        body = b""
+    elif size == "full":
+        body = jpeg
+    else:
+        if thumbnails is None:
+            thumbnails = ThumbnailCache(THUMB_CACHE_DIR)
+        body = thumbnails.get(key, jpeg)
+        if body is None:
+            abort(404)
+    response = Response(body, mimetype="image/jpeg")
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = IMAGE_MAX_AGE_S
+    return response.make_conditional(request)
+
+@app.route('/crop/<int:record_id>')
+def crop(record_id):
+    return image(record_id)
+
+# Video clip around the detection, written by the detector shortly after the record
+@app.route('/clip/<int:record_id>')
+def clip(record_id):
+    refresh()
+    record = index.get(record_id)
+    if record is None or not record.clip:
+        abort(404)
+    clips_root = os.path.dirname(STORE_PATH)
+    path = os.path.abspath(os.path.join(clips_root, record.clip))
+    if not path.startswith(clips_root + os.sep) or not os.path.exists(path):
+        abort(404)
+    return send_file(path, conditional=True)
+
+# Merges a vehicle's pothole_log.csv into the store while it is still uploading: from upload.html's
+# form (the vehicle field comes before the file), or posted bare with
+#   curl -H "Content-Type: text/csv" --data-binary @log.csv "http://<pi>:5000/upload?vehicle=van2"
+@app.route('/upload', methods=['GET', 'POST'])
+def upload():
+    if request.method == 'GET':
+        return render_template('upload.html')
+    vehicle = request.args.get("vehicle", "").strip()
+    try:
+        if request.mimetype == "multipart/form-data":
+            counts = merge_multipart(vehicle)
+        elif request.mimetype in ("text/csv", "application/octet-stream"):
+            counts = merge_upload(request_chunks(), vehicle or "upload")
+        else:
+            return jsonify(error=f"unsupported content type {request.mimetype}"), 415
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    if request.mimetype == "multipart/form-data" and request.accept_mimetypes.accept_html:
+        return render_template('upload.html', result=counts)
+    return jsonify(counts)
+
+def request_chunks():
+    while True:
+        chunk = request.stream.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            return
+        yield chunk
+
+def merge_upload(chunks, vehicle):
+    with merge_lock:
+        store = DetectionStore(STORE_PATH)
+        try:
+            return dict(merge_csv(chunks, store, vehicle), vehicle=vehicle)
+        finally:
+            store.close()
+
+# Parts of a multipart body as they arrive: Field/File events, each followed by its Data events
+def multipart_events():
+    boundary = request.mimetype_params.get("boundary", "").encode()
+    if not boundary:
+        raise ValueError("multipart upload without a boundary")
+    decoder = MultipartDecoder(boundary)
+    chunks = request_chunks()
+    while True:
+        chunk = next(chunks, None)
+        decoder.receive_data(chunk)  # None: the body ended
+        event = decoder.next_event()
+        while not isinstance(event, (NeedData, Epilogue)):
+            yield event
+            event = decoder.next_event()
+        if isinstance(event, Epilogue) or chunk is None:
+            return
+
+def merge_multipart(vehicle):
+    events = multipart_events()
+    fields = {}
+
+    def part_data():
+        for event in events:
+            if isinstance(event, Data):
+                yield event.data
+                if not event.more_data:
+                    return
+
+    for event in events:
+        if isinstance(event, File) and event.name == "pothole_log":
+            vehicle = vehicle or fields.get("vehicle") or os.path.splitext(os.path.basename(event.filename or ""))[0]
+            counts = merge_upload(part_data(), vehicle or "upload")
+            for _ in events:
+                pass  # the rest of the body
+            return counts
+        if isinstance(event, Field):
+            fields[event.name] = b"".join(part_data())[:256].decode("utf-8", errors="replace").strip()
+    raise ValueError("no pothole_log file in the upload")
@@ -0,0 +1,76 @@
+# cluster_benchmark.py
+# Builds the cluster pyramid for 500k synthetic potholes spread over a city and measures, per zoom
+# level, the /api/clusters response time and payload size for a 1280x800 viewport centred on the
+# city, next to what /api/potholes would have to send to show every pothole in that viewport.
+
+import math
+import time
+import numpy as np
+
+import app as webui
+from pothole_index import PotholeIndex, Record
+
+POINTS = 500_000
+CENTER = (-33.93, 18.52)
+VIEWPORT_PX = (1280, 800)
+REQUESTS = 20
+
+def viewport_bbox(zoom, center=CENTER, size=VIEWPORT_PX):
+    world_px = 256 * 2 ** zoom
+    cx = (center[1] + 180) / 360 * world_px
+    s = math.sin(math.radians(center[0]))
+    cy = (0.5 - math.log((1 + s) / (1 - s)) / (4 * math.pi)) * world_px
+
+    def to_latlon(x, y):
+        lon = x / world_px * 360 - 180
+        lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / world_px))))
+        return lat, lon
+
+    lat0, lon0 = to_latlon(cx - size[0] / 2, cy + size[1] / 2)
+    lat1, lon1 = to_latlon(cx + size[0] / 2, cy - size[1] / 2)
+    return f"{lon0},{lat0},{lon1},{lat1}"
+
+def timed_get(client, url):
+    client.get(url)
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        response = client.get(url)
+    return (time.perf_counter() - start) / REQUESTS * 1000, len(response.data), response.get_json()
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    # Potholes cluster along streets: a mix of dense neighbourhoods and a uniform background
+    hubs = rng.normal(CENTER, (0.08, 0.10), (200, 2))
+    picks = rng.integers(0, len(hubs), POINTS)
+    lats = np.where(rng.random(POINTS) < 0.8, hubs[picks, 0] + rng.normal(0, 0.004, POINTS),
+                    CENTER[0] + rng.uniform(-0.25, 0.25, POINTS))
+    lons = np.where(rng.random(POINTS) < 0.8, hubs[picks, 1] + rng.normal(0, 0.004, POINTS),
+                    CENTER[1] + rng.uniform(-0.25, 0.25, POINTS))
+    areas = rng.gamma(2.0, 0.05, POINTS)
+
+    webui.index = PotholeIndex("/nonexistent.db", "/nonexistent.csv", refresh_interval=1e9)
+    webui.index.refresh(force=True)
+    records = [Record(i + 1, lat, lon, area, "", 0.8, False)
+               for i, (lat, lon, area) in enumerate(zip(lats.tolist(), lons.tolist(), areas.tolist()))]
+    webui.index.extend(records)
+
+    start = time.perf_counter()
+    webui.pyramid.add_records(records)
+    build = time.perf_counter() - start
+
+    increment = records[:1000]
+    start = time.perf_counter()
+    webui.pyramid.add_records(increment)
+    incremental = (time.perf_counter() - start) * 1000
+
+    client = webui.app.test_client()
+    print(f"--- {POINTS} potholes, pyramid build {build:.1f} s, +1000 records {incremental:.1f} ms ---")
+    print(f"{'zoom':>4} | {'clusters':>8} | {'clusters ms':>11} | {'clusters KB':>11} | {'points in view':>14} | {'all points KB (est.)':>20}")
+    for zoom in range(4, 17, 2):
+        bbox = viewport_bbox(zoom)
+        ms, size, data = timed_get(client, f"/api/clusters?z={zoom}&bbox={bbox}")
+        in_view = sum(c["count"] for c in data["clusters"])
+        # Unclustered payload extrapolated from a 1000-record page
+        _, points_size, points = timed_get(client, f"/api/potholes?bbox={bbox}&limit=1000")
+        all_points_kb = points_size / max(len(points["items"]), 1) * in_view / 1024
+        print(f"{zoom:>4} | {len(data['clusters']):>8} | {ms:>11.2f} | {size / 1024:>11.1f} | {in_view:>14} | {all_points_kb:>20.1f}")
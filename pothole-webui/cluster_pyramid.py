@@ -0,0 +1,103 @@
+# cluster_pyramid.py
+# Multi-zoom clustered pyramid of pothole counts for the map. Each Web Mercator tile of each zoom
+# level is cut into cells of CELL_PX screen pixels, and every cell keeps the count, total and
+# maximum area, and the coordinate sums for its centroid. Updates are vectorized per level, so
+# new detections are merged in incrementally as the index picks them up.
+
+import math
+import threading
+import numpy as np
+
+TILE_PX = 256
+CELL_PX = 64
+CELLS_PER_TILE = TILE_PX // CELL_PX
+MAX_LATITUDE = 85.05112878
+
+def mercator(lats, lons):
+    lats = np.clip(np.asarray(lats, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE)
+    lons = np.asarray(lons, dtype=np.float64)
+    x = (lons + 180.0) / 360.0
+    s = np.sin(np.radians(lats))
+    y = 0.5 - np.log((1 + s) / (1 - s)) / (4 * math.pi)
+    return np.clip(x, 0.0, 1.0 - 1e-12), np.clip(y, 0.0, 1.0 - 1e-12)
+
+class ClusterPyramid:
+    def __init__(self, max_zoom=15):
+        self.max_zoom = max_zoom
+        # per level: cell key (cx * n + cy) -> [count, area_sum, area_max, lat_sum, lon_sum]
+        self.levels = [{} for _ in range(max_zoom + 1)]
+        self._lock = threading.Lock()
+        self.size = 0
+
+    @staticmethod
+    def cells_per_side(zoom):
+        return (1 << zoom) * CELLS_PER_TILE
+
+    def add_many(self, lats, lons, areas):
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        areas = np.asarray(areas, dtype=np.float64)
+        if not len(lats):
+            return
+        x, y = mercator(lats, lons)
+        with self._lock:
+            for zoom, cells in enumerate(self.levels):
+                n = self.cells_per_side(zoom)
+                keys = (x * n).astype(np.int64) * n + (y * n).astype(np.int64)
+                unique, inverse = np.unique(keys, return_inverse=True)
+                count = np.bincount(inverse)
+                area_sum = np.bincount(inverse, weights=areas)
+                lat_sum = np.bincount(inverse, weights=lats)
+                lon_sum = np.bincount(inverse, weights=lons)
+                area_max = np.full(len(unique), -np.inf)
+                np.maximum.at(area_max, inverse, areas)
+                for key, c, a_sum, a_max, la, lo in zip(unique.tolist(), count.tolist(), area_sum.tolist(),
+                                                        area_max.tolist(), lat_sum.tolist(), lon_sum.tolist()):
+                    cell = cells.get(key)
+                    if cell is None:
+                        cells[key] = [c, a_sum, a_max, la, lo]
+                    else:
+                        cell[0] += c
+                        cell[1] += a_sum
+                        cell[2] = max(cell[2], a_max)
+                        cell[3] += la
+                        cell[4] += lo
+            self.size += len(lats)
+
+    def add_records(self, records):
+        self.add_many([r.latitude for r in records], [r.longitude for r in records], [r.area for r in records])
+
+    def _clusters(self, zoom, cx0, cx1, cy0, cy1):
+        cells = self.levels[zoom]
+        n = self.cells_per_side(zoom)
+        clusters = []
+        with self._lock:
+            if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(cells):
+                found = [(key, cell) for key, cell in cells.items()
+                         if cx0 <= key // n <= cx1 and cy0 <= key % n <= cy1]
+            else:
+                found = [(cx * n + cy, cells[cx * n + cy]) for cx in range(cx0, cx1 + 1)
+                         for cy in range(cy0, cy1 + 1) if cx * n + cy in cells]
+            for key, (count, area_sum, area_max, lat_sum, lon_sum) in found:
+                clusters.append({
+                    "lat": round(lat_sum / count, 6),
+                    "lon": round(lon_sum / count, 6),
+                    "count": count,
+                    "area_sum": round(area_sum, 4),
+                    "area_max": round(area_max, 4),
+                })
+        return clusters
+
+    # All clusters of one Web Mercator tile
+    def tile(self, zoom, x, y):
+        zoom = min(zoom, self.max_zoom)
+        return self._clusters(zoom, x * CELLS_PER_TILE, (x + 1) * CELLS_PER_TILE - 1,
+                              y * CELLS_PER_TILE, (y + 1) * CELLS_PER_TILE - 1)
+
+    # All clusters of a zoom level inside bbox = (min_lon, min_lat, max_lon, max_lat)
+    def viewport(self, zoom, bbox):
+        zoom = min(zoom, self.max_zoom)
+        min_lon, min_lat, max_lon, max_lat = bbox
+        n = self.cells_per_side(zoom)
+        (x0, x1), (y1, y0) = (v.tolist() for v in mercator([min_lat, max_lat], [min_lon, max_lon]))
+        return self._clusters(zoom, int(x0 * n), int(x1 * n), int(y0 * n), int(y1 * n))
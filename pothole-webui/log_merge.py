@@ -0,0 +1,195 @@
+# log_merge.py
+# Merges pothole_log.csv files from several vehicles into one detection store. Rows are read as a
+# stream (the web UI feeds them straight from the upload as it arrives), so memory does not grow
+# with the size of a log. A row counts if it has a position and an area, as the results page
+# always required, and a timestamp, which identifies it on a later upload. A pothole within
+# radius_m of one already logged, and seen within window_s of its last sighting, is the same
+# pothole: it becomes one more sighting of that record (sightings, vehicles, last_seen) instead of
+# a new record, so only new potholes' crops are base64-decoded and stored. Each vehicle's rows are
+# remembered by timestamp, so uploading a log twice adds nothing. Records the store's own vehicle
+# logged (local_vehicle, the hostname by default) have no vehicles until another vehicle sees
+# them; the local vehicle then comes first.
+#
+#   python3 log_merge.py van2_pothole_log.csv --vehicle van2 [--db pothole_log.db]
+
+import argparse
+import base64
+import binascii
+import csv
+import datetime
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from detection_store import DetectionStore
+from spatial_index import SpatialIndex
+from startup import load_config
+
+MERGE_RADIUS_M = 5.0  # as the detector's duplicate suppression
+MERGE_WINDOW_S = 30 * 86400
+MAX_LINE_BYTES = 16 * 2**20  # a row with a very large crop, far beyond any real one
+
+MERGED_ROWS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS merged_rows (
+    vehicle TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    record_id INTEGER,
+    PRIMARY KEY (vehicle, timestamp)
+);
+"""
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+def _epoch(timestamp):
+    try:
+        t = datetime.datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return None
+    return t.timestamp()
+
+# Text lines from a stream of byte chunks, at most MAX_LINE_BYTES each, for csv.reader
+def iter_lines(chunks):
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        start = 0
+        while True:
+            end = pending.find(b"\n", start)
+            if end < 0:
+                break
+            yield pending[start:end + 1].decode("utf-8", errors="replace")
+            start = end + 1
+        pending = pending[start:]
+        if len(pending) > MAX_LINE_BYTES:
+            raise ValueError(f"CSV line longer than {MAX_LINE_BYTES} bytes")
+    if pending:
+        yield pending.decode("utf-8", errors="replace")
+
+def iter_file(f, chunk_size=256 * 1024):
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+class LogMerger:
+    def __init__(self, store, radius_m=MERGE_RADIUS_M, window_s=MERGE_WINDOW_S, commit_every=500,
+                 local_vehicle=None):
+        self.store = store
+        self.local_vehicle = local_vehicle or socket.gethostname()
+        self.window_s = window_s
+        self.commit_every = commit_every
+        store.conn.executescript(MERGED_ROWS_SCHEMA)
+        # Every logged pothole, with the time it was last seen
+        self.index = SpatialIndex(radius_m)
+        self.last_seen = []
+        for record in store.iter_records():
+            if record["latitude"] is not None and record["longitude"] is not None:
+                self.index.add(record["latitude"], record["longitude"], record["id"])
+                self.last_seen.append(_epoch(record["last_seen"] or record["timestamp"]))
+
+    # The logged pothole a row at (lat, lon, t) is another sighting of, as an index point
+    def _match(self, lat, lon, t):
+        for _, i in self.index.within(lat, lon):
+            seen = self.last_seen[i]
+            if t is None or seen is None or abs(t - seen) <= self.window_s:
+                return i
+        return None
+
+    # rows: csv.reader over a pothole_log.csv, header first
+    def merge(self, rows, vehicle):
+        counts = {"rows": 0, "added": 0, "sightings": 0, "already_merged": 0, "rejected": 0, "bad_images": 0}
+        start = time.perf_counter()
+        header = next(rows, None)
+        if not header:
+            raise ValueError("empty upload")
+        if not {"latitude", "longitude", "area_m2"} <= set(header):
+            raise ValueError("not a pothole log: latitude, longitude and area_m2 columns are required")
+        conn = self.store.conn
+        for values in rows:
+            if not values:
+                continue
+            counts["rows"] += 1
+            row = dict(zip(header, values))
+            lat, lon, area = _float(row.get("latitude")), _float(row.get("longitude")), _float(row.get("area_m2"))
+            timestamp = (row.get("timestamp") or "").strip()
+            if lat is None or lon is None or area is None or not timestamp:
+                counts["rejected"] += 1
+                continue
+            if conn.execute("SELECT 1 FROM merged_rows WHERE vehicle = ? AND timestamp = ?",
+                            (vehicle, timestamp)).fetchone():
+                counts["already_merged"] += 1
+                continue
+            t = _epoch(timestamp)
+            match = self._match(lat, lon, t)
+            if match is not None:
+                record_id = self.index.ids[match]
+                self.store.add_sighting(record_id, vehicle, timestamp, self.local_vehicle)
+                if t is not None and (self.last_seen[match] is None or t > self.last_seen[match]):
+                    self.last_seen[match] = t
+                counts["sightings"] += 1
+            else:
+                image = row.get("image_base64") or ""
+                try:
+                    jpeg = base64.b64decode(image, validate=True) if image else None
+                except (binascii.Error, ValueError):
+                    jpeg = None
+                    counts["bad_images"] += 1
+                record_id = self.store.add({
+                    "timestamp": timestamp, "latitude": lat, "longitude": lon,
+                    "altitude": _float(row.get("altitude")), "area_m2": area,
+                    "confidence": _float(row.get("confidence")), "frame": _int(row.get("frame")),
+                    "track_id": _int(row.get("track_id")), "stream": row.get("stream") or None,
+                    "sightings": 1, "vehicles": vehicle, "last_seen": timestamp,
+                }, jpeg)
+                self.index.add(lat, lon, record_id)
+                self.last_seen.append(t)
+                counts["added"] += 1
+            conn.execute("INSERT OR IGNORE INTO merged_rows VALUES (?, ?, ?)", (vehicle, timestamp, record_id))
+            if counts["rows"] % self.commit_every == 0:
+                self.store.commit()
+        self.store.commit(fsync=True)
+        counts["seconds"] = time.perf_counter() - start
+        counts["rows_per_s"] = counts["rows"] / counts["seconds"] if counts["seconds"] else 0.0
+        return counts
+
+# The store the detector writes, from its config
+def default_db():
+    return load_config()["db_path"]
+
+def merge_csv(chunks, store, vehicle, **kwargs):
+    csv.field_size_limit(sys.maxsize)
+    return LogMerger(store, **kwargs).merge(csv.reader(iter_lines(chunks)), vehicle)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge a vehicle's pothole_log.csv into the detection store")
+    parser.add_argument("csv_path")
+    parser.add_argument("--vehicle", help="vehicle the log is from (default: the file name)")
+    parser.add_argument("--db", default=default_db(), help="detection store path (default: the detector's)")
+    parser.add_argument("--radius", type=float, default=MERGE_RADIUS_M, help="same pothole within, m")
+    parser.add_argument("--local-vehicle", help="vehicle the store's own records are from (default: hostname)")
+    parser.add_argument("--window-days", type=float, default=MERGE_WINDOW_S / 86400,
+                        help="same pothole if seen again within, days")
+    args = parser.parse_args()
+
+    vehicle = args.vehicle or os.path.splitext(os.path.basename(args.csv_path))[0]
+    store = DetectionStore(args.db)
+    with open(args.csv_path, "rb") as f:
+        counts = merge_csv(iter_file(f), store, vehicle, radius_m=args.radius, window_s=args.window_days * 86400,
+                           local_vehicle=args.local_vehicle)
+    store.close()
+    print(f"Merged {counts['rows']} rows from {vehicle} in {counts['seconds']:.1f} s ({counts['rows_per_s']:.0f} rows/s): "
+          f"{counts['added']} new potholes, {counts['sightings']} more sightings, "
+          f"{counts['already_merged']} already merged, {counts['rejected']} rejected")
@@ -0,0 +1,117 @@
+# page_weight_benchmark.py
+# Page weight and time to first render of the results page on a 10k-record log: the old page,
+# which inlined every crop as a base64 data URI (in the table and again in the map's JSON), against
+# the current one, which pages the table through /api/potholes and lazily loads cached thumbnails
+# from /img. "First render" is everything the browser needs for the first screen: the old HTML
+# document in full; the new page shell, the first page of records and its thumbnails. Times are
+# server-side (Flask test client), so they leave out the network, where the byte counts matter.
+
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from flask import render_template_string
+
+import app as webui
+from pothole_index import PotholeIndex
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from detection_store import DetectionStore, export_csv
+from record_writer import encode_jpeg
+
+RECORDS = 10_000
+PAGE_SIZE = 25  # display.html's table page
+CROP = (320, 240)
+
+# The old display() route and template, trimmed to what they sent per record
+INLINE_TEMPLATE = """<table><tbody>{% for r in records %}
+<tr><td><img src="data:image/jpeg;base64,{{ r.image_base64 }}" class="pothole-img img-thumbnail" alt="pothole" /></td>
+<td>{{ "%.4f"|format(r.area | float) }}</td><td>{{ r.latitude }}, {{ r.longitude }}</td></tr>{% endfor %}
+</tbody></table><script>const coords = {{ records | tojson }};</script>"""
+
+def inline_page(csv_path):
+    import csv
+    csv.field_size_limit(sys.maxsize)
+    with open(csv_path, newline="") as f:
+        records = [{"latitude": float(row["latitude"]), "longitude": float(row["longitude"]),
+                    "area": float(row["area_m2"]), "image_base64": row.get("image_base64", "")}
+                   for row in csv.DictReader(f)]
+    with webui.app.test_request_context():
+        return render_template_string(INLINE_TEMPLATE, records=records).encode()
+
+def synthetic_store(directory):
+    rng = np.random.default_rng(0)
+    # Smooth, road-like textures: blurred noise compresses like the real crops do
+    textures = []
+    for _ in range(16):
+        noise = rng.integers(60, 200, (CROP[1] // 8, CROP[0] // 8, 3), dtype=np.uint8)
+        textures.append(cv2.GaussianBlur(cv2.resize(noise, CROP, interpolation=cv2.INTER_CUBIC), (5, 5), 0))
+    jpegs = [encode_jpeg(t) for t in textures]
+    store = DetectionStore(os.path.join(directory, "pothole_log.db"))
+    for i in range(RECORDS):
+        store.add({"timestamp": f"2024-05-01T08:{i // 60 % 60:02d}:{i % 60:02d}",
+                   "latitude": -33.93 + rng.normal(0, 0.02), "longitude": 18.52 + rng.normal(0, 0.02),
+                   "area_m2": float(rng.gamma(2.0, 0.05)), "confidence": 0.8, "frame": i, "track_id": i},
+                  jpegs[i % len(jpegs)] + i.to_bytes(4, "little"))  # distinct bytes, distinct digests
+    store.commit()
+    store.close()
+    return store.path
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+def first_render(client, etags=None):
+    # Page shell, first page of records, its thumbnails; with etags, as a revisit would send them
+    requests = 1
+    total = len(client.get("/").data)
+    response = client.get(f"/api/potholes?limit={PAGE_SIZE}&cursor=0")
+    total += len(response.data)
+    requests += 1
+    new_etags = {}
+    for item in response.get_json()["items"]:
+        headers = {"If-None-Match": f'"{etags[item["id"]]}"'} if etags else {}
+        image = client.get(item["thumb_url"], headers=headers)
+        assert image.status_code == (304 if etags else 200), image.status_code
+        new_etags[item["id"]] = image.get_etag()[0]
+        total += len(image.data)
+        requests += 1
+    return requests, total, new_etags
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = synthetic_store(directory)
+        csv_path = os.path.join(directory, "pothole_log.csv")
+        store = DetectionStore(db_path, readonly=True)
+        export_csv(store, csv_path)
+        store.close()
+
+        webui.has_internet = lambda: True
+        webui.index = PotholeIndex(db_path, csv_path, refresh_interval=1e9)
+        webui.index.refresh(force=True)
+        webui.THUMB_CACHE_DIR = os.path.join(directory, "thumbs")
+        client = webui.app.test_client()
+
+        rows = []
+        html, ms = timed(lambda: inline_page(csv_path))
+        rows.append(("inline base64 (before)", 1, len(html), ms))
+        (requests, total, etags), ms = timed(lambda: first_render(client))
+        rows.append(("thumbnails, cold cache", requests, total, ms))
+        (requests, total, _), ms = timed(lambda: first_render(client))
+        rows.append(("thumbnails, warm cache", requests, total, ms))
+        (requests, total, _), ms = timed(lambda: first_render(client, etags))
+        rows.append(("revisit, 304s", requests, total, ms))
+
+        print(f"--- Results page, {RECORDS} records, first screen = {PAGE_SIZE} rows ---")
+        print(f"{'page':<24} | {'requests':>8} | {'bytes':>11} | {'server ms':>9}")
+        for label, requests, total, ms in rows:
+            print(f"{label:<24} | {requests:>8} | {total:>11,} | {ms:>9.1f}")
+
+        full = sum(len(client.get(f"/img/{i}?size=full").data) for i in webui.index.ids)
+        thumbs = sum(len(client.get(f"/img/{i}?size=thumb").data) for i in webui.index.ids)
+        print(f"all {RECORDS} crops: {full / 1e6:.1f} MB full, {thumbs / 1e6:.1f} MB as thumbnails; "
+              f"thumbnail cache {webui.thumbnails.stats()}")
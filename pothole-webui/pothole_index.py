@@ -0,0 +1,172 @@
+# pothole_index.py
+# In-memory index of pothole records for the web UI API. It is built once and then refreshed
+# incrementally: from the detection store by the last row id seen, or from a legacy
+# pothole_log.csv by tailing the file from the last byte offset read. Records are bucketed in a
+# fixed-degree grid so bounding-box queries only touch the cells in view.
+
+import base64
+import csv
+import heapq
+import math
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from itertools import islice
+
+from detection_store import DetectionStore
+
+# image_ref is True/False for store records, or the byte offset of the row for CSV records; clip
+# is the path of the record's video clip relative to the store's directory
+Record = namedtuple("Record", ["id", "latitude", "longitude", "area", "timestamp", "confidence", "image_ref", "clip"],
+                    defaults=(None,))
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+class PotholeIndex:
+    def __init__(self, store_path, csv_path, cell_deg=0.01, refresh_interval=1.0):
+        self.store_path = store_path
+        self.csv_path = csv_path
+        self.cell_deg = cell_deg
+        self.refresh_interval = refresh_interval
+
+        self.records = []
+        self.ids = []
+        self._cells = {}  # (row, col) -> ascending positions in self.records
+        self._lock = threading.Lock()
+        self._last_refresh = 0.0
+        self._store = None
+        self._last_id = 0
+        self._csv_offset = 0
+        self._csv_header = None
+
+    @property
+    def source(self):
+        return "store" if os.path.exists(self.store_path) else "csv"
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def _append(self, record):
+        position = len(self.records)
+        self.records.append(record)
+        self.ids.append(record.id)
+        self._cells.setdefault(self._cell(record.latitude, record.longitude), []).append(position)
+
+    def extend(self, records):
+        with self._lock:
+            for record in records:
+                self._append(record)
+
+    # ---- incremental refresh ---- #
+    # Returns the records added since the last refresh
+    def refresh(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_refresh < self.refresh_interval:
+                return []
+            self._last_refresh = now
+            start = len(self.records)
+            if self.source == "store":
+                self._refresh_store()
+            elif os.path.exists(self.csv_path):
+                self._refresh_csv()
+            return self.records[start:]
+
+    def _refresh_store(self):
+        if self._store is None:
+            self._store = DetectionStore(self.store_path, readonly=True)
+        for row in self._store.iter_records(after_id=self._last_id):
+            self._last_id = row["id"]
+            if row["latitude"] is None or row["longitude"] is None or row["area_m2"] is None:
+                continue
+            self._append(Record(row["id"], row["latitude"], row["longitude"], row["area_m2"],
+                                row["timestamp"], row["confidence"], bool(row["image_length"]),
+                                row.get("clip_path")))
+
+    def _refresh_csv(self):
+        csv.field_size_limit(sys.maxsize)
+        with open(self.csv_path, "rb") as f:
+            f.seek(self._csv_offset)
+            while True:
+                line = f.readline()
+                # A line without its newline is still being written; pick it up next time
+                if not line or not line.endswith(b"\n"):
+                    break
+                offset = self._csv_offset
+                self._csv_offset += len(line)
+                values = next(csv.reader([line.decode("utf-8", errors="replace")]), None)
+                if not values:
+                    continue
+                if self._csv_header is None:
+                    self._csv_header = values
+                    continue
+                row = dict(zip(self._csv_header, values))
+                lat, lon, area = _float(row.get("latitude")), _float(row.get("longitude")), _float(row.get("area_m2"))
+                if lat is None or lon is None or area is None:
+                    continue
+                self._append(Record(len(self.records) + 1, lat, lon, area, row.get("timestamp", ""),
+                                    _float(row.get("confidence")), offset if row.get("image_base64") else None))
+
+    # ---- queries ---- #
+    # Queries hold the lock too: the threaded server refreshes from other request threads, which
+    # add cells to the grid while a query would be walking it
+    def get(self, record_id):
+        with self._lock:
+            position = bisect_right(self.ids, record_id) - 1
+            if position >= 0 and self.ids[position] == record_id:
+                return self.records[position]
+            return None
+
+    def read_image(self, record):
+        if not record.image_ref:
+            return None
+        if record.image_ref is True:
+            return self._store.read_image(record.id)
+        with open(self.csv_path, "rb") as f:
+            f.seek(record.image_ref)
+            values = next(csv.reader([f.readline().decode("utf-8", errors="replace")]))
+        image = dict(zip(self._csv_header, values)).get("image_base64", "")
+        return base64.b64decode(image) if image else None
+
+    # bbox is (min_lon, min_lat, max_lon, max_lat). Results are in id order; pass the returned
+    # cursor back to get the next page. Returns (records, next cursor or None, total records), the
+    # total counted together with the page.
+    def query(self, bbox=None, min_area=None, cursor=0, limit=100):
+        with self._lock:
+            items, next_cursor = self._query(bbox, min_area, cursor, limit)
+            return items, next_cursor, len(self.records)
+
+    def _query(self, bbox, min_area, cursor, limit):
+        records = self.records
+        start = bisect_right(self.ids, cursor)
+        if bbox is None:
+            positions = range(start, len(records))
+        else:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            row0, col0 = self._cell(min_lat, min_lon)
+            row1, col1 = self._cell(max_lat, max_lon)
+            if (row1 - row0 + 1) * (col1 - col0 + 1) > len(self._cells):
+                cells = [p for (r, c), p in self._cells.items() if row0 <= r <= row1 and col0 <= c <= col1]
+            else:
+                cells = [self._cells[(r, c)] for r in range(row0, row1 + 1) for c in range(col0, col1 + 1)
+                         if (r, c) in self._cells]
+            positions = heapq.merge(*(islice(cell, bisect_left(cell, start), None) for cell in cells))
+
+        items = []
+        for position in positions:
+            record = records[position]
+            if bbox is not None and not (min_lat <= record.latitude <= max_lat and min_lon <= record.longitude <= max_lon):
+                continue
+            if min_area is not None and record.area < min_area:
+                continue
+            if len(items) == limit:
+                return items, items[-1].id
+            items.append(record)
+        return items, None
@@ -0,0 +1,91 @@
+# thumbnail_cache.py
+# Thumbnails of the pothole crops for the web UI, made on first request and kept on disk as
+# <digest>-<size>.jpg, where digest is a hash of the full crop's bytes: a thumbnail can never go
+# stale, and the digest doubles as the images' strong ETag. The cache is least-recently-used
+# within max_bytes; use is tracked by file mtime, so the order survives a restart.
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+THUMB_SIZE = 200  # longest side, px (the table shows them at up to 100 px, twice that for HiDPI)
+THUMB_QUALITY = 70
+
+def digest(jpeg):
+    return hashlib.blake2b(jpeg, digest_size=16).hexdigest()
+
+def make_thumbnail(jpeg, size=THUMB_SIZE, quality=THUMB_QUALITY):
+    image = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    height, width = image.shape[:2]
+    scale = size / max(height, width)
+    if scale >= 1.0:
+        return jpeg  # already small enough
+    image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                       interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes() if ok else None
+
+class ThumbnailCache:
+    def __init__(self, directory, max_bytes=64 * 2**20, size=THUMB_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = size
+        self._lock = threading.Lock()
+        self._files = OrderedDict()  # name -> bytes, least recently used first
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        entries = [e for e in os.scandir(directory) if e.is_file() and e.name.endswith(".jpg")]
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            self._files[entry.name] = entry.stat().st_size
+            self.bytes += entry.stat().st_size
+
+    # Thumbnail of the crop jpeg, whose digest is key
+    def get(self, key, jpeg):
+        name = f"{key}-{self.size}.jpg"
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            cached = name in self._files
+            if cached:
+                self._files.move_to_end(name)
+        if cached:
+            try:
+                with open(path, "rb") as f:
+                    thumb = f.read()
+                os.utime(path)
+                self.hits += 1
+                return thumb
+            except FileNotFoundError:
+                pass  # evicted meanwhile
+        self.misses += 1
+        thumb = make_thumbnail(jpeg, self.size)
+        if thumb is None:
+            return None
+        partial = f"{path}.{threading.get_ident()}.part"
+        with open(partial, "wb") as f:
+            f.write(thumb)
+        os.replace(partial, path)
+        with self._lock:
+            self.bytes += len(thumb) - self._files.pop(name, 0)
+            self._files[name] = len(thumb)
+            self._evict()
+        return thumb
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and len(self._files) > 1:
+            name, size = self._files.popitem(last=False)
+            self.bytes -= size
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        return {"files": len(self._files), "bytes": self.bytes, "hits": self.hits, "misses": self.misses}
@@ -1,130 +1,333 @@
-import gi
-gi.require_version('Gst', '1.0')
-from gi.repository import Gst, GLib
+import time
+# Start of the imports, for the startup report
+STARTED = time.monotonic()
+
 import os
 import numpy as np
 import cv2
-import hailo
-import time
-from picamera2 import Picamera2
-from libcamera import Transform
-from log_gps_info import get_gps_coordinates
+from log_gps_info import at_command, find_nmea_port, get_serial
+from gps_service import ATPollSource, FallbackSource, GPSService, NMEAStreamSource
+from lazy_frame import FrameAccounting, LazyFrame
+from clip_buffer import ClipEncoder, ClipRecorder, ClipRing
+from postprocess_pool import PostProcessPool
+from sync_agent import SyncAgent
+from preview_server import PreviewServer
+from record_writer import RecordWriter
+from detection_store import DetectionStore, StoreSink
+from spatial_index import SpatialIndex
+from stream_context import Calibration, StreamContext, StreamRegistry
+from stage_metrics import MetricsServer, StageMetrics
+from pipeline_log import setup_logging, shutdown_logging, suppressed_count, toggle_debug
+from startup import StartupTimer, load_config
+import argparse
 import datetime
-from math import radians, cos, sin, sqrt, atan2
-import csv
+import logging
+from functools import partial
+import re
+import signal
 import subprocess
-import base64
-from io import BytesIO
-from PIL import Image
+import sys
 
-from hailo_apps_infra.hailo_rpi_common import (
-    get_caps_from_pad,
-    get_numpy_from_buffer,
-    app_callback_class,
-)
-from hailo_apps_infra.detection_pipeline import GStreamerDetectionApp
+log = logging.getLogger("pothole.detection")
+
+# -----------------------------------
+# Hailo / GStreamer
+# -----------------------------------
+# Imported by import_pipeline() when the detector starts, not with this module, so config tools
+# and tests can import it without the Hailo and GStreamer stack; replay.py calls it after putting
+# its stand-ins in place. user_app_callback_class is CallbackState on top of the hailo app's
+# app_callback_class.
+Gst = GLib = hailo = None
+get_caps_from_pad = get_numpy_from_buffer = None
+user_app_callback_class = None
+
+def import_pipeline():
+    global Gst, GLib, hailo, get_caps_from_pad, get_numpy_from_buffer, user_app_callback_class
+    if user_app_callback_class is not None:
+        return
+    import gi
+    gi.require_version('Gst', '1.0')
+    from gi.repository import Gst, GLib
+    import hailo
+    from hailo_apps_infra.hailo_rpi_common import get_caps_from_pad, get_numpy_from_buffer, app_callback_class
+    user_app_callback_class = type("user_app_callback_class", (CallbackState, app_callback_class), {})
 
 # -----------------------------------
 # Calibration data for size estimation
 # -----------------------------------
-def check_or_run_calibration():
-    if not os.path.exists("/home/lukea/hailo-rpi5-examples/basic_pipelines/new_camera_calibration.npz"):
+base_dir = os.path.dirname(os.path.abspath(__file__))
+calibration_file = os.path.join(base_dir, "new_camera_calibration.npz")
+calibrate_script = os.path.join(base_dir, "calibrate.py")
+
+# Set by load_calibration(), which must run before the callback does; streams without a
+# calibration file of their own use it
+calibration = None
+
+# mode is the config's recalibrate setting: prompt, missing or never
+def check_or_run_calibration(path=calibration_file, mode="prompt"):
+    if not os.path.exists(path):
+        if mode == "never":
+            raise RuntimeError(f"No calibration file at {path}")
         print("No calibration file found. Starting compulsory calibration...")
-        subprocess.run(["python3", "basic_pipelines/calibrate.py"])
-    else:
+        subprocess.run(["python3", calibrate_script])
+    elif mode == "prompt":
         choice = input("Calibration file found. Do you want to recalibrate? (yes/no): ").strip().lower()
         if choice == "yes":
-            subprocess.run(["python3", "basic_pipelines/calibrate.py"])
+            subprocess.run(["python3", calibrate_script])
         else:
             print("Using existing calibration.")
 
-check_or_run_calibration()
+def load_calibration(path=calibration_file):
+    global calibration
+    calibration = Calibration.from_file(path)
+    return calibration
 
-calibrated_data = np.load('/home/lukea/hailo-rpi5-examples/basic_pipelines/new_camera_calibration.npz')
-K = calibrated_data['K']
-dist = calibrated_data['dist']
-mm_per_pixel = calibrated_data['mm_per_pixel']
-ref_pixel_width = calibrated_data['ref_pixel_width']
 # -----------------------------------
 # User-defined callback class
 # -----------------------------------
-class user_app_callback_class(app_callback_class):
+# The detector's state; combined with the hailo app's app_callback_class by import_pipeline()
+class CallbackState:
     def __init__(self):
         super().__init__()
         self.new_variable = 42
+        # GPS, duplicate index and writer of streams that get no context of their own in main
+        self.gps = None
+        self.writer = None
+        self.potholes = SpatialIndex(DEDUP_RADIUS_M)
+        # Per-stream state, found by the stream id of each buffer
+        self.streams = StreamRegistry(self.new_stream)
+        self.metrics = StageMetrics(CALLBACK_STAGES, sample_every=METRICS_SAMPLE_EVERY)
+        # Frames are rendered only for the hailo display window (--use-frame) or preview viewers,
+        # and only of one stream: display_stream, or the first one to deliver a frame
+        self.local_display = False
+        self.preview = None
+        self.display_stream = None
+        # Event clips: one encoder thread for all streams, a ring per stream (see add_clips)
+        self.clip_encoder = None
+        self.clip_config = None
+        self.clip_link_dir = None
+        # Worker processes scoring crops off the streaming thread; None scores them inline
+        self.postprocess = None
+        self.startup = None
+
+    def new_stream(self, stream_id):
+        return self.add_clips(StreamContext(stream_id, calibration, self.potholes, self.writer, self.gps,
+                                            track_timeout_s=TRACK_TIMEOUT_S))
+
+    def add_clips(self, stream):
+        if self.clip_encoder is not None:
+            c = self.clip_config
+            ring = ClipRing(c["ring_s"], c["fps"], (c["width"], c["height"]), int(c["max_mb"] * 2**20))
+            stream.clips = ClipRecorder(ring, self.clip_encoder, self.clip_link_dir, c["pre_s"], c["post_s"])
+        return stream
+
+    def display_wanted(self, stream):
+        if self.display_stream is None:
+            self.display_stream = stream.stream_id
+        if stream.stream_id != self.display_stream:
+            return False
+        return self.local_display or (self.preview is not None and self.preview.viewers > 0)
+
+    # Pixel accounting summed over the streams
+    def frame_stats(self):
+        total = FrameAccounting()
+        for stream in self.streams:
+            for key, value in vars(stream.frame_stats).items():
+                setattr(total, key, getattr(total, key) + value)
+        return total.summary()
+
+    def track_stats(self):
+        totals = {}
+        for stream in self.streams:
+            for key, value in stream.tracks.stats().items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def set_frame(self, frame):
+        if self.local_display:
+            super().set_frame(frame)
+        if self.preview is not None:
+            self.preview.publish(frame)
 
     def new_function(self):
         return "The meaning of life is:"
 
-# set up csv and tracking
-log_file = open("pothole_log.csv", "a", newline="")
-csv_writer = csv.writer(log_file)
+# Potholes closer than this to an already logged one are treated as duplicates
+DEDUP_RADIUS_M = 5.0
+# A track not seen for this long is considered finished and logged
+TRACK_TIMEOUT_S = 1.0
 
-if log_file.tell() == 0:
-    csv_writer.writerow(["timestamp", "latitude", "longitude", "altitude", "area_m2", "confidence", "frame", "image_base64"])
+# Callback stages timed by stage_metrics, as (name, parent)
+CALLBACK_STAGES = [
+    ("callback", None),
+    ("extract", "callback"),
+    ("undistort_frame", "callback"),
+    ("roi_decode", "callback"),
+    ("undistort_boxes", "callback"),
+    ("size_estimate", "callback"),
+    ("track", "callback"),
+    ("postprocess", "callback"),
+    ("annotate", "callback"),
+    ("log_tracks", "callback"),
+    ("gps_lookup", "log_tracks"),
+    ("dedup", "log_tracks"),
+    ("submit", "log_tracks"),
+    ("convert", "callback"),
+    ("clip", "callback"),
+    ("log", "callback"),
+]
+(STAGE_CALLBACK, STAGE_EXTRACT, STAGE_UNDISTORT_FRAME, STAGE_ROI_DECODE, STAGE_UNDISTORT_BOXES,
+ STAGE_SIZE, STAGE_TRACK, STAGE_POSTPROCESS, STAGE_ANNOTATE, STAGE_LOG_TRACKS, STAGE_GPS_LOOKUP, STAGE_DEDUP,
+ STAGE_SUBMIT, STAGE_CONVERT, STAGE_CLIP, STAGE_LOG) = range(len(CALLBACK_STAGES))
+# Time every Nth frame only; a timed frame costs ~15 laps of well under 1 µs each
+METRICS_SAMPLE_EVERY = 10
+# Folded stacks of the stage times written at shutdown, for flamegraph.pl / speedscope
+METRICS_FOLDED_PATH = "pothole_stages.folded"
+# False copies every frame out of its buffer up front, as before the frame handle was lazy and
+# mapped
+LAZY_FRAMES = True
 
-last_pothole = {"lat": None, "lon": None, "time": None}
+# Converts the buffer PTS (pipeline running time) to time.monotonic() seconds so the frame can be
+# matched against fixes recorded by the GPS service
+def buffer_monotonic_time(pad, buffer):
+    try:
+        element = pad.get_parent_element()
+        clock = element.get_clock() if element is not None else None
+        if clock is not None and buffer.pts != Gst.CLOCK_TIME_NONE:
+            clock_offset = time.monotonic_ns() - clock.get_time()
+            return (element.get_base_time() + buffer.pts + clock_offset) / 1e9
+    except Exception:
+        pass
+    return time.monotonic()
 
-# ---- crop and encode pothole image ---- #
-def crop_and_encode(frame, x_min, y_min, w, h):
-    crop = frame[y_min:y_min+h, x_min:x_min+w]
+# The stream a buffer belongs to: the id hailoroundrobin tagged it with, otherwise the name of
+# the pad the callback is attached to (one context for a single-source pipeline)
+def stream_id_of(pad, roi):
+    get_stream_id = getattr(roi, "get_stream_id", None)
+    if get_stream_id is not None:
+        stream_id = get_stream_id()
+        if stream_id:
+            return stream_id
+    get_name = getattr(pad, "get_name", None)
+    return get_name() if get_name is not None else None
 
-    pil_image = Image.fromarray(crop)
-    buffered = BytesIO()
-    pil_image.save(buffered, format="JPEG")
+# Undistorted pixels of a box, from the displayed frame if it exists, otherwise through the
+# cached maps from only the raw rows the box needs (or the raw frame once it has been copied)
+def get_crop(undistorter, frame, pixels, x_min, y_min, w, h):
+    if frame is not None:
+        return frame[y_min:y_min+h, x_min:x_min+w]
+    if pixels is not None:
+        if pixels.banded:
+            return undistorter.undistort_crop_rows(pixels.rows, pixels.width, pixels.height,
+                                                   x_min, y_min, w, h)
+        raw_frame = pixels.full()
+        if raw_frame is not None:
+            return undistorter.undistort_crop(raw_frame, x_min, y_min, w, h)
+    log.debug("Skipped crop, frame is None")
+    return None
+
+# ---- log finished pothole tracks of one stream ---- #
+def log_tracks(stream, tracks, metrics):
+    if not tracks:
+        return
+    t = metrics.now()
+    # One GPS lookup per pothole, at the time of its best frame
+    tagged = []
+    for track in tracks:
+        lat, lon, alt = stream.gps.position_at(track.best_time) if stream.gps else (None, None, None)
+        if lat is None or lon is None:
+            log.warning("No GPS fix available")
+            continue
+        tagged.append((track, lat, lon, alt))
+    t = metrics.lap(STAGE_GPS_LOOKUP, t)
+    if not tagged:
+        return
+
+    potholes = stream.potholes
+    duplicates = potholes.near_batch([tag[1] for tag in tagged], [tag[2] for tag in tagged])
+    logged_in_batch = False
+    now = time.monotonic()
+    for (track, lat, lon, alt), duplicate in zip(tagged, duplicates):
+        # Potholes logged earlier in this batch are not in the batched result yet
+        if duplicate or (logged_in_batch and potholes.near(lat, lon)):
+            log.info("[%s] Skipped duplicate pothole @ (%.6f, %.6f)", stream.name, lat, lon)
+            stream.duplicates += 1
+            t = metrics.lap(STAGE_DEDUP, t)
+            continue
+        t = metrics.lap(STAGE_DEDUP, t)
+        area_m2 = track.median_area()
+        seen = datetime.datetime.now() - datetime.timedelta(seconds=now - track.best_time)
+        # The clip is written once its post-event frames are in; the record links it right away
+        clip_path = None
+        if stream.clips is not None:
+            clip_path = stream.clips.request(track.best_time, f"{seen:%Y%m%d_%H%M%S}_{stream.name}_{track.best_frame}")
+        # Encoding and the disk write happen on the writer's worker threads
+        stream.writer.submit({
+            "timestamp": seen.isoformat(),
+            "latitude": lat,
+            "longitude": lon,
+            "altitude": alt,
+            "area_m2": area_m2,
+            "confidence": track.best_confidence,
+            "frame": track.best_frame,
+            "track_id": max(track.track_id, 0),
+            "stream": stream.name,
+            "clip_path": clip_path,
+        }, track.best_crop)
+        log.info("[%s] Logged pothole @ (%.6f, %.6f) | area=%.4f m2 | conf=%.2f | %d frames", stream.name,
+                 lat, lon, area_m2, track.best_confidence, track.frames, extra={"interval": 0})
+        potholes.add(lat, lon)
+        stream.logged += 1
+        logged_in_batch = True
+        t = metrics.lap(STAGE_SUBMIT, t)
 
-    encoded_string = base64.b64encode(buffered.getvalue()).decode('utf-8')
-    
-    return encoded_string
+# Crops the post-processing pool has scored since the last frame, applied to their tracks. Tracks
+# this finishes wait in their stream's pool_finished for its next log_tracks stage.
+def apply_pool_results(user_data):
+    for (stream, key, t, frame_id, confidence), crop_sharpness, crop in user_data.postprocess.results():
+        finished = stream.tracks.offer(key, t, frame_id, confidence, crop_sharpness, crop)
+        if finished is not None:
+            stream.pool_finished.append(finished)
 
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371000
-    phi1, phi2 = radians(lat1), radians(lat2)
-    d_phi = radians(lat2 - lat1)
-    d_lambda = radians(lon2 - lon1)
-    a = sin(d_phi/2)**2 + cos(phi1)*cos(phi2)*sin(d_lambda/2)**2
-    return R * 2 * atan2(sqrt(a), sqrt(1-a))
 # -----------------------------------
 # Callback function for inference
 # -----------------------------------
 def app_callback(pad, info, user_data):
-    global K, dist, mm_per_pixel
-    print(">> Callback triggered")
+    metrics = user_data.metrics
+    frame_start = t = metrics.start_frame()
+    busy_start = time.perf_counter()
     buffer = info.get_buffer()
     if buffer is None:
         return Gst.PadProbeReturn.OK
 
     user_data.increment()
-    string_to_print = f"Frame count: {user_data.get_count()}\n"
+    # Everything kept between frames belongs to the buffer's stream
+    roi = hailo.get_roi_from_buffer(buffer)
+    stream = user_data.streams.get(stream_id_of(pad, roi))
+    undistorter = stream.calibration.undistorter
+    pool = user_data.postprocess
+    if pool is not None:
+        apply_pool_results(user_data)
+        t = metrics.lap(STAGE_POSTPROCESS, t)
+    if user_data.startup is not None:
+        user_data.startup.mark_first_frame()
+        log.info("%s", user_data.startup.report())
+        user_data.startup = None
+    # The per-frame summary is only built when DEBUG is on (SIGUSR1 toggles it)
+    verbose = log.isEnabledFor(logging.DEBUG)
+    if verbose:
+        string_to_print = f"Stream {stream.name} frame count: {stream.frames + 1}\n"
+    frame_time = buffer_monotonic_time(pad, buffer)
 
     format, width, height = get_caps_from_pad(pad)
-    print(f"[DEBUG] Pad caps — Format: {format}, Width: {width}, Height: {height}")
-    frame = None
-    if user_data.use_frame and format and width and height:
-        raw_frame = get_numpy_from_buffer(buffer, format, width, height)
-        if raw_frame is not None:
-            try:
-                frame = cv2.undistort(raw_frame, K, dist)
-                if frame is None:
-                    print("[WARNING] cv2.undistort returned None — using raw frame.")
-                    frame = raw_frame
-                else:
-                    print("[DEBUG] Frame undistorted successfully.")
-            except Exception as e:
-                print(f"[ERROR] cv2.undistort failed: {e}")
-                frame = raw_frame
-        else:
-            print("[ERROR] get_numpy_from_buffer() returned None.")
-    else:
-        print("[DEBUG] Frame not extracted: missing format, size, or use_frame=False.")
+    if verbose:
+        log.debug("Pad caps: format %s, width %s, height %s", format, width, height)
 
-
-    roi = hailo.get_roi_from_buffer(buffer)
     detections = roi.get_objects_typed(hailo.HAILO_DETECTION)
 
-    detection_count = 0
+    # Collect the raw boxes first so all corners are undistorted in one call
+    candidates = []
     for detection in detections:
-        label = "pothole"
         confidence = detection.get_confidence()
 
         # Track ID
@@ -132,76 +335,93 @@ def app_callback(pad, info, user_data):
         track = detection.get_objects_typed(hailo.HAILO_UNIQUE_ID)
         if len(track) == 1:
             track_id = track[0].get_id()
-            
-        bbox = detection.get_bbox()  # [x, y, width, height]
 
-        # --- Size Estimation ---
+        bbox = detection.get_bbox()  # [x, y, width, height]
         try:
-            x_min = int(round(bbox.xmin()))
-            y_min = int(round(bbox.ymin()))
-            x_max = int(round(bbox.xmax()))
-            y_max = int(round(bbox.ymax()))
+            box = (bbox.xmin(), bbox.ymin(), bbox.xmax(), bbox.ymax())
         except Exception as e:
             continue
-        
+        candidates.append((confidence, track_id, box))
+    t = metrics.lap(STAGE_ROI_DECODE, t)
+
+    # Pixels stay in the buffer until something needs them: a crop for a track's best frame, or
+    # the whole frame while it is displayed. The display branch follows the viewers frame by frame.
+    user_data.use_frame = user_data.display_wanted(stream)
+    pixels = None
+    frame = None
+    if format and width and height:
+        pixels = LazyFrame(buffer, format, width, height, get_numpy_from_buffer, stream.frame_stats,
+                           map_flags=Gst.MapFlags.READ)
+        if user_data.use_frame or not LAZY_FRAMES:
+            raw_frame = pixels.full() if LAZY_FRAMES else pixels.copy()
+            t = metrics.lap(STAGE_EXTRACT, t)
+            if raw_frame is None:
+                log.error("get_numpy_from_buffer() returned None")
+            elif user_data.use_frame:
+                # Remapped from the mapped buffer into a reused array, nothing is allocated per frame
+                frame = stream.work_frame.next(raw_frame.shape)
+                try:
+                    undistorter.undistort_frame(raw_frame, out=frame)
+                except Exception as e:
+                    log.error("Frame undistortion failed: %s", e)
+                    np.copyto(frame, raw_frame)
+                t = metrics.lap(STAGE_UNDISTORT_FRAME, t)
+    else:
+        log.warning("Frame not extracted: missing format or size")
+
+    boxes = np.array([c[2] for c in candidates], dtype=np.float64).reshape(-1, 4)
+    if len(boxes):
+        try:
+            boxes = undistorter.undistort_boxes(boxes)
+        except Exception as e:
+            log.error("Box undistortion failed: %s", e)
+    boxes = np.rint(boxes).astype(int)
+    if width and height:
+        boxes = np.clip(boxes, 0, [width, height, width, height])
+    t = metrics.lap(STAGE_UNDISTORT_BOXES, t)
+
+    # --- Size Estimation ---
+    areas = stream.calibration.estimate_areas(boxes, width, height).tolist() if len(boxes) else []
+    t = metrics.lap(STAGE_SIZE, t)
+
+    frame_id = stream.frames + 1
+    finished_tracks, stream.pool_finished = stream.pool_finished, []
+    pool_crops = []  # (context, box) to score in the pool
+
+    detection_count = 0
+    for (confidence, track_id, _), (x_min, y_min, x_max, y_max), area_m2 in zip(candidates, boxes.tolist(), areas):
         # Compute the actual height and width
         w = x_max - x_min
         h = y_max - y_min
-        
+
         if w <= 0 or h <= 0:
             continue  # Skip to next detection
-        
-        # Apply dynamic mm_per_pixel scaling
-        Z_ratio = ref_pixel_width / w
-        mm_per_pixel_dyn = mm_per_pixel * Z_ratio
-        
-        # Compute real-world dimensions
-        real_w_m = w * mm_per_pixel_dyn / 1000
-        real_h_m = h * mm_per_pixel_dyn / 1000
-        area_m2 = (real_w_m * real_h_m)
-        print(area_m2)
-        
-        accuracy = (1 - abs(area_m2 - ref_area) / ref_area) * 100
-        accuracy = max(0, min(accuracy, 100))
+        if area_m2 != area_m2:
+            log.debug("Skipped box reaching above the horizon: %s", (x_min, y_min, x_max, y_max))
+            continue
 
         # --- Print info ---
-        string_to_print += (
-            f"Detection: ID: {track_id} Label: pothole Confidence: {confidence:.2f} "
-            f"Area: {area_m2:.10f} m2"
-        )
+        if verbose:
+            string_to_print += (
+                f"Detection: ID: {track_id} Label: pothole Confidence: {confidence:.2f} "
+                f"Area: {area_m2:.10f} m2\n"
+            )
         detection_count += 1
 
-        lat, lon, alt = get_gps_coordinates()
-        frame_id = user_data.get_count()
-
-        if lat is not None and lon is not None:
-            should_log = False
-            if last_pothole["lat"] is None:
-                should_log = True
-            else:
-                dist = haversine(lat, lon, last_pothole["lat"], last_pothole["lon"])
-                if dist > 5:
-                    should_log = True
-
-            if should_log:
-                timestamp = datetime.datetime.now().isoformat()
-                if frame is not None:
-                    encoded_crop = crop_and_encode(frame, x_min, y_min, w, h)
-                    print(f"[DEBUG] base64 image size: {len(encoded_crop)} characters")
-                else:
-                    encoded_crop = "" # Placeholder in case something goes wrong
-                    print("[DEBUG] Skipped encoding — frame is None")
-                csv_writer.writerow([timestamp, lat, lon, alt, area_m2, confidence, frame_id, encoded_crop])
-                log_file.flush()
-                print(f"[LOGGED] Pothole @ ({lat:.6f}, {lon:.6f}) | area={area_m2:.4f} m2 | conf={confidence:.2f}")
-                last_pothole["lat"] = lat
-                last_pothole["lon"] = lon
-                last_pothole["time"] = timestamp
-            else:
-                print(f"[SKIPPED] Duplicate pothole @ ({lat:.6f}, {lon:.6f})")
+        # --- Track aggregation ---
+        # Only the track's best frame is kept; the record is logged once the track ends
+        if pool is not None and pixels is not None:
+            key = stream.tracks.observe_deferred(track_id, frame_time, frame_id, confidence, area_m2)
+            if key is not None:
+                pool_crops.append(((stream, key, frame_time, frame_id, confidence), (x_min, y_min, w, h)))
         else:
-            print("[WARNING] No GPS fix available")
-        
+            finished = stream.tracks.observe(
+                track_id, frame_time, frame_id, confidence, area_m2,
+                partial(get_crop, undistorter, frame, pixels, x_min, y_min, w, h))
+            if finished is not None:
+                finished_tracks.append(finished)
+        t = metrics.lap(STAGE_TRACK, t)
+
         # --- Draw annotations ---
         if user_data.use_frame and frame is not None:
             cv2.rectangle(frame, (x_min, y_min), (x_min + w, y_min + h), (0, 255, 0), 2)
@@ -209,46 +429,280 @@ def app_callback(pad, info, user_data):
                         cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
             cv2.putText(frame, f"Area: {area_m2:.4f} m2", (x_min, y_min + h + 15),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+            t = metrics.lap(STAGE_ANNOTATE, t)
+
+    # The raw frame goes to a shared-memory slot, the crops are scored in the workers
+    if pool_crops:
+        raw_frame = pixels.full()
+        if raw_frame is None or not pool.submit(raw_frame, pool_crops, stream.calibration):
+            for (_, key, crop_time, crop_frame, crop_confidence), _ in pool_crops:
+                finished = stream.tracks.offer(key, crop_time, crop_frame, crop_confidence, 0.0, None)
+                if finished is not None:
+                    finished_tracks.append(finished)
+        t = metrics.lap(STAGE_POSTPROCESS, t)
+
+    stream.detections += detection_count
+    finished_tracks += stream.tracks.expire(frame_time)
+    t = metrics.lap(STAGE_TRACK, t)
+    log_tracks(stream, finished_tracks, metrics)
+    t = metrics.lap(STAGE_LOG_TRACKS, t)
 
     if user_data.use_frame and frame is not None:
         cv2.putText(frame, f"Detections: {detection_count}", (10, 30),
                     cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
         cv2.putText(frame, f"{user_data.new_function()} {user_data.new_variable}", (10, 60),
                     cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-        user_data.set_frame(frame)
-        
-    print(string_to_print)
+        t = metrics.lap(STAGE_ANNOTATE, t)
+        bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR, dst=stream.frame_ring.next(frame.shape))
+        user_data.set_frame(bgr)
+        t = metrics.lap(STAGE_CONVERT, t)
+    # The clip ring takes a downscaled copy of the raw frame at the clip frame rate
+    clips = stream.clips
+    if clips is not None and pixels is not None and clips.ring.due(frame_time):
+        raw_frame = pixels.full()
+        if raw_frame is not None and raw_frame.shape[-1] == 3:
+            clips.push(raw_frame, frame_time)
+        t = metrics.lap(STAGE_CLIP, t)
+    if pixels is not None:
+        pixels.release()
+
+    if verbose:
+        log.debug("%s", string_to_print)
+    t = metrics.lap(STAGE_LOG, t)
+    metrics.lap(STAGE_CALLBACK, frame_start)
+    stream.count_frame(frame_time, time.perf_counter() - busy_start)
     return Gst.PadProbeReturn.OK
 
-# -----------------------------------
-# Main execution
-# -----------------------------------
-if __name__ == "__main__":
-    user_data = user_app_callback_class()
+# Opens the camera once so the pipeline's first start doesn't stall; runs on its own thread
+def prewarm_camera(size, settle_s):
+    from picamera2 import Picamera2
 
-    # Ensure camera warms up to prevent pipeline stalls
     try:
         picam2 = Picamera2()
-        config = picam2.create_preview_configuration(main={"format": 'RGB888', "size" : (640, 480)})
+        config = picam2.create_preview_configuration(main={"format": 'RGB888', "size": tuple(size)})
         picam2.configure(config)
         picam2.start()
-        time.sleep(2)
+        time.sleep(settle_s)
         picam2.stop()
         picam2.close()
-        print("Camera pre-warm successful.")
+        log.info("Camera pre-warm successful")
     except Exception as e:
-        print(f"Camera warm-up failed: {e}")
-    
+        log.error("Camera warm-up failed: %s", e)
+
+# -----------------------------------
+# Main execution
+# -----------------------------------
+if __name__ == "__main__":
+    # --config is ours; everything else is left for the hailo app's own argument parser
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--config", help="JSON settings file (default: pothole_detection.json)")
+    args, remaining = parser.parse_known_args()
+    sys.argv = sys.argv[:1] + remaining
+
+    timer = StartupTimer(STARTED)
+    timer.add("imports", STARTED, time.monotonic())
+    with timer.phase("config"):
+        config = load_config(args.config)
+    with timer.phase("hailo imports"):
+        import_pipeline()
+
+    # Console output goes through a rate-limited ring buffer flushed off the frame path.
+    # `kill -USR1 <pid>` toggles DEBUG (the full per-frame output) without a restart; GLib's
+    # handler is used as well because Python signal handlers wait while the main loop runs.
+    log_config = config["log"]
+    setup_logging(getattr(logging, str(log_config["level"]).upper(), logging.INFO),
+                  json_lines=log_config["json"], rate_limit_s=log_config["rate_limit_s"])
+    if hasattr(GLib, "unix_signal_add"):
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR1, lambda *_: toggle_debug() or True)
+    log.info("Settings from %s", config["source"] or "built-in defaults")
+
+    with timer.phase("calibration"):
+        check_or_run_calibration(config["calibration_file"], config["recalibrate"])
+        load_calibration(config["calibration_file"])
+        # Calibration files are loaded once however many streams use them
+        calibrations = {config["calibration_file"]: calibration}
+        for stream_config in config["streams"]:
+            path = stream_config["calibration_file"]
+            if path not in calibrations:
+                calibrations[path] = Calibration.from_file(path)
+
+    # The camera settles and the GPS modem is probed and opened on their own threads while the
+    # store, the servers and the pipeline are set up
+    camera_thread = None
+    if config["camera"]["prewarm"]:
+        camera_thread = timer.background("camera prewarm", prewarm_camera,
+                                         config["camera"]["size"], config["camera"]["prewarm_s"])
+
+    user_data = user_app_callback_class()
+    user_data.startup = timer
+
+    gps_config = config["gps"]
+    if gps_config["enabled"]:
+        def open_gps():
+            with timer.phase("gps open"):
+                return get_serial(gps_config["port"], gps_config["baudrate"])
+
+        source = polling = ATPollSource(opener=open_gps)
+        if gps_config["stream"]:
+            # AT+CGPS=1 on the AT port starts the receiver, which then streams on its NMEA port
+            def enable_stream():
+                polling.start()
+                if gps_config["nmea_rate_command"]:
+                    at_command(polling.ser, gps_config["nmea_rate_command"].encode() + b"\r")
+
+            def open_nmea():
+                with timer.phase("gps nmea open"):
+                    import serial
+
+                    port = gps_config["nmea_port"] or find_nmea_port(gps_config["baudrate"],
+                                                                     exclude=(polling.ser.port,))
+                    return serial.Serial(port, baudrate=gps_config["baudrate"], timeout=0.2)
+
+            source = FallbackSource(NMEAStreamSource(opener=open_nmea, enable=enable_stream,
+                                                     probe_s=gps_config["probe_s"]), polling)
+
+        # GPS fixes are read on a background thread, the callback only reads the ring buffer
+        user_data.gps = GPSService(source, poll_interval=gps_config["poll_interval"]).start()
+
+    with timer.phase("store + spatial index"):
+        store = DetectionStore(config["db_path"])
+        # Every pothole already in the survey takes part in duplicate suppression
+        user_data.potholes = SpatialIndex.from_store(store, DEDUP_RADIUS_M)
+        log.info("Loaded %d logged potholes into the spatial index", len(user_data.potholes))
+        user_data.writer = RecordWriter(StoreSink(store), maxsize=256, workers=1,
+                                        batch_size=32, batch_interval_ms=500, overflow="drop_crop")
+        clip_config = config["clips"]
+        if clip_config["enabled"]:
+            try:
+                user_data.clip_encoder = ClipEncoder(clip_config["dir"], clip_config["fps"])
+                user_data.clip_config = clip_config
+                user_data.clip_link_dir = os.path.dirname(config["db_path"])
+            except (OSError, RuntimeError) as e:
+                log.error("Pothole clips disabled: %s", e)
+        # One context per configured stream. All share the writer and this Pi's GPS; the streams
+        # of one vehicle share its duplicate index, the first vehicle's is the one loaded above.
+        indexes = {}
+        for stream_config in config["streams"]:
+            vehicle = stream_config["vehicle"]
+            if vehicle not in indexes:
+                indexes[vehicle] = SpatialIndex.from_store(store, DEDUP_RADIUS_M) if indexes else user_data.potholes
+            user_data.streams.add(user_data.add_clips(StreamContext(
+                stream_config["id"], calibrations[stream_config["calibration_file"]], indexes[vehicle],
+                user_data.writer, user_data.gps, name=stream_config["name"], track_timeout_s=TRACK_TIMEOUT_S)))
+        pool_config = config["postprocess"]
+        if pool_config["workers"]:
+            user_data.postprocess = PostProcessPool(pool_config["workers"], pool_config["slots"],
+                                                    pool_config["backpressure"], pool_config["wait_ms"] / 1000)
+            log.info("Crops scored in %d worker processes", pool_config["workers"])
+        if config["streams"]:
+            log.info("Streams: %s", ", ".join(f"{c['name']} ({c['source']})" for c in config["streams"]))
+
+    # Uploads what the writer has committed whenever the server can be reached
+    sync_agent = None
+    sync_config = config["sync"]
+    if sync_config["enabled"] and sync_config["url"]:
+        sync_agent = SyncAgent(config["db_path"], sync_config["url"], sync_config["cursor_file"],
+                               sync_config["device"], sync_config["batch_records"], sync_config["gzip_level"],
+                               sync_config["interval_s"], sync_config["timeout_s"],
+                               max_backoff_s=sync_config["max_backoff_s"], token=sync_config["token"]).start()
+        log.info("Uploading detections to %s", sync_config["url"])
+
+    # Stage timings for Prometheus / curl, plus the writer, tracker, stream and GPS counters
+    def metrics_gauges():
+        gauges = {f"writer_{k}": v for k, v in user_data.writer.stats().items()}
+        gauges.update({f"tracks_{k}": v for k, v in user_data.track_stats().items()})
+        gauges.update({f"pixels_{k}": v for k, v in user_data.frame_stats().items()})
+        gauges.update({f"streams_{k}": v for k, v in user_data.streams.aggregate().items()})
+        for stream in user_data.streams:
+            name = re.sub(r"\W", "_", stream.name)
+            gauges.update({f"stream_{name}_{k}": v for k, v in stream.stats().items()})
+        if user_data.postprocess is not None:
+            gauges.update({f"postprocess_{k}": v for k, v in user_data.postprocess.stats().items()})
+        if user_data.clip_encoder is not None:
+            gauges.update({f"clips_{k}": v for k, v in user_data.clip_encoder.stats().items()})
+        if user_data.preview is not None:
+            gauges.update(preview_viewers=user_data.preview.viewers)
+        if sync_agent is not None:
+            gauges.update({f"sync_{k}": v for k, v in sync_agent.stats().items()})
+        if user_data.gps is not None:
+            gauges.update(gps_fixes=user_data.gps.fix_count, gps_empty_polls=user_data.gps.empty_polls,
+                          gps_errors=user_data.gps.errors)
+        return gauges
+
+    metrics_server = None
+    with timer.phase("servers"):
+        if config["metrics"]["enabled"]:
+            try:
+                metrics_server = MetricsServer(user_data.metrics, config["metrics"]["host"],
+                                               config["metrics"]["port"], gauges=metrics_gauges).start()
+                log.info("Metrics on http://%s:%d/metrics", config["metrics"]["host"], metrics_server.port)
+            except OSError as e:
+                log.error("Metrics endpoint not started: %s", e)
+
+        # Opening the preview in a browser switches frame rendering on, closing it switches it off
+        if config["preview"]["enabled"]:
+            try:
+                user_data.preview = PreviewServer(config["preview"]["host"], config["preview"]["port"]).start()
+                log.info("Live preview on http://<this host>:%d/", user_data.preview.port)
+            except OSError as e:
+                log.error("Preview server not started: %s", e)
+
+    with timer.phase("pipeline imports"):
+        from hailo_apps_infra.detection_pipeline import GStreamerDetectionApp
+        if config["streams"]:
+            from multi_source import MultiSourceDetectionApp
+
+    if camera_thread is not None:
+        with timer.phase("wait for camera"):
+            camera_thread.join()
+
     # Handling GStreamer Errors during exit
     try:
-        app = GStreamerDetectionApp(app_callback, user_data)
-        user_data.use_frame = True
+        with timer.phase("pipeline build"):
+            if config["streams"]:
+                app = MultiSourceDetectionApp(app_callback, user_data, config["streams"])
+            else:
+                app = GStreamerDetectionApp(app_callback, user_data)
+        # The hailo display window (--use-frame) keeps rendering on; otherwise viewers decide
+        user_data.local_display = bool(getattr(getattr(app, "options_menu", None), "use_frame", False))
         app.run()
     except KeyboardInterrupt:
-        print("Video stream shutting down")
+        log.info("Video stream shutting down")
     finally:
         if 'app' in locals():
             app.pipeline.set_state(Gst.State.NULL)
             del app
-            print("GStreamer closed")
+            log.info("GStreamer closed")
+        if user_data.startup is not None:
+            log.info("%s", user_data.startup.report())
+        user_data.metrics.end_frames()
+        if user_data.postprocess is not None:
+            user_data.postprocess.wait()
+            apply_pool_results(user_data)
+            user_data.postprocess.close()
+            log.info("Post-processing pool: %s", user_data.postprocess.stats())
+        for stream in user_data.streams:
+            log_tracks(stream, stream.pool_finished + stream.tracks.flush(), user_data.metrics)
+        log.info("Track aggregation: %s", user_data.track_stats())
+        log.info("Streams:\n%s", user_data.streams.report())
+        if user_data.clip_encoder is not None:
+            for stream in user_data.streams:
+                if stream.clips is not None:
+                    stream.clips.flush()
+            user_data.clip_encoder.close()
+            log.info("Pothole clips: %s", user_data.clip_encoder.stats())
+        if user_data.gps is not None:
+            user_data.gps.stop()
+        user_data.writer.close()
+        log.info("Pothole writer drained: %s", user_data.writer.stats())
+        if sync_agent is not None:
+            sync_agent.stop()
+            log.info("Sync: %s", sync_agent.stats())
+        log.info("Frame pixels copied: %s", user_data.frame_stats())
+        log.info("%s", user_data.metrics.flame_summary(METRICS_FOLDED_PATH))
+        if metrics_server is not None:
+            metrics_server.stop()
+        if user_data.preview is not None:
+            user_data.preview.stop()
+        log.info("%d repeated log messages were suppressed", suppressed_count())
+        shutdown_logging()
@@ -6,7 +6,11 @@ import numpy as np
 import cv2
 import hailo
 import time
-import psutil
+import sys
+import argparse
+from benchmark_stats import (
+    FrameRateWindow, LatencyHistogram, ResourceSampler, run_metadata, write_report,
+)
 
 from hailo_apps_infra.hailo_rpi_common import (
     get_caps_from_pad,
@@ -19,45 +23,75 @@ from hailo_apps_infra.detection_pipeline import GStreamerDetectionApp
 # Callback class with benchmarking stats
 # -----------------------------------------------------------------------------------------------
 class user_app_callback_class(app_callback_class):
-    def __init__(self):
+    # Fixed-memory streaming statistics: callback time and inter-frame interval histograms, frame
+    # rate windows, and CPU/RSS sampled on a side thread rather than per frame
+    def __init__(self, sample_interval=0.5):
         super().__init__()
         self.total_confidence = 0.0
         self.total_detections = 0
-        self.total_time = 0.0
-        self.cpu_usages = []
-        self.mem_usages = []
+        self.callback_times = LatencyHistogram()
+        self.frame_intervals = LatencyHistogram()
+        self.frame_rate = FrameRateWindow()
+        self.last_frame = None
+        self.started = time.monotonic()
+        self.resources = ResourceSampler(sample_interval).start()
 
     def log_stats(self, start_time, frame_confidences):
-        self.total_time += time.time() - start_time
-        self.cpu_usages.append(psutil.cpu_percent())
-        self.mem_usages.append(psutil.Process(os.getpid()).memory_info().rss / (1024 * 1024))
+        now = time.perf_counter()
+        self.callback_times.record(now - start_time)
+        if self.last_frame is not None:
+            self.frame_intervals.record(start_time - self.last_frame)
+        self.last_frame = start_time
+        self.frame_rate.tick(start_time)
         self.total_confidence += sum(frame_confidences)
         self.total_detections += len(frame_confidences)
 
-    def report(self):
-        avg_conf = self.total_confidence / self.total_detections if self.total_detections else 0
-        avg_time = self.total_time / self.get_count() if self.get_count() else 0
-        peak_cpu = max(self.cpu_usages)
-        avg_cpu = sum(self.cpu_usages) / len(self.cpu_usages) if self.cpu_usages else 0
-        peak_mem = max(self.mem_usages)
-        avg_mem = sum(self.mem_usages) / len(self.mem_usages) if self.mem_usages else 0
+    def summary(self):
+        return {
+            "meta": run_metadata(),
+            "frames": self.get_count(),
+            "detections": self.total_detections,
+            "duration_s": time.monotonic() - self.started,
+            "avg_confidence": self.total_confidence / self.total_detections if self.total_detections else 0,
+            "callback_ms": self.callback_times.summary(),
+            "interval_ms": self.frame_intervals.summary(),
+            "fps": self.frame_rate.summary(),
+            "cpu_percent": self.resources.cpu_percent.summary(),
+            "rss_mb": self.resources.rss_mb.summary(),
+        }
+
+    def report(self, path=None):
+        self.resources.stop()
+        summary = self.summary()
+        callback, interval, fps = summary["callback_ms"], summary["interval_ms"], summary["fps"]
+        cpu, rss = summary["cpu_percent"], summary["rss_mb"]
 
         print("\n--- Benchmark Summary ---")
-        print(f"Total frames: {self.get_count()}")
-        print(f"Total detections: {self.total_detections}")
-        print(f"Average confidence: {avg_conf:.3f}")
-        print(f"Average inference time: {avg_time*1000:.2f} ms")
-        print(f"Peak CPU usage: {peak_cpu:.2f}%")
-        print(f"Average CPU usage: {avg_cpu:.2f}%")
-        print(f"Peak Memory usage: {peak_mem:.2f} MB/s")
-        print(f"Average memory usage: {avg_mem:.2f} MB/s")
+        print(f"Total frames: {summary['frames']}")
+        print(f"Total detections: {summary['detections']}")
+        print(f"Average confidence: {summary['avg_confidence']:.3f}")
+        if callback["count"]:
+            print("Callback time ms: " + " | ".join(f"{k} {callback[k]:.3f}" for k in PERCENTILE_KEYS))
+        if interval["count"]:
+            print("Frame interval ms: " + " | ".join(f"{k} {interval[k]:.3f}" for k in PERCENTILE_KEYS))
+        print(f"FPS: mean {fps['mean']:.1f} | min 1s {fps['min_1s']} | max 1s {fps['max_1s']} | "
+              f"last 10s {fps['last_10s']:.1f}")
+        if cpu["count"]:
+            print(f"CPU usage: mean {cpu['mean']:.2f}% | peak {cpu['max']:.2f}%")
+            print(f"Memory usage (RSS): mean {rss['mean']:.2f} MB | peak {rss['max']:.2f} MB")
         print("--------------------------")
+        if path:
+            write_report(summary, path)
+            print(f"Report written to {path}")
+        return summary
+
+PERCENTILE_KEYS = ("p50", "p90", "p99", "p99.9", "max")
 
 # -----------------------------------------------------------------------------------------------
 # Callback function
 # -----------------------------------------------------------------------------------------------
 def app_callback(pad, info, user_data):
-    start_time = time.time()
+    start_time = time.perf_counter()
     buffer = info.get_buffer()
     if buffer is None:
         return Gst.PadProbeReturn.OK
@@ -83,10 +117,18 @@ def app_callback(pad, info, user_data):
 # -----------------------------------------------------------------------------------------------
 # Main
 # -----------------------------------------------------------------------------------------------
+#   python3 pothole_hailo_benchmark.py --input rpi --hef-path ... --report run.json
+#   python3 benchmark_stats.py compare base.json run.json
 if __name__ == "__main__":
+    # --report is ours; everything else goes to the Hailo app's own parser
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--report", help="write the benchmark summary as JSON to this path")
+    args, remaining = parser.parse_known_args()
+    sys.argv = sys.argv[:1] + remaining
+
     user_data = user_app_callback_class()
     app = GStreamerDetectionApp(app_callback, user_data)
     try:
         app.run()
     finally:
-        user_data.report()
+        user_data.report(args.report)
@@ -0,0 +1,102 @@
+# preview_server.py
+# Live preview of the annotated frames as an MJPEG stream (multipart/x-mixed-replace), viewable in
+# any browser at http://<pi>:8090/. The detector only undistorts, annotates and hands over frames
+# while at least one viewer is connected (see `viewers`), so a headless drive pays nothing for it.
+# publish() just swaps a reference; JPEG encoding happens on the viewers' server threads, once per
+# new frame however many viewers there are.
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+BOUNDARY = b"frame"
+
+class PreviewServer:
+    def __init__(self, host="0.0.0.0", port=8090, quality=80, max_fps=15.0):
+        self.quality = quality
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.viewers = 0
+        self.frames_published = 0
+        self._frame = None
+        self._seq = 0
+        self._jpeg = (0, None)  # (seq, encoded bytes)
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path in ("/", "/preview.mjpg"):
+                    server._stream(self)
+                else:
+                    self.send_error(404)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="preview-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # Called from the callback with a BGR frame it no longer writes to
+    def publish(self, frame):
+        with self._cond:
+            self._frame = frame
+            self._seq += 1
+            self.frames_published += 1
+            self._cond.notify_all()
+
+    def _next_jpeg(self, last_seq):
+        with self._cond:
+            while self._seq == last_seq and not self._stop.is_set():
+                self._cond.wait(1.0)
+            seq, frame = self._seq, self._frame
+        if frame is None:
+            return seq, None
+        cached_seq, jpeg = self._jpeg
+        if cached_seq != seq:
+            ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            jpeg = encoded.tobytes() if ok else None
+            self._jpeg = (seq, jpeg)
+        return seq, jpeg
+
+    def _stream(self, handler):
+        handler.send_response(200)
+        handler.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY.decode()}")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.end_headers()
+        with self._cond:
+            self.viewers += 1
+        try:
+            seq = 0
+            while not self._stop.is_set():
+                seq, jpeg = self._next_jpeg(seq)
+                if jpeg is None:
+                    continue
+                handler.wfile.write(b"--" + BOUNDARY + b"\r\nContent-Type: image/jpeg\r\n"
+                                    + f"Content-Length: {len(jpeg)}\r\n\r\n".encode() + jpeg + b"\r\n")
+                handler.wfile.flush()
+                if self.min_interval:
+                    self._stop.wait(self.min_interval)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with self._cond:
+                self.viewers -= 1
@@ -0,0 +1,224 @@
+# record_writer.py
+# Asynchronous group-commit writer for pothole records. The detection callback only enqueues a
+# record and its crop; background workers JPEG/base64-encode the crops and commit records to the
+# sink in batches, every batch_size records or every batch_interval_ms, whichever comes first.
+#
+# Overflow policies when the queue is full:
+#   block       - the producer waits for room
+#   drop_oldest - the oldest queued record is discarded
+#   drop_crop   - the new record is kept without its crop (metadata is cheap, crops are not)
+
+import base64
+import csv
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import cv2
+
+log = logging.getLogger("pothole.writer")
+
+CSV_HEADER = ["timestamp", "latitude", "longitude", "altitude", "area_m2", "confidence", "frame", "image_base64"]
+OVERFLOW_POLICIES = ("block", "drop_oldest", "drop_crop")
+
+# Under drop_crop, crop-less records may exceed maxsize up to this factor before the oldest go
+METADATA_QUEUE_FACTOR = 8
+# Same quality as the PIL default the crops were saved with before
+JPEG_QUALITY = 75
+
+# RGB crop -> JPEG bytes, encoded by OpenCV straight from the array (no PIL image in between)
+def encode_jpeg(crop):
+    bgr = cv2.cvtColor(crop, cv2.COLOR_RGB2BGR) if crop.ndim == 3 else crop
+    ok, encoded = cv2.imencode(".jpg", bgr, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return encoded.tobytes()
+
+def encode_crop(crop):
+    if crop is None or crop.size == 0:
+        return ""
+    return base64.b64encode(encode_jpeg(crop)).decode('utf-8')
+
+# -----------------------------------
+# Sinks
+# -----------------------------------
+class CSVSink:
+    def __init__(self, path):
+        self.log_file = open(path, "a", newline="")
+        self.csv_writer = csv.writer(self.log_file)
+        if self.log_file.tell() == 0:
+            self.csv_writer.writerow(CSV_HEADER)
+
+    # Runs on a worker thread, outside the commit lock
+    def prepare(self, record, crop):
+        row = [record.get(field, "") for field in CSV_HEADER[:-1]]
+        row.append(encode_crop(crop))
+        return row
+
+    def write_batch(self, rows):
+        self.csv_writer.writerows(rows)
+
+    def commit(self, fsync=False):
+        self.log_file.flush()
+        if fsync:
+            os.fsync(self.log_file.fileno())
+
+    def close(self):
+        self.log_file.close()
+
+# -----------------------------------
+# Writer
+# -----------------------------------
+class RecordWriter:
+    def __init__(self, sink, maxsize=256, workers=1, batch_size=32, batch_interval_ms=200,
+                 fsync=False, overflow="block"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}, got {overflow!r}")
+        self.sink = sink
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval_ms / 1000
+        self.fsync = fsync
+        self.overflow = overflow
+
+        self._queue = deque()  # [record, crop, enqueue_time]
+        self._pending_crops = 0
+        self._cond = threading.Condition()
+        self._commit_lock = threading.Lock()
+        self._closing = False
+
+        self.submitted = 0
+        self.committed = 0
+        self.dropped = 0
+        self.dropped_crops = 0
+        self.errors = 0
+        self.batches = 0
+        self.max_queue_depth = 0
+        self.max_batch_size = 0
+        self.total_commit_time = 0.0
+        self.max_commit_time = 0.0
+        self.max_submit_time = 0.0
+
+        self._workers = [
+            threading.Thread(target=self._run, name=f"record-writer-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _is_full(self):
+        if self.overflow == "drop_crop":
+            return self._pending_crops >= self.maxsize
+        return len(self._queue) >= self.maxsize
+
+    def _drop_oldest(self):
+        entry = self._queue.popleft()
+        if entry[1] is not None:
+            self._pending_crops -= 1
+        self.dropped += 1
+
+    # Called from the streaming thread. The crop is copied if it is a view, since the frame buffer
+    # is recycled once the callback returns. Returns False if the record was dropped.
+    def submit(self, record, crop=None):
+        start = time.perf_counter()
+        if crop is not None and crop.base is not None:
+            crop = crop.copy()
+        with self._cond:
+            if self._closing:
+                return False
+            if self._is_full():
+                if self.overflow == "block":
+                    while self._is_full() and not self._closing:
+                        self._cond.wait()
+                    if self._closing:
+                        # The workers may already have drained and exited: the record would be lost
+                        self.dropped += 1
+                        return False
+                elif self.overflow == "drop_oldest":
+                    self._drop_oldest()
+                elif crop is not None:
+                    crop = None
+                    self.dropped_crops += 1
+            if self.overflow == "drop_crop" and len(self._queue) >= self.maxsize * METADATA_QUEUE_FACTOR:
+                self._drop_oldest()
+
+            self._queue.append([record, crop, time.monotonic()])
+            if crop is not None:
+                self._pending_crops += 1
+            self.submitted += 1
+            self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+            self._cond.notify_all()
+        self.max_submit_time = max(self.max_submit_time, time.perf_counter() - start)
+        return True
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                if self._queue:
+                    # Commit when the batch is full or the oldest record has waited long enough
+                    deadline = self._queue[0][2] + self.batch_interval
+                    remaining = deadline - time.monotonic()
+                    if len(self._queue) >= self.batch_size or remaining <= 0 or self._closing:
+                        break
+                    self._cond.wait(remaining)
+                elif self._closing:
+                    return None
+                else:
+                    self._cond.wait()
+
+            count = min(self.batch_size, len(self._queue))
+            batch = [self._queue.popleft() for _ in range(count)]
+            self._pending_crops -= sum(1 for entry in batch if entry[1] is not None)
+            self._cond.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                rows = [self.sink.prepare(record, crop) for record, crop, _ in batch]
+                with self._commit_lock:
+                    start = time.perf_counter()
+                    self.sink.write_batch(rows)
+                    self.sink.commit(self.fsync)
+                    elapsed = time.perf_counter() - start
+                    self.committed += len(rows)
+                    self.batches += 1
+                    self.max_batch_size = max(self.max_batch_size, len(rows))
+                    self.total_commit_time += elapsed
+                    self.max_commit_time = max(self.max_commit_time, elapsed)
+            except Exception as e:
+                self.errors += 1
+                log.error("Record write failed: %s", e)
+
+    # Stops accepting records, drains the queue and closes the sink
+    def close(self, timeout=None):
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+        self.sink.close()
+
+    def stats(self):
+        with self._cond:
+            depth = len(self._queue)
+        return {
+            "queue_depth": depth,
+            "max_queue_depth": self.max_queue_depth,
+            "submitted": self.submitted,
+            "committed": self.committed,
+            "dropped": self.dropped,
+            "dropped_crops": self.dropped_crops,
+            "errors": self.errors,
+            "batches": self.batches,
+            "mean_batch_size": self.committed / self.batches if self.batches else 0,
+            "max_batch_size": self.max_batch_size,
+            "mean_commit_ms": self.total_commit_time / self.batches * 1000 if self.batches else 0,
+            "max_commit_ms": self.max_commit_time * 1000,
+            "max_submit_ms": self.max_submit_time * 1000,
+        }
@@ -0,0 +1,82 @@
+# record_writer_benchmark.py
+# Shows that the callback's worst-case logging time no longer includes encoding and disk I/O.
+# "inline" reproduces the old callback path (JPEG + base64 + CSV row + flush per pothole),
+# "async" only submits to the RecordWriter. Each is run back to back (what the overflow policies
+# exist for: the queue fills and submit blocks or drops) and paced at SUBMIT_INTERVAL (a rate the
+# workers can sustain, so submit times are the per-frame cost).
+
+import csv
+import os
+import tempfile
+import time
+import numpy as np
+
+from record_writer import CSV_HEADER, CSVSink, RecordWriter, encode_crop
+
+RECORDS = 2000
+CROP_SHAPE = (120, 160, 3)
+# Far above any real logging rate, but sustainable for the workers
+SUBMIT_INTERVAL = 0.002
+PACINGS = (("back to back", 0.0), ("paced", SUBMIT_INTERVAL))
+
+def make_record(i):
+    return {"timestamp": f"2025-05-22T10:00:{i % 60:02d}", "latitude": -33.95 + i * 1e-5,
+            "longitude": 18.46, "altitude": 45.0, "area_m2": 0.12, "confidence": 0.8, "frame": i}
+
+def run_inline(path, crops, interval):
+    times = []
+    with open(path, "a", newline="") as log_file:
+        writer = csv.writer(log_file)
+        writer.writerow(CSV_HEADER)
+        for i, crop in enumerate(crops):
+            start = time.perf_counter()
+            record = make_record(i)
+            writer.writerow([record[f] for f in CSV_HEADER[:-1]] + [encode_crop(crop)])
+            log_file.flush()
+            times.append(time.perf_counter() - start)
+            if interval:
+                time.sleep(interval)
+    return times
+
+def run_async(path, crops, interval, **options):
+    writer = RecordWriter(CSVSink(path), **options)
+    times = []
+    for i, crop in enumerate(crops):
+        start = time.perf_counter()
+        writer.submit(make_record(i), crop)
+        times.append(time.perf_counter() - start)
+        if interval:
+            time.sleep(interval)
+    drain_start = time.perf_counter()
+    writer.close()
+    return times, time.perf_counter() - drain_start, writer.stats()
+
+def describe(times):
+    times = np.array(times) * 1000
+    return f"mean {times.mean():7.3f} ms | p99 {np.percentile(times, 99):7.3f} ms | max {times.max():7.3f} ms"
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    crops = [rng.integers(0, 255, CROP_SHAPE, dtype=np.uint8) for _ in range(RECORDS)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for pacing, interval in PACINGS:
+            print(f"--- Per-record callback cost, {RECORDS} records, {pacing} ---")
+            print(f"inline encode+write+flush : "
+                  f"{describe(run_inline(os.path.join(tmp, 'inline.csv'), crops, interval))}")
+            os.remove(os.path.join(tmp, "inline.csv"))
+            for options in (
+                dict(workers=1, batch_size=32, batch_interval_ms=200),
+                dict(workers=2, batch_size=32, batch_interval_ms=200),
+                dict(workers=2, batch_size=64, batch_interval_ms=500, fsync=True),
+                dict(workers=1, batch_size=32, batch_interval_ms=200, maxsize=64, overflow="drop_crop"),
+            ):
+                path = os.path.join(tmp, "async.csv")
+                times, drain, stats = run_async(path, crops, interval, **options)
+                os.remove(path)
+                print(f"async {options}")
+                print(f"  submit                  : {describe(times)}")
+                print(f"  drain on close          : {drain * 1000:7.1f} ms")
+                print(f"  batches {stats['batches']}, mean size {stats['mean_batch_size']:.1f}, "
+                      f"max queue {stats['max_queue_depth']}, mean commit {stats['mean_commit_ms']:.2f} ms, "
+                      f"max commit {stats['max_commit_ms']:.2f} ms, dropped crops {stats['dropped_crops']}")
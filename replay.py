@@ -0,0 +1,513 @@
+# replay.py
+# Offline replay harness. Drives the app_callback of pothole_detection.py (or
+# pothole_hailo_benchmark.py) with frames from a recorded video or image directory and detections
+# from a JSON/CSV sidecar, so the Python post-processing can be profiled without a Hailo-8, a Pi
+# camera or the SIM modem. The Hailo/GStreamer/Picamera2 modules are replaced by stand-ins before
+# the target is imported, GPS fixes come from a recorded gps_log.csv or NMEA log, and every
+# callback is timed.
+#
+#   python3 replay.py drive.mp4 --detections drive.json --gps gps_log.csv
+#   python3 replay.py frames/ --detections drive.csv --nmea drive.nmea --realtime
+#   python3 replay.py --size 640x480 --detections drive.json --target benchmark
+#   python3 replay.py front.mp4 --detections front.json --stream rear.mp4 rear.json
+#
+# Extra --stream sources are interleaved by timestamp into the one callback, tagged "sink_1",
+# "sink_2", ... as hailoroundrobin tags the frames of a multi-source pipeline ("sink_0" for the
+# first), and throughput is reported per stream and in total.
+#
+# JSON sidecar: {"fps": 30, "frames": [{"frame": 0, "detections": [
+#                   {"bbox": [x_min, y_min, x_max, y_max], "confidence": 0.9, "track_id": 3}]}]}
+# CSV sidecar:  frame,x_min,y_min,x_max,y_max,confidence,track_id
+
+import argparse
+import contextlib
+import csv
+import datetime
+import heapq
+import importlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import types
+from collections import deque
+
+import cv2
+import numpy as np
+
+from pipeline_log import setup_logging, shutdown_logging
+
+DEFAULT_FPS = 30.0
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+TARGETS = {"detection": "pothole_detection", "benchmark": "pothole_hailo_benchmark"}
+
+# -----------------------------------
+# Stand-ins for the Hailo / GStreamer objects the callback touches
+# -----------------------------------
+class ReplayBBox:
+    def __init__(self, x_min, y_min, x_max, y_max):
+        self._box = (x_min, y_min, x_max, y_max)
+
+    def xmin(self): return self._box[0]
+    def ymin(self): return self._box[1]
+    def xmax(self): return self._box[2]
+    def ymax(self): return self._box[3]
+    def width(self): return self._box[2] - self._box[0]
+    def height(self): return self._box[3] - self._box[1]
+
+class ReplayUniqueId:
+    def __init__(self, track_id):
+        self._id = track_id
+
+    def get_id(self):
+        return self._id
+
+class ReplayDetection:
+    def __init__(self, bbox, confidence, track_id=0, label="pothole"):
+        self._bbox = ReplayBBox(*bbox)
+        self._confidence = confidence
+        self._label = label
+        self._ids = [ReplayUniqueId(track_id)] if track_id else []
+
+    def get_bbox(self): return self._bbox
+    def get_confidence(self): return self._confidence
+    def get_label(self): return self._label
+
+    def get_objects_typed(self, kind):
+        return self._ids if kind == "HAILO_UNIQUE_ID" else []
+
+class ReplayROI:
+    def __init__(self, detections, stream_id=""):
+        self._detections = detections
+        self._stream_id = stream_id
+
+    def get_objects_typed(self, kind):
+        return self._detections if kind == "HAILO_DETECTION" else []
+
+    def get_stream_id(self):
+        return self._stream_id
+
+class ReplayBuffer:
+    def __init__(self, pts, frame, detections, stream_id=""):
+        self.pts = pts
+        self.frame = np.ascontiguousarray(frame)
+        self.roi = ReplayROI(detections, stream_id)
+
+    def get_size(self):
+        return self.frame.nbytes
+
+    def map(self, flags):
+        return True, types.SimpleNamespace(data=memoryview(self.frame.reshape(-1)).toreadonly(),
+                                           size=self.frame.nbytes)
+
+    def unmap(self, info):
+        info.data.release()
+
+    # Gst.Buffer.extract_dup(): a copy of `size` bytes from `offset`
+    def extract_dup(self, offset, size):
+        return self.frame.reshape(-1)[offset:offset + size].tobytes()
+
+class ReplayProbeInfo:
+    def __init__(self, buffer):
+        self._buffer = buffer
+
+    def get_buffer(self):
+        return self._buffer
+
+class ReplayClock:
+    def get_time(self):
+        return time.monotonic_ns()
+
+class ReplayElement:
+    # The pipeline clock is time.monotonic_ns() and the base time is the start of the replay, so
+    # buffer_monotonic_time() maps a buffer PTS onto the same timeline as the replayed GPS fixes
+    def __init__(self, base_time):
+        self.base_time = base_time
+        self.clock = ReplayClock()
+
+    def get_clock(self): return self.clock
+    def get_base_time(self): return self.base_time
+
+class ReplayPad:
+    def __init__(self, caps, base_time):
+        self.caps = caps
+        self.element = ReplayElement(base_time)
+
+    def get_parent_element(self):
+        return self.element
+
+class ReplayCallbackClass:
+    # Mirrors hailo_apps_infra's app_callback_class; frames handed to set_frame are kept in a
+    # short deque instead of a multiprocessing queue for the display process
+    def __init__(self):
+        self.frame_count = 0
+        self.use_frame = False
+        self.frames = deque(maxlen=3)
+        self.running = True
+
+    def increment(self): self.frame_count += 1
+    def get_count(self): return self.frame_count
+    def set_frame(self, frame): self.frames.append(frame)
+    def get_frame(self): return self.frames.popleft() if self.frames else None
+
+class _Enum:
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+def install_stand_ins():
+    gst = types.SimpleNamespace(
+        PadProbeReturn=_Enum(OK=0, DROP=1, REMOVE=2, PASS=3),
+        State=_Enum(NULL=1, READY=2, PAUSED=3, PLAYING=4),
+        CLOCK_TIME_NONE=2 ** 64 - 1,
+        MapFlags=_Enum(READ=1, WRITE=2),
+        init=lambda *args: None,
+    )
+    gi = types.ModuleType("gi")
+    gi.require_version = lambda *args: None
+    repository = types.ModuleType("gi.repository")
+    repository.Gst = gst
+    repository.GLib = types.SimpleNamespace()
+    gi.repository = repository
+
+    hailo = types.ModuleType("hailo")
+    hailo.HAILO_DETECTION = "HAILO_DETECTION"
+    hailo.HAILO_UNIQUE_ID = "HAILO_UNIQUE_ID"
+    hailo.get_roi_from_buffer = lambda buffer: buffer.roi
+
+    common = types.ModuleType("hailo_apps_infra.hailo_rpi_common")
+    common.get_caps_from_pad = lambda pad: pad.caps
+    # The real one maps the buffer and copies the pixels out before unmapping it
+    common.get_numpy_from_buffer = lambda buffer, format, width, height: buffer.frame.copy()
+    common.app_callback_class = ReplayCallbackClass
+    pipeline = types.ModuleType("hailo_apps_infra.detection_pipeline")
+    pipeline.GStreamerDetectionApp = None
+    infra = types.ModuleType("hailo_apps_infra")
+    infra.hailo_rpi_common = common
+    infra.detection_pipeline = pipeline
+
+    picamera2 = types.ModuleType("picamera2")
+    picamera2.Picamera2 = None
+    libcamera = types.ModuleType("libcamera")
+    libcamera.Transform = None
+
+    sys.modules.update({
+        "gi": gi, "gi.repository": repository, "hailo": hailo,
+        "hailo_apps_infra": infra, "hailo_apps_infra.hailo_rpi_common": common,
+        "hailo_apps_infra.detection_pipeline": pipeline,
+        "picamera2": picamera2, "libcamera": libcamera,
+    })
+
+# -----------------------------------
+# Recorded inputs
+# -----------------------------------
+# Returns (fps or None, {frame index: [ReplayDetection, ...]})
+def load_detections(path):
+    by_frame = {}
+    if path is None:
+        return None, by_frame
+    if path.endswith(".json"):
+        with open(path) as f:
+            data = json.load(f)
+        for entry in data.get("frames", []):
+            by_frame[int(entry["frame"])] = [
+                ReplayDetection(d["bbox"], float(d.get("confidence", 1.0)), int(d.get("track_id", 0)))
+                for d in entry.get("detections", [])]
+        return data.get("fps"), by_frame
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            box = [float(row[k]) for k in ("x_min", "y_min", "x_max", "y_max")]
+            by_frame.setdefault(int(row["frame"]), []).append(
+                ReplayDetection(box, float(row.get("confidence") or 1.0), int(row.get("track_id") or 0)))
+    return None, by_frame
+
+# Fixes as (seconds since the first fix, lat, lon, alt) from the gps_log.csv written by log_gps_info.py
+def load_gps_log(path):
+    fixes = []
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            # The logger writes its header again on every start
+            if len(row) < 3 or row[0] == "Timestamp":
+                continue
+            try:
+                t = datetime.datetime.strptime(row[0], "%Y-%m-%d %H:%M:%S").timestamp()
+                alt = float(row[3]) if len(row) > 3 and row[3] else None
+                fixes.append((t, float(row[1]), float(row[2]), alt))
+            except ValueError:
+                continue
+    return _relative(fixes)
+
+# Fixes from an NMEA log; RMC and GGA sentences with the same UTC time are merged into one fix
+def load_nmea(path):
+    from nmea import parse_sentence
+
+    fixes = {}
+    day = 0
+    last_utc = None
+    with open(path, errors="replace") as f:
+        for line in f:
+            fix = parse_sentence(line)
+            if fix is None or not fix.utc:
+                continue
+            try:
+                utc = int(fix.utc[0:2]) * 3600 + int(fix.utc[2:4]) * 60 + float(fix.utc[4:])
+            except ValueError:
+                continue
+            # Midnight rollover
+            if last_utc is not None and utc < last_utc - 43200:
+                day += 1
+            last_utc = utc
+            t = day * 86400 + utc
+            alt = fix.alt if fix.alt is not None else fixes.get(t, (None,) * 4)[3]
+            fixes[t] = (t, fix.lat, fix.lon, alt)
+    return _relative(sorted(fixes.values()))
+
+def _relative(fixes):
+    if not fixes:
+        return []
+    t0 = fixes[0][0]
+    return [(t - t0, lat, lon, alt) for t, lat, lon, alt in fixes]
+
+# Yields RGB frames, as get_numpy_from_buffer() would return them
+def iter_frames(source, size, count):
+    if source is None:
+        width, height = size
+        frame = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+        for _ in range(count):
+            yield frame.copy()
+    elif os.path.isdir(source):
+        names = sorted(n for n in os.listdir(source) if n.lower().endswith(IMAGE_EXTENSIONS))
+        for name in names:
+            frame = cv2.imread(os.path.join(source, name))
+            if frame is not None:
+                yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    else:
+        capture = cv2.VideoCapture(source)
+        try:
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        finally:
+            capture.release()
+
+def video_fps(source):
+    if source is None or os.path.isdir(source):
+        return None
+    capture = cv2.VideoCapture(source)
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    capture.release()
+    return fps or None
+
+# -----------------------------------
+# Replay
+# -----------------------------------
+# One recorded stream: frames, detection sidecar and the pad its frames arrive on
+class ReplayStream:
+    def __init__(self, stream_id, source, detections_path, args):
+        self.stream_id = stream_id
+        self.source = source
+        sidecar_fps, self.detections = load_detections(detections_path)
+        self.fps = args.fps or sidecar_fps or video_fps(source) or DEFAULT_FPS
+        self.count = args.frames or (max(self.detections) + 1 if self.detections else 0)
+        if source is None and not self.count:
+            sys.exit("--size needs --frames or a detections sidecar")
+        self.size = args.size
+        self.limit = args.frames
+        self.pad = None
+
+    # (pts, order, index, frame) of every frame, order being the stream's position for merging
+    def frames(self, order):
+        for index, frame in enumerate(iter_frames(self.source, self.size, self.count)):
+            if self.limit and index >= self.limit:
+                break
+            yield int(index / self.fps * 1e9), order, index, frame
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q / 100 * len(sorted_values)))]
+
+def replay(args):
+    install_stand_ins()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    target = importlib.import_module(TARGETS[args.target])
+    if hasattr(target, "import_pipeline"):
+        target.import_pipeline()
+    if hasattr(target, "load_calibration"):
+        target.load_calibration()
+    output = open(os.devnull, "w") if args.quiet else sys.stdout
+    setup_logging(logging.DEBUG if args.verbose else logging.INFO, stream=output, debug_signal=False)
+
+    # A single stream looks like a single-source pipeline, with no stream id on its frames
+    sources = [(args.source, args.detections)] + [tuple(stream) for stream in args.stream or []]
+    streams = [ReplayStream(f"sink_{i}" if len(sources) > 1 else "", source, detections, args)
+               for i, (source, detections) in enumerate(sources)]
+    fps = sum(stream.fps for stream in streams)
+
+    user_data = target.user_app_callback_class()
+    user_data.use_frame = args.display
+    if args.target == "detection":
+        # --eager restores the previous behaviour: every frame copied, undistorted and rendered
+        user_data.local_display = args.display or args.eager
+        target.LAZY_FRAMES = not args.eager
+    if args.target == "detection" and args.sample_every:
+        user_data.metrics.sample_every = args.sample_every
+    t0 = time.monotonic()
+    tmp = None
+    if args.target == "detection":
+        from detection_store import DetectionStore, StoreSink
+        from gps_service import Fix, GPSService
+        from record_writer import RecordWriter
+
+        fixes = []
+        if args.gps:
+            fixes = load_gps_log(args.gps)
+        elif args.nmea:
+            fixes = load_nmea(args.nmea)
+        # Fixes are added directly; the service thread is never started
+        user_data.gps = GPSService(None, capacity=max(len(fixes), 1))
+        for t, lat, lon, alt in fixes:
+            user_data.gps.add_fix(Fix(t0 + t + args.gps_offset, lat, lon, alt))
+        if args.out is None:
+            tmp = tempfile.TemporaryDirectory()
+            args.out = os.path.join(tmp.name, "replay.db")
+        user_data.writer = RecordWriter(StoreSink(DetectionStore(args.out)), batch_interval_ms=500,
+                                        overflow="drop_crop")
+        if args.clips:
+            from clip_buffer import ClipEncoder
+            from startup import DEFAULTS
+
+            user_data.clip_config = dict(DEFAULTS["clips"])
+            user_data.clip_encoder = ClipEncoder(args.clips, user_data.clip_config["fps"])
+            user_data.clip_link_dir = os.path.dirname(os.path.abspath(args.out))
+        if args.workers:
+            from postprocess_pool import PostProcessPool
+
+            user_data.postprocess = PostProcessPool(args.workers)
+        if args.vehicles:
+            # Each stream is another vehicle's drive: it only suppresses its own duplicates
+            from spatial_index import SpatialIndex
+            from stream_context import StreamContext
+
+            user_data.streams.factory = lambda stream_id: user_data.add_clips(StreamContext(
+                stream_id, target.calibration, SpatialIndex(target.DEDUP_RADIUS_M), user_data.writer,
+                user_data.gps, track_timeout_s=target.TRACK_TIMEOUT_S))
+        print(f"Replaying with {len(fixes)} GPS fixes, logging to {args.out}")
+
+    base_time = int(t0 * 1e9)
+    latencies = []
+    detection_total = 0
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        # Frames of all streams in timestamp order, as hailoroundrobin would interleave them live
+        merged = heapq.merge(*(stream.frames(order) for order, stream in enumerate(streams)),
+                             key=lambda item: item[:2])
+        for pts, order, index, frame in merged:
+            stream = streams[order]
+            if stream.pad is None:
+                height, width = frame.shape[:2]
+                stream.pad = ReplayPad(("RGB", width, height), base_time)
+            if args.realtime:
+                delay = t0 + pts / 1e9 - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            frame_detections = stream.detections.get(index, [])
+            detection_total += len(frame_detections)
+            info = ReplayProbeInfo(ReplayBuffer(pts, frame, frame_detections, stream.stream_id))
+            with contextlib.redirect_stdout(output):
+                call_start = time.perf_counter()
+                target.app_callback(stream.pad, info, user_data)
+                latencies.append(time.perf_counter() - call_start)
+    except KeyboardInterrupt:
+        print("Replay interrupted")
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    if args.target == "detection":
+        with contextlib.redirect_stdout(output):
+            user_data.metrics.end_frames()
+            if user_data.postprocess is not None:
+                user_data.postprocess.wait()
+                target.apply_pool_results(user_data)
+                user_data.postprocess.close()
+            for stream in user_data.streams:
+                target.log_tracks(stream, stream.pool_finished + stream.tracks.flush(), user_data.metrics)
+        user_data.writer.close()
+        if user_data.clip_encoder is not None:
+            for stream in user_data.streams:
+                stream.clips.flush()
+            user_data.clip_encoder.close()
+        shutdown_logging()
+        print(f"Track aggregation: {user_data.track_stats()}")
+        print(f"Pothole writer drained: {user_data.writer.stats()}")
+        print(user_data.metrics.flame_summary())
+        print(user_data.streams.report())
+        if user_data.postprocess is not None:
+            print(f"Post-processing pool: {user_data.postprocess.stats()}")
+        if user_data.clip_encoder is not None:
+            print(f"Pothole clips: {user_data.clip_encoder.stats()}")
+        pixels = user_data.frame_stats()
+        print(f"Frame pixels copied: {pixels['mb_copied']:.1f} MB of {pixels['mb_eager']:.1f} MB "
+              f"({pixels['copied_share']:.1%}; {pixels['full_frames']} full frames, "
+              f"{pixels['crop_bands']} crop bands)")
+    elif hasattr(user_data, "report"):
+        user_data.report(args.report)
+    if tmp is not None:
+        tmp.cleanup()
+
+    report(latencies, detection_total, elapsed, fps, cpu)
+
+def report(latencies, detections, elapsed, fps, cpu=None):
+    frames = len(latencies)
+    ms = sorted(l * 1000 for l in latencies)
+    print("\n--- Replay Summary ---")
+    print(f"Frames: {frames} ({detections} detections, recorded at {fps:.1f} fps)")
+    if not frames:
+        return
+    print(f"Callback latency ms: mean {sum(ms) / frames:.3f} | p50 {percentile(ms, 50):.3f} | "
+          f"p90 {percentile(ms, 90):.3f} | p99 {percentile(ms, 99):.3f} | max {ms[-1]:.3f}")
+    print(f"Callback throughput: {frames / (sum(ms) / 1000):.1f} fps")
+    print(f"Wall clock: {elapsed:.2f} s ({frames / elapsed:.1f} fps including frame decode)")
+    if cpu is not None:
+        print(f"Process CPU: {cpu:.2f} s ({cpu / frames * 1000:.2f} ms/frame including frame decode)")
+    print("----------------------")
+
+def parse_size(value):
+    width, _, height = value.lower().partition("x")
+    return int(width), int(height)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded frames and detections through app_callback")
+    parser.add_argument("source", nargs="?", help="video file or directory of images")
+    parser.add_argument("--detections", help="JSON or CSV detection sidecar")
+    parser.add_argument("--stream", nargs=2, action="append", metavar=("SOURCE", "DETECTIONS"),
+                        help="another stream through the same callback (repeatable)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="detection target: score crops in this many worker processes")
+    parser.add_argument("--vehicles", action="store_true",
+                        help="detection target: streams are separate vehicles with their own duplicate suppression")
+    gps = parser.add_mutually_exclusive_group()
+    gps.add_argument("--gps", help="gps_log.csv recorded by log_gps_info.py")
+    gps.add_argument("--nmea", help="NMEA sentence log")
+    parser.add_argument("--gps-offset", type=float, default=0.0,
+                        help="seconds between the first fix and the first frame")
+    parser.add_argument("--target", choices=sorted(TARGETS), default="detection")
+    parser.add_argument("--fps", type=float, help="override the recorded frame rate")
+    parser.add_argument("--frames", type=int, help="stop after this many frames")
+    parser.add_argument("--size", type=parse_size, default=(640, 480),
+                        help="synthetic frame size WxH when no source is given")
+    parser.add_argument("--realtime", action="store_true", help="pace frames at the recorded frame rate")
+    parser.add_argument("--display", action="store_true", help="set use_frame, as when the preview window is open")
+    parser.add_argument("--eager", action="store_true",
+                        help="detection target: copy and render every frame, as before frames were lazy")
+    parser.add_argument("--out", help="detection store to log into (default: a temporary one)")
+    parser.add_argument("--clips", help="detection target: write a clip per logged pothole into this directory")
+    parser.add_argument("--sample-every", type=int, help="detection target: time the stages of every Nth frame")
+    parser.add_argument("--report", help="benchmark target: write its JSON report to this path")
+    parser.add_argument("--quiet", action="store_true", help="discard the callback's console output")
+    parser.add_argument("--verbose", action="store_true", help="log at DEBUG, as after SIGUSR1 on the device")
+    replay(parser.parse_args())
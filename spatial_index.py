@@ -0,0 +1,135 @@
+# spatial_index.py
+# Fixed-metre grid hash over every logged pothole, used for duplicate suppression across the
+# whole survey. Latitude is cut into rows cell_m high; each row is cut into longitude cells at
+# least cell_m wide along the row's poleward edge. Since cell_m >= radius_m, every pothole within
+# radius_m of a point is in the point's row or the two next to it, in at most a couple of cells
+# each, so a lookup is O(1) regardless of how many potholes have been logged.
+
+import math
+import numpy as np
+
+EARTH_RADIUS_M = 6371000
+M_PER_DEG_LAT = math.pi * EARTH_RADIUS_M / 180
+
+def haversine_np(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_RADIUS_M * 2 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+class SpatialIndex:
+    def __init__(self, radius_m=5.0, cell_m=None, capacity=1024):
+        self.radius_m = radius_m
+        self.cell_m = max(cell_m or radius_m, radius_m)
+        self.dlat = self.cell_m / M_PER_DEG_LAT
+        self._cells = {}  # (row, col) -> list of point indices
+        self._rows = {}
+        self._lat = np.empty(capacity, dtype=np.float64)
+        self._lon = np.empty(capacity, dtype=np.float64)
+        self.ids = []
+        self.size = 0
+
+    @classmethod
+    def from_store(cls, store, radius_m=5.0, **kwargs):
+        index = cls(radius_m, **kwargs)
+        for record in store.iter_records():
+            if record["latitude"] is not None and record["longitude"] is not None:
+                index.add(record["latitude"], record["longitude"], record["id"])
+        return index
+
+    def __len__(self):
+        return self.size
+
+    def _row(self, lat):
+        return math.floor(lat / self.dlat)
+
+    def _cos_poleward(self, row):
+        edge = max(abs(row * self.dlat), abs((row + 1) * self.dlat))
+        return max(math.cos(math.radians(min(edge, 89.9))), 1e-6)
+
+    # Longitude cell width of a row, and the longitude span of radius_m where the row is narrowest
+    def _row_geometry(self, row):
+        geometry = self._rows.get(row)
+        if geometry is None:
+            m_per_deg_lon = M_PER_DEG_LAT * self._cos_poleward(row)
+            geometry = (self.cell_m / m_per_deg_lon, self.radius_m / m_per_deg_lon)
+            self._rows[row] = geometry
+        return geometry
+
+    def add(self, lat, lon, record_id=None):
+        if self.size == len(self._lat):
+            self._lat = np.resize(self._lat, self.size * 2)
+            self._lon = np.resize(self._lon, self.size * 2)
+        i = self.size
+        self._lat[i] = lat
+        self._lon[i] = lon
+        self.ids.append(record_id)
+        self.size += 1
+
+        row = self._row(lat)
+        key = (row, math.floor(lon / self._row_geometry(row)[0]))
+        bucket = self._cells.get(key)
+        if bucket is None:
+            self._cells[key] = [i]
+        else:
+            bucket.append(i)
+        return i
+
+    def candidates(self, lat, lon):
+        row = self._row(lat)
+        found = []
+        for r in (row - 1, row, row + 1):
+            dlon, reach = self._row_geometry(r)
+            for col in range(math.floor((lon - reach) / dlon), math.floor((lon + reach) / dlon) + 1):
+                bucket = self._cells.get((r, col))
+                if bucket:
+                    found.extend(bucket)
+        return found
+
+    def near(self, lat, lon, radius_m=None):
+        radius_m = self.radius_m if radius_m is None else min(radius_m, self.radius_m)
+        # A single query only ever has a handful of candidates, plain math beats numpy here
+        phi1 = math.radians(lat)
+        cos_phi1 = math.cos(phi1)
+        for i in self.candidates(lat, lon):
+            phi2 = math.radians(self._lat[i])
+            a = (math.sin((phi2 - phi1) / 2) ** 2
+                 + cos_phi1 * math.cos(phi2) * math.sin(math.radians(self._lon[i] - lon) / 2) ** 2)
+            if EARTH_RADIUS_M * 2 * math.asin(math.sqrt(min(a, 1.0))) <= radius_m:
+                return True
+        return False
+
+    # (distance m, point index) of every point within radius_m, nearest first
+    def within(self, lat, lon, radius_m=None):
+        radius_m = self.radius_m if radius_m is None else min(radius_m, self.radius_m)
+        phi1 = math.radians(lat)
+        cos_phi1 = math.cos(phi1)
+        found = []
+        for i in self.candidates(lat, lon):
+            phi2 = math.radians(self._lat[i])
+            a = (math.sin((phi2 - phi1) / 2) ** 2
+                 + cos_phi1 * math.cos(phi2) * math.sin(math.radians(self._lon[i] - lon) / 2) ** 2)
+            distance = EARTH_RADIUS_M * 2 * math.asin(math.sqrt(min(a, 1.0)))
+            if distance <= radius_m:
+                found.append((distance, i))
+        found.sort()
+        return found
+
+    # Checks every detection of a frame at once: candidate pairs from the grid are gathered for
+    # all queries and their distances computed in a single vectorized haversine
+    def near_batch(self, lats, lons, radius_m=None):
+        radius_m = self.radius_m if radius_m is None else min(radius_m, self.radius_m)
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        result = np.zeros(len(lats), dtype=bool)
+        query_idx = []
+        point_idx = []
+        for q, (lat, lon) in enumerate(zip(lats.tolist(), lons.tolist())):
+            found = self.candidates(lat, lon)
+            query_idx.extend([q] * len(found))
+            point_idx.extend(found)
+        if point_idx:
+            query_idx = np.asarray(query_idx)
+            point_idx = np.asarray(point_idx)
+            hit = haversine_np(lats[query_idx], lons[query_idx], self._lat[point_idx], self._lon[point_idx]) <= radius_m
+            result[query_idx[hit]] = True
+        return result
@@ -0,0 +1,55 @@
+# spatial_index_benchmark.py
+# Duplicate-check cost against surveys of increasing size: grid hash lookups (single and
+# per-frame batch) versus a brute-force vectorized haversine over every logged pothole.
+
+import time
+import numpy as np
+
+from spatial_index import SpatialIndex, haversine_np, M_PER_DEG_LAT
+
+RADIUS_M = 5.0
+SURVEY_SIZES = [10_000, 100_000, 500_000]
+QUERIES = 5_000
+DETECTIONS_PER_FRAME = 4
+
+def random_points(rng, count, center=(-33.95, 18.45), extent_m=20_000):
+    lat = center[0] + rng.uniform(-0.5, 0.5, count) * extent_m / M_PER_DEG_LAT
+    lon = center[1] + rng.uniform(-0.5, 0.5, count) * extent_m / (M_PER_DEG_LAT * np.cos(np.radians(center[0])))
+    return lat, lon
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    print(f"--- Duplicate check within {RADIUS_M} m ---")
+    for size in SURVEY_SIZES:
+        lats, lons = random_points(rng, size)
+        start = time.perf_counter()
+        index = SpatialIndex(RADIUS_M)
+        for lat, lon in zip(lats.tolist(), lons.tolist()):
+            index.add(lat, lon)
+        build = time.perf_counter() - start
+
+        # Half the queries revisit logged potholes, half are new positions
+        q_lat, q_lon = random_points(rng, QUERIES)
+        q_lat[::2] = lats[:QUERIES:2] + 1e-6
+        q_lon[::2] = lons[:QUERIES:2]
+
+        start = time.perf_counter()
+        single = [index.near(a, b) for a, b in zip(q_lat.tolist(), q_lon.tolist())]
+        single_us = (time.perf_counter() - start) / QUERIES * 1e6
+
+        start = time.perf_counter()
+        batched = np.concatenate([
+            index.near_batch(q_lat[i:i + DETECTIONS_PER_FRAME], q_lon[i:i + DETECTIONS_PER_FRAME])
+            for i in range(0, QUERIES, DETECTIONS_PER_FRAME)
+        ])
+        batch_us = (time.perf_counter() - start) / (QUERIES / DETECTIONS_PER_FRAME) * 1e6
+
+        brute_n = 200
+        start = time.perf_counter()
+        brute = [(haversine_np(a, b, lats, lons) <= RADIUS_M).any() for a, b in zip(q_lat[:brute_n], q_lon[:brute_n])]
+        brute_us = (time.perf_counter() - start) / brute_n * 1e6
+
+        assert list(batched) == single and single[:brute_n] == brute
+        print(f"{size:>7} potholes: build {build:6.2f} s | near {single_us:6.1f} us | "
+              f"near_batch({DETECTIONS_PER_FRAME}) {batch_us:6.1f} us/frame | brute force {brute_us:9.1f} us "
+              f"| {sum(single)} duplicates")
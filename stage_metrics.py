@@ -0,0 +1,210 @@
+# stage_metrics.py
+# Low-overhead per-stage timers for the detection callback. Stages are declared once as a tree;
+# every stage owns preallocated counters (calls, total, max, fixed histogram buckets) indexed by an
+# integer id, so timing a stage on the hot path is one perf_counter_ns() call and a few list
+# updates. With sample_every > 1 only every Nth frame is timed. The aggregates are served as
+# Prometheus text or JSON from a small local HTTP server and printed as a flame-style tree at
+# shutdown.
+
+import json
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds of the histogram buckets; the last one is +Inf
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+_BUCKET_NS = tuple(int(b * 1e9) for b in BUCKETS)
+
+class StageMetrics:
+    # stages is a list of (name, parent name or None); the first one is the root
+    def __init__(self, stages, sample_every=1):
+        self.names = [name for name, _ in stages]
+        index = {name: i for i, name in enumerate(self.names)}
+        self.parents = [index[parent] if parent is not None else None for _, parent in stages]
+        self.sample_every = max(1, int(sample_every))
+
+        n = len(stages)
+        self.total_ns = [0] * n
+        self.max_ns = [0] * n
+        self.buckets = [[0] * (len(BUCKETS) + 1) for _ in range(n)]
+        self.frames = 0
+        self.sampled_frames = 0
+        self.sampled = False
+
+    def stage(self, name):
+        return self.names.index(name)
+
+    # Call at the top of every frame. Returns the frame's start time, or 0 when it isn't sampled.
+    def start_frame(self):
+        self.frames += 1
+        self.sampled = self.frames % self.sample_every == 0
+        if not self.sampled:
+            return 0
+        self.sampled_frames += 1
+        return time.perf_counter_ns()
+
+    # Call once the frames are over: stages run afterwards (the shutdown flush) belong to no frame
+    # and aren't timed
+    def end_frames(self):
+        self.sampled = False
+
+    # Start time for a stage inside the current frame, 0 when the frame isn't sampled
+    def now(self):
+        return time.perf_counter_ns() if self.sampled else 0
+
+    # Records the time since `start` against the stage and returns the current time, so sequential
+    # stages can be chained: t = metrics.lap(EXTRACT, t); ...; t = metrics.lap(DECODE, t).
+    # Globals are bound as defaults and the call count is the bucket total, to keep this short.
+    def lap(self, stage, start, _clock=time.perf_counter_ns, _bisect=bisect_left, _bounds=_BUCKET_NS):
+        if not start:
+            return 0
+        now = _clock()
+        elapsed = now - start
+        self.total_ns[stage] += elapsed
+        if elapsed > self.max_ns[stage]:
+            self.max_ns[stage] = elapsed
+        self.buckets[stage][_bisect(_bounds, elapsed)] += 1
+        return now
+
+    # ---- reports ---- #
+    @property
+    def calls(self):
+        return [sum(b) for b in self.buckets]
+
+    def children(self, stage):
+        return [i for i, parent in enumerate(self.parents) if parent == stage]
+
+    def self_ns(self, stage):
+        return self.total_ns[stage] - sum(self.total_ns[c] for c in self.children(stage))
+
+    def path(self, stage):
+        names = []
+        while stage is not None:
+            names.append(self.names[stage])
+            stage = self.parents[stage]
+        return ";".join(reversed(names))
+
+    def to_dict(self):
+        calls = self.calls
+        return {
+            "frames": self.frames,
+            "sampled_frames": self.sampled_frames,
+            "sample_every": self.sample_every,
+            "stages": {
+                name: {
+                    "parent": self.names[self.parents[i]] if self.parents[i] is not None else None,
+                    "calls": calls[i],
+                    "total_ms": self.total_ns[i] / 1e6,
+                    "mean_us": self.total_ns[i] / calls[i] / 1e3 if calls[i] else 0.0,
+                    "max_us": self.max_ns[i] / 1e3,
+                    "per_frame_us": self.total_ns[i] / self.sampled_frames / 1e3 if self.sampled_frames else 0.0,
+                }
+                for i, name in enumerate(self.names)
+            },
+        }
+
+    def prometheus(self, prefix="pothole", gauges=None):
+        lines = [
+            f"# HELP {prefix}_frames_total Frames seen by the callback",
+            f"# TYPE {prefix}_frames_total counter",
+            f"{prefix}_frames_total {self.frames}",
+            f"# HELP {prefix}_sampled_frames_total Frames whose stages were timed",
+            f"# TYPE {prefix}_sampled_frames_total counter",
+            f"{prefix}_sampled_frames_total {self.sampled_frames}",
+            f"# HELP {prefix}_stage_seconds Time spent per callback stage on sampled frames",
+            f"# TYPE {prefix}_stage_seconds histogram",
+        ]
+        for i, name in enumerate(self.names):
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), self.buckets[i]):
+                cumulative += count
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {self.total_ns[i] / 1e9:.9f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {cumulative}')
+        lines += [f"# HELP {prefix}_stage_max_seconds Slowest single call per stage",
+                  f"# TYPE {prefix}_stage_max_seconds gauge"]
+        for i, name in enumerate(self.names):
+            lines.append(f'{prefix}_stage_max_seconds{{stage="{name}"}} {self.max_ns[i] / 1e9:.9f}')
+        for key, value in (gauges or {}).items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"{prefix}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+    # Indented stage tree with total and self time as a share of the root, like a flame graph
+    # turned on its side. When folded_path is given the self times are also written in the
+    # folded-stack format read by flamegraph.pl / speedscope.
+    def flame_summary(self, folded_path=None):
+        root_ns = self.total_ns[0] or 1
+        calls = self.calls
+        lines = [f"--- Callback stages ({self.sampled_frames} of {self.frames} frames timed) ---",
+                 f"{'stage':<28} | {'total %':>7} | {'self %':>6} | {'per frame us':>12} | {'calls':>8} | {'max us':>9}"]
+
+        def walk(stage, depth):
+            per_frame = self.total_ns[stage] / self.sampled_frames / 1e3 if self.sampled_frames else 0.0
+            share = self.total_ns[stage] / root_ns * 100
+            bar = "#" * int(share / 5)
+            lines.append(f"{'  ' * depth + self.names[stage]:<28} | {share:>6.1f}% | "
+                         f"{self.self_ns(stage) / root_ns * 100:>5.1f}% | {per_frame:>12.1f} | "
+                         f"{calls[stage]:>8} | {self.max_ns[stage] / 1e3:>9.1f} {bar}")
+            for child in self.children(stage):
+                walk(child, depth + 1)
+
+        walk(0, 0)
+        if folded_path:
+            with open(folded_path, "w") as f:
+                for i in range(len(self.names)):
+                    self_us = self.self_ns(i) // 1000
+                    if self_us > 0:
+                        f.write(f"{self.path(i)} {self_us}\n")
+        return "\n".join(lines)
+
+# -----------------------------------
+# Local metrics endpoint
+# -----------------------------------
+class MetricsServer:
+    # Serves GET /metrics (Prometheus text) and GET /metrics.json from a daemon thread. gauges is an
+    # optional callable returning a flat dict of extra numbers (queue depths, fix counts, ...).
+    def __init__(self, metrics, host="127.0.0.1", port=9108, gauges=None):
+        self.metrics = metrics
+        self.gauges = gauges or (lambda: {})
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = server.metrics.prometheus(gauges=server.gauges()).encode()
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    report = server.metrics.to_dict()
+                    report["gauges"] = server.gauges()
+                    body = json.dumps(report).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,153 @@
+# startup.py
+# Startup configuration and phase timing for the detector. Settings come from a JSON file
+# (pothole_detection.json next to the scripts, or the path given by --config / $POTHOLE_CONFIG);
+# keys left out keep the defaults below, so a missing or partial file is a valid configuration.
+# StartupTimer records how long each startup phase took, including phases running on other
+# threads, and prints the breakdown once the first frame has arrived.
+
+import copy
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+log = logging.getLogger("pothole.startup")
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+CONFIG_FILE = os.path.join(base_dir, "pothole_detection.json")
+CONFIG_ENV = "POTHOLE_CONFIG"
+
+DEFAULTS = {
+    "calibration_file": "new_camera_calibration.npz",
+    # prompt | missing (calibrate only without a calibration file) | never |
+    # auto (prompt when started from a terminal, otherwise missing)
+    "recalibrate": "auto",
+    "db_path": "pothole_log.db",
+    # port: modem AT port such as /dev/ttyUSB2; None probes /dev/ttyUSB* in the background.
+    # stream: read the NMEA port (nmea_port, None listens on /dev/ttyUSB* for sentences) and fall
+    # back to polling AT+CGPSINFO every poll_interval s only if nothing streams within probe_s.
+    # nmea_rate_command is sent on the AT port first, e.g. "AT+CGPSNMEARATE=1" for 10 Hz.
+    "gps": {"enabled": True, "port": None, "baudrate": 115200, "poll_interval": 0.2,
+            "stream": True, "nmea_port": None, "probe_s": 3.0, "nmea_rate_command": None},
+    "camera": {"prewarm": True, "prewarm_s": 2.0, "size": [640, 480]},
+    "metrics": {"enabled": True, "host": "127.0.0.1", "port": 9108},
+    "preview": {"enabled": True, "host": "0.0.0.0", "port": 8090},
+    "log": {"level": "INFO", "rate_limit_s": 5.0, "json": False},
+    # Several cameras through one pipeline, each entry merged over STREAM_DEFAULTS. Empty: the
+    # single camera or file given by the hailo app's --input.
+    "streams": [],
+    # Video clip around each logged pothole, linked from its record. Each stream keeps the last
+    # ring_s s at fps, downscaled to width x height, within max_mb; dir is relative to the scripts.
+    "clips": {"enabled": True, "dir": "clips", "pre_s": 2.0, "post_s": 2.0, "fps": 10.0,
+              "width": 320, "height": 240, "ring_s": 8.0, "max_mb": 16},
+    # Crop scoring in worker processes over a shared-memory frame ring (postprocess_pool.py);
+    # 0 workers scores inline. slots None: two per worker. backpressure: block | drop.
+    "postprocess": {"workers": 0, "slots": None, "backpressure": "block", "wait_ms": 50},
+    # Store-and-forward upload of the log to url (sync_agent.py); device None is the hostname and
+    # cursor_file, relative to the scripts, keeps the upload position across restarts
+    "sync": {"enabled": False, "url": None, "token": None, "device": None, "cursor_file": "sync_cursor.json",
+             "batch_records": 200, "gzip_level": 6, "interval_s": 10.0, "timeout_s": 20.0, "max_backoff_s": 300.0},
+}
+# source: camera ("rpi", "/dev/video0") or video file; calibration_file: None uses the top-level
+# one; vehicle: streams of one vehicle share its GPS and duplicate suppression. Each stream gets
+# the id the pipeline tags its frames with, its hailoroundrobin pad "sink_<index>".
+STREAM_DEFAULTS = {"name": None, "source": "rpi", "calibration_file": None, "vehicle": "default"}
+# Relative paths in the config are resolved against the scripts' directory
+PATH_KEYS = ("calibration_file", "db_path")
+
+def _merge(defaults, overrides, prefix=""):
+    merged = copy.deepcopy(defaults)
+    for key, value in overrides.items():
+        if key not in defaults:
+            log.warning("Unknown config key %s%s ignored", prefix, key)
+        elif isinstance(defaults[key], dict) and isinstance(value, dict):
+            merged[key] = _merge(defaults[key], value, f"{prefix}{key}.")
+        else:
+            merged[key] = value
+    return merged
+
+def load_config(path=None):
+    path = path or os.environ.get(CONFIG_ENV) or CONFIG_FILE
+    overrides = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            overrides = json.load(f)
+    elif path != CONFIG_FILE:
+        raise FileNotFoundError(f"Config file not found: {path}")
+    config = _merge(DEFAULTS, overrides)
+    for key in PATH_KEYS:
+        config[key] = os.path.join(base_dir, os.path.expanduser(config[key]))
+    config["clips"]["dir"] = os.path.join(base_dir, os.path.expanduser(config["clips"]["dir"]))
+    config["sync"]["cursor_file"] = os.path.join(base_dir, os.path.expanduser(config["sync"]["cursor_file"]))
+    streams = []
+    for index, stream in enumerate(config["streams"]):
+        stream = _merge(STREAM_DEFAULTS, stream, f"streams[{index}].")
+        stream["id"] = f"sink_{index}"
+        stream["name"] = stream["name"] or stream["id"]
+        calibration_file = stream["calibration_file"]
+        stream["calibration_file"] = (os.path.join(base_dir, os.path.expanduser(calibration_file))
+                                      if calibration_file else config["calibration_file"])
+        streams.append(stream)
+    config["streams"] = streams
+    if config["recalibrate"] == "auto":
+        config["recalibrate"] = "prompt" if sys.stdin is not None and sys.stdin.isatty() else "missing"
+    config["source"] = path if os.path.exists(path) else None
+    return config
+
+# -----------------------------------
+# Phase timing
+# -----------------------------------
+class StartupTimer:
+    # started is the time.monotonic() the process began its imports
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.monotonic()
+        self.phases = []  # (name, start, end, thread name)
+        self.first_frame = None
+        self._lock = threading.Lock()
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def add(self, name, start, end):
+        with self._lock:
+            self.phases.append((name, start, end, threading.current_thread().name))
+
+    # Runs fn(*args) as a timed phase on a daemon thread and returns the thread
+    def background(self, name, fn, *args):
+        def run():
+            with self.phase(name):
+                fn(*args)
+
+        thread = threading.Thread(target=run, name=name, daemon=True)
+        thread.start()
+        return thread
+
+    def mark_first_frame(self):
+        if self.first_frame is None:
+            self.first_frame = time.monotonic()
+
+    def report(self):
+        end = self.first_frame or time.monotonic()
+        label = "to first frame" if self.first_frame else "so far, no frame yet"
+        lines = [f"--- Startup: {end - self.started:.2f} s {label} ---",
+                 f"{'phase':<24} | {'start s':>7} | {'took s':>6} | thread"]
+        with self._lock:
+            phases = sorted(self.phases, key=lambda p: p[1])
+        for name, start, stop, thread in phases:
+            lines.append(f"{name:<24} | {start - self.started:>7.2f} | {stop - start:>6.2f} | {thread}")
+        return "\n".join(lines)
+
+class _Phase:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, self.start, time.monotonic())
+        return False
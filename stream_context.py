@@ -0,0 +1,156 @@
+# stream_context.py
+# Per-stream state for running several cameras (or several recorded drives) through one Hailo
+# pipeline. Everything the callback keeps between frames of one stream lives on its StreamContext:
+# the calibration that undistorts and sizes its boxes, its pothole tracks, the duplicate index and
+# GPS service of the vehicle it is mounted on, the writer its records go to, its frame buffers and
+# its throughput counters. StreamRegistry finds a frame's context from its stream id.
+
+import numpy as np
+
+from ground_plane import GroundPlane, legacy_box_areas_m2
+from lazy_frame import FrameAccounting, FrameRing
+from track_aggregator import TrackAggregator
+from undistortion import Undistorter
+
+class Calibration:
+    # The camera intrinsics, the pixel scale of the distance calibration and the ground-plane
+    # homography (None in calibration files from before it, which use the legacy estimate)
+    def __init__(self, K, dist, mm_per_pixel, ref_pixel_width, ground_plane=None, path=None):
+        self.K = K
+        self.dist = dist
+        self.undistorter = Undistorter(K, dist)
+        self.mm_per_pixel = mm_per_pixel
+        self.ref_pixel_width = ref_pixel_width
+        self.ground_plane = ground_plane
+        self.path = path
+        if ground_plane is not None:
+            ground_plane.lut(*ground_plane.image_size)
+
+    @classmethod
+    def from_file(cls, path):
+        data = np.load(path)
+        return cls(data['K'], data['dist'], data['mm_per_pixel'], data['ref_pixel_width'],
+                   GroundPlane.from_calibration(data), path=path)
+
+    # Ground areas (m2) of Nx4 undistorted, clipped boxes, one vectorized call per frame
+    def estimate_areas(self, boxes, width, height):
+        if self.ground_plane is not None and width and height:
+            return self.ground_plane.box_areas_m2(boxes, width, height)
+        return legacy_box_areas_m2(boxes, self.mm_per_pixel, self.ref_pixel_width)
+
+class StreamContext:
+    # stream_id is what the pipeline tags the stream's buffers with (hailoroundrobin's sink pad,
+    # e.g. "sink_1"); None binds the context to the first id that isn't configured otherwise.
+    # potholes and gps are shared by the streams of one vehicle; writer by all streams.
+    def __init__(self, stream_id, calibration, potholes, writer=None, gps=None, name=None,
+                 track_timeout_s=1.0):
+        self.stream_id = stream_id
+        self.name = name or stream_id or "default"
+        self.calibration = calibration
+        self.potholes = potholes
+        self.writer = writer
+        self.gps = gps
+        self.tracks = TrackAggregator(timeout_s=track_timeout_s)
+        self.frame_stats = FrameAccounting()
+        # RGB frame the display path remaps and annotates, and the BGR slots handed to set_frame
+        self.work_frame = FrameRing(count=1)
+        self.frame_ring = FrameRing()
+        # ClipRecorder of the stream's pre/post-event clips, None when clips are off
+        self.clips = None
+        # Tracks that ended when the post-processing pool returned their crops; logged with the
+        # stream's next frame, in its log_tracks stage
+        self.pool_finished = []
+
+        self.frames = 0
+        self.detections = 0
+        self.logged = 0
+        self.duplicates = 0
+        self.busy_s = 0.0
+        self.first_time = None
+        self.last_time = None
+
+    # Called once per frame with the frame's monotonic time and the callback time it took
+    def count_frame(self, frame_time, busy_s):
+        self.frames += 1
+        self.busy_s += busy_s
+        if self.first_time is None:
+            self.first_time = frame_time
+        self.last_time = frame_time
+
+    def stats(self):
+        span = (self.last_time - self.first_time) if self.frames > 1 else 0.0
+        return {
+            "frames": self.frames,
+            # Frames per second of stream time, and what the callback alone could sustain
+            "fps": (self.frames - 1) / span if span > 0 else 0.0,
+            "callback_fps": self.frames / self.busy_s if self.busy_s else 0.0,
+            "callback_ms": self.busy_s / self.frames * 1000 if self.frames else 0.0,
+            "detections": self.detections,
+            "logged": self.logged,
+            "duplicates": self.duplicates,
+        }
+
+class StreamRegistry:
+    # factory(stream_id) builds the context of a stream id seen for the first time when no
+    # configured context is left to bind it to
+    def __init__(self, factory=None):
+        self.factory = factory
+        self.contexts = []
+        self._by_id = {}
+
+    def add(self, context):
+        self.contexts.append(context)
+        if context.stream_id is not None:
+            self._by_id[context.stream_id] = context
+        return context
+
+    def get(self, stream_id):
+        context = self._by_id.get(stream_id)
+        if context is not None:
+            return context
+        for context in self.contexts:
+            if context.stream_id is None:
+                context.stream_id = stream_id
+                if context.name == "default" and len(self.contexts) > 1:
+                    context.name = str(stream_id)
+                break
+        else:
+            if self.factory is None:
+                raise KeyError(f"No stream configured for id {stream_id!r}")
+            context = self.add(self.factory(stream_id))
+        self._by_id[stream_id] = context
+        return context
+
+    def __iter__(self):
+        return iter(self.contexts)
+
+    def __len__(self):
+        return len(self.contexts)
+
+    # Totals over all streams; fps is their sum, the rate the shared accelerator handles
+    def aggregate(self):
+        stats = [context.stats() for context in self.contexts]
+        busy_s = sum(context.busy_s for context in self.contexts)
+        frames = sum(s["frames"] for s in stats)
+        return {
+            "streams": len(stats),
+            "frames": frames,
+            "fps": sum(s["fps"] for s in stats),
+            "callback_fps": frames / busy_s if busy_s else 0.0,
+            "callback_ms": busy_s / frames * 1000 if frames else 0.0,
+            "detections": sum(s["detections"] for s in stats),
+            "logged": sum(s["logged"] for s in stats),
+            "duplicates": sum(s["duplicates"] for s in stats),
+        }
+
+    def report(self):
+        lines = [f"{'stream':<12} | {'frames':>7} | {'fps':>6} | {'cb ms':>6} | {'cb fps':>7} | "
+                 f"{'dets':>6} | {'logged':>6} | {'dups':>5}"]
+        rows = [(context.name, context.stats()) for context in self.contexts]
+        if len(rows) > 1:
+            rows.append(("all", self.aggregate()))
+        for name, s in rows:
+            lines.append(f"{name:<12} | {s['frames']:>7} | {s['fps']:>6.1f} | {s['callback_ms']:>6.2f} | "
+                         f"{s['callback_fps']:>7.0f} | {s['detections']:>6} | {s['logged']:>6} | "
+                         f"{s['duplicates']:>5}")
+        return "\n".join(lines)
@@ -0,0 +1,299 @@
+# sync_agent.py
+# Store-and-forward upload of the detection log to a central server over an intermittent link.
+# A background thread reads the records committed after its durable cursor (sync_cursor.json),
+# and POSTs them with their crops as gzipped JSON batches over one kept-alive HTTP connection.
+# The cursor only moves once the server has acknowledged a batch.
+#
+# Every batch has an id made of the device, the log and its record range. The range is written to
+# the cursor file before the batch is sent, so after a failure (or a restart) exactly the same
+# batch is sent again, and a server that already has it just acknowledges it: nothing is lost or
+# duplicated whether the request, the server or the acknowledgement failed. While the network is
+# down the agent backs off exponentially with jitter; timeouts also shrink the batches that follow,
+# which grow back as uploads succeed.
+#
+#   python3 sync_agent.py http://server:8000/batches [--db pothole_log.db] [--once]
+
+import argparse
+import base64
+import gzip
+import http.client
+import itertools
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import urllib.parse
+import uuid
+
+from detection_store import DEFAULT_DB, FIELDS, DetectionStore
+
+log = logging.getLogger("pothole.sync")
+
+DEFAULT_CURSOR = "sync_cursor.json"
+MIN_BATCH_RECORDS = 10
+
+class SyncError(Exception):
+    pass
+
+class SyncCursor:
+    # last_id: the last record the server acknowledged. pending: [batch id, first id, last id] of the
+    # batch sent but not yet acknowledged. log_id tells this log's batches from those of a log
+    # recreated under the same path.
+    def __init__(self, path):
+        self.path = path
+        self.last_id = 0
+        self.pending = None
+        self.log_id = None
+        try:
+            with open(path) as f:
+                state = json.load(f)
+            self.last_id, self.pending, self.log_id = state["last_id"], state["pending"], state["log_id"]
+        except FileNotFoundError:
+            pass
+        if self.log_id is None:
+            self.reset()
+
+    def reset(self):
+        self.last_id = 0
+        self.pending = None
+        self.log_id = uuid.uuid4().hex[:12]
+        self.save()
+
+    def save(self):
+        partial = self.path + ".part"
+        with open(partial, "w") as f:
+            json.dump({"last_id": self.last_id, "pending": self.pending, "log_id": self.log_id}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(partial, self.path)
+
+class Uploader:
+    # One keep-alive connection, reopened after errors
+    def __init__(self, url, timeout_s=20.0, token=None):
+        parts = urllib.parse.urlsplit(url)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path or "/"
+        self.timeout_s = timeout_s
+        self.token = token
+        self.conn = None
+        self.connections = 0
+
+    def post(self, body, headers):
+        headers = dict(headers, **({"Authorization": f"Bearer {self.token}"} if self.token else {}))
+        # A kept-alive connection the server has since closed fails on first use; batches are
+        # idempotent, so the request is simply made again on a new connection
+        for retry in (True, False):
+            reused = self.conn is not None
+            if not reused:
+                self.conn = self.connection_class(self.host, self.port, timeout=self.timeout_s)
+                self.connections += 1
+            try:
+                self.conn.request("POST", self.path, body, headers)
+                response = self.conn.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                self.close()
+                if retry and reused:
+                    continue
+                raise
+            except (OSError, http.client.HTTPException):
+                self.close()
+                raise
+            if response.will_close:
+                self.close()
+            return response.status, data
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+class SyncAgent:
+    def __init__(self, db_path, url, cursor_path=DEFAULT_CURSOR, device=None, batch_records=200,
+                 compress_level=6, interval_s=10.0, timeout_s=20.0, min_backoff_s=2.0, max_backoff_s=300.0,
+                 token=None):
+        self.db_path = db_path
+        self.uploader = Uploader(url, timeout_s, token)
+        self.cursor = SyncCursor(cursor_path)
+        self.device = device or socket.gethostname()
+        self.max_batch_records = batch_records
+        self.batch_records = batch_records
+        self.compress_level = compress_level
+        self.interval_s = interval_s
+        self.min_backoff_s = min_backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.backoff_s = 0.0
+        self._store = None
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.batches_sent = 0
+        self.records_sent = 0
+        self.bytes_sent = 0
+        self.duplicates = 0
+        self.failures = 0
+        self.last_success = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sync-agent", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.uploader.close()
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                sent = self.sync_once()
+            except Exception as e:
+                self.failures += 1
+                self.backoff_s = min(self.max_backoff_s, max(self.min_backoff_s, self.backoff_s * 2))
+                delay = random.uniform(self.backoff_s / 2, self.backoff_s)
+                log.warning("Sync failed, retrying in %.0f s (%d records waiting): %s", delay, self.lag(), e)
+                self._stop.wait(delay)
+                continue
+            self.backoff_s = 0.0
+            if not sent:
+                self._stop.wait(self.interval_s)
+
+    def _open_store(self):
+        if self._store is None:
+            if not os.path.exists(self.db_path):
+                return None
+            self._store = DetectionStore(self.db_path, readonly=True)
+            # A cursor past the end of the log belongs to an earlier log at this path
+            if self._store.last_id() < self.cursor.last_id:
+                log.warning("Detection log is older than the sync cursor, uploading it as a new log")
+                self.cursor.reset()
+        return self._store
+
+    # Waiting records (not yet acknowledged)
+    def lag(self):
+        store = self._store
+        return max(0, store.last_id() - self.cursor.last_id) if store is not None else 0
+
+    # Sends the waiting records, batch by batch; returns how many the server acknowledged
+    def sync_once(self, max_batches=None):
+        store = self._open_store()
+        if store is None:
+            return 0
+        acknowledged = 0
+        for _ in range(max_batches) if max_batches else itertools.count():
+            if self._stop.is_set():
+                break
+            cursor = self.cursor
+            if cursor.pending is None:
+                rows = list(itertools.islice(store.iter_records(cursor.last_id, batch_size=self.batch_records),
+                                   self.batch_records))
+                if not rows:
+                    break
+                first_id, last_id = rows[0]["id"], rows[-1]["id"]
+                cursor.pending = [f"{self.device}-{cursor.log_id}-{first_id}-{last_id}", first_id, last_id]
+                cursor.save()
+            else:
+                _, first_id, last_id = cursor.pending
+                rows = list(store.iter_records(first_id - 1, where="id <= ?", params=[last_id]))
+            status = self._send(cursor.pending[0], rows, store)
+            if status == 413:
+                # Rejected as too large, so never stored: safe to split into smaller batches
+                cursor.pending = None
+                cursor.save()
+                if len(rows) <= MIN_BATCH_RECORDS:
+                    # Can't shrink any further; the same batch would only be rejected again
+                    raise SyncError(f"batch of {len(rows)} records rejected as too large (HTTP 413)")
+                self.max_batch_records = max(MIN_BATCH_RECORDS, len(rows) // 2)
+                self.batch_records = min(self.batch_records, self.max_batch_records)
+                continue
+            cursor.last_id = last_id
+            cursor.pending = None
+            cursor.save()
+            acknowledged += len(rows)
+        return acknowledged
+
+    def _send(self, batch_id, rows, store):
+        records = []
+        for row in rows:
+            record = {field: row[field] for field in FIELDS}
+            record["id"] = row["id"]
+            jpeg = store.read_blob(row["image_offset"], row["image_length"])
+            record["image"] = base64.b64encode(jpeg).decode("ascii") if jpeg else None
+            records.append(record)
+        body = json.dumps({"batch_id": batch_id, "device": self.device, "records": records}).encode()
+        headers = {"Content-Type": "application/json", "Idempotency-Key": batch_id}
+        if self.compress_level:
+            body = gzip.compress(body, compresslevel=self.compress_level, mtime=0)
+            headers["Content-Encoding"] = "gzip"
+        try:
+            status, data = self.uploader.post(body, headers)
+        except socket.timeout:
+            # A slow link: smaller batches from now on
+            self.batch_records = max(MIN_BATCH_RECORDS, self.batch_records // 2)
+            raise
+        if status == 413:
+            return status
+        if status not in (200, 201):
+            raise SyncError(f"HTTP {status}: {data[:200].decode('utf-8', 'replace')}")
+        if json.loads(data or b"{}").get("duplicate"):
+            self.duplicates += 1
+        self.batches_sent += 1
+        self.records_sent += len(rows)
+        self.bytes_sent += len(body)
+        self.last_success = time.time()
+        self.batch_records = min(self.max_batch_records, self.batch_records + max(1, self.batch_records // 4))
+        return status
+
+    def stats(self):
+        return {
+            "records_sent": self.records_sent,
+            "batches_sent": self.batches_sent,
+            "bytes_sent": self.bytes_sent,
+            "duplicate_acks": self.duplicates,
+            "failures": self.failures,
+            "lag_records": self.lag(),
+            "batch_records": self.batch_records,
+            "backoff_s": self.backoff_s,
+            "connections": self.uploader.connections,
+        }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upload the detection log to a central server")
+    parser.add_argument("url", help="batch endpoint, e.g. http://server:8000/batches")
+    parser.add_argument("--db", default=DEFAULT_DB, help="detection store path")
+    parser.add_argument("--cursor", default=DEFAULT_CURSOR, help="upload cursor file")
+    parser.add_argument("--device", help="device name sent with the batches (default: hostname)")
+    parser.add_argument("--batch", type=int, default=200, help="records per batch")
+    parser.add_argument("--level", type=int, default=6, help="gzip level, 0 for none")
+    parser.add_argument("--token", help="bearer token for the server")
+    parser.add_argument("--once", action="store_true", help="upload what is waiting and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    agent = SyncAgent(args.db, args.url, args.cursor, args.device, args.batch, args.level, token=args.token)
+    if args.once:
+        start = time.perf_counter()
+        try:
+            agent.sync_once()
+        finally:
+            agent.stop()
+        print(f"Uploaded {agent.records_sent} records in {agent.batches_sent} batches, "
+              f"{agent.bytes_sent / 1e6:.1f} MB in {time.perf_counter() - start:.1f} s")
+    else:
+        agent.start()
+        try:
+            while True:
+                time.sleep(60)
+                log.info("Sync: %s", agent.stats())
+        except KeyboardInterrupt:
+            agent.stop()
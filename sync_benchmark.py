@@ -0,0 +1,85 @@
+# sync_benchmark.py
+# Upload throughput of the sync agent into the stand-in receiver on this machine, for a range of
+# batch sizes and gzip levels, over an emulated cellular uplink: every response takes --rtt-ms
+# plus the batch's size at --uplink-kbit. Then a run against a receiver that fails 20% of the
+# requests and drops 10% of the acknowledgements, checking that every record arrives exactly once.
+#
+#   python3 sync_benchmark.py [--records 1000] [--rtt-ms 60] [--uplink-kbit 5000]
+
+import argparse
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from detection_store import DetectionStore
+from record_writer import encode_jpeg
+from sync_agent import SyncAgent
+from sync_receiver import SyncReceiver
+
+def synthetic_log(path, count, image_every=2):
+    rng = np.random.default_rng(0)
+    crops = []
+    for _ in range(8):
+        noise = rng.integers(60, 200, (30, 40, 3), dtype=np.uint8)
+        crops.append(encode_jpeg(cv2.GaussianBlur(cv2.resize(noise, (320, 240)), (5, 5), 0)))
+    store = DetectionStore(path)
+    for i in range(count):
+        store.add({"timestamp": f"2024-05-01T08:{i // 60 % 60:02d}:{i % 60:02d}.{i % 1000:03d}",
+                   "latitude": -33.93 + rng.normal(0, 0.02), "longitude": 18.52 + rng.normal(0, 0.02),
+                   "altitude": 40.0, "area_m2": float(rng.gamma(2.0, 0.05)), "confidence": 0.8,
+                   "frame": i, "track_id": i, "stream": "front"},
+                  crops[i % len(crops)] if i % image_every == 0 else None)
+    store.commit()
+    store.close()
+
+def upload(directory, db_path, batch, level, rtt_s, uplink_bytes_s, fail_rate=0.0, drop_ack_rate=0.0, seed=1):
+    central = os.path.join(directory, f"central-{batch}-{level}-{fail_rate}.db")
+    receiver = SyncReceiver(central, port=0, fail_rate=fail_rate, drop_ack_rate=drop_ack_rate,
+                            delay_s=rtt_s, uplink_bytes_s=uplink_bytes_s, seed=seed).start()
+    cursor = os.path.join(directory, f"cursor-{batch}-{level}-{fail_rate}.json")
+    agent = SyncAgent(db_path, receiver.url, cursor, device="bench", batch_records=batch, compress_level=level)
+    start = time.perf_counter()
+    while True:
+        try:
+            agent.sync_once()
+        except Exception:
+            agent.failures += 1
+            continue  # the benchmark retries at once instead of backing off
+        if agent.lag() == 0:
+            break
+    elapsed = time.perf_counter() - start
+    agent.stop()
+    stats = receiver.stats()
+    frames = receiver.store.conn.execute("SELECT COUNT(*), COUNT(DISTINCT frame) FROM detections").fetchone()
+    receiver.stop()
+    return elapsed, agent, stats, frames
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync agent throughput by batch size and gzip level")
+    parser.add_argument("--records", type=int, default=1000)
+    parser.add_argument("--rtt-ms", type=float, default=60.0)
+    parser.add_argument("--uplink-kbit", type=float, default=5000.0)
+    args = parser.parse_args()
+    rtt_s = args.rtt_ms / 1000
+    uplink = args.uplink_kbit * 125
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "pothole_log.db")
+        synthetic_log(db_path, args.records)
+        print(f"--- Sync, {args.records} records (half with a 320x240 crop), {args.rtt_ms:g} ms RTT, "
+              f"{args.uplink_kbit:g} kbit/s uplink ---")
+        print(f"{'batch':>5} | {'gzip':>4} | {'records/s':>9} | {'wire kB/record':>14} | {'MB':>6} | {'requests':>8}")
+        for batch in (10, 50, 200, 800):
+            for level in (0, 1, 6):
+                elapsed, agent, _, _ = upload(directory, db_path, batch, level, rtt_s, uplink)
+                print(f"{batch:>5} | {level:>4} | {args.records / elapsed:>9.0f} | "
+                      f"{agent.bytes_sent / args.records / 1000:>14.2f} | {agent.bytes_sent / 1e6:>6.1f} | "
+                      f"{agent.batches_sent:>8}")
+
+        elapsed, agent, stats, (rows, distinct) = upload(directory, db_path, 25, 6, rtt_s, uplink, 0.2, 0.1)
+        print(f"faults (20% 503s, 10% lost acks, batch 25): {rows} rows, {distinct} distinct of {args.records}; "
+              f"{stats['failed']} 503s, {stats['dropped_acks']} lost acks, {agent.duplicates} batches "
+              f"acknowledged again, {agent.uploader.connections} connections, {elapsed:.1f} s")
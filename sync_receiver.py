@@ -0,0 +1,179 @@
+# sync_receiver.py
+# Local stand-in for the central server the sync agent uploads to, for tests and for
+# sync_benchmark.py. POST /batches takes a (gzipped) JSON batch and stores its records and crops in
+# a detection store, together with the batch id, in one transaction: a batch seen before is only
+# acknowledged again ({"duplicate": true}). For exercising the agent it can fail a share of the
+# requests with 503 (fail_rate), commit a batch and then drop the connection without answering
+# (drop_ack_rate), and take delay_s plus the upload time at uplink_bytes_s to answer, like a
+# cellular link.
+#
+#   python3 sync_receiver.py central.db [--port 8000] [--fail-rate 0.2] [--drop-ack-rate 0.1]
+
+import argparse
+import base64
+import gzip
+import json
+import random
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from detection_store import FIELDS, DetectionStore
+
+BATCHES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_batches (
+    batch_id TEXT PRIMARY KEY,
+    device TEXT,
+    records INTEGER,
+    received TEXT
+);
+"""
+
+class SyncReceiver:
+    def __init__(self, db_path, host="127.0.0.1", port=8000, token=None, fail_rate=0.0, drop_ack_rate=0.0,
+                 delay_s=0.0, uplink_bytes_s=None, max_body_bytes=32 * 2**20, seed=None):
+        self.store = DetectionStore(db_path)
+        self.store.conn.executescript(BATCHES_SCHEMA)
+        self.token = token
+        self.fail_rate = fail_rate
+        self.drop_ack_rate = drop_ack_rate
+        self.delay_s = delay_s
+        self.uplink_bytes_s = uplink_bytes_s
+        self.max_body_bytes = max_body_bytes
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.duplicates = 0
+        self.records = 0
+        self.bytes_received = 0
+        self.failed = 0
+        self.dropped_acks = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def do_POST(self):
+                server._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    @property
+    def url(self):
+        return f"http://{self.httpd.server_address[0]}:{self.port}/batches"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="sync-receiver", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.store.close()
+
+    def _reply(self, handler, status, payload):
+        body = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _handle(self, handler):
+        if handler.path != "/batches":
+            handler.send_error(404)
+            return
+        if self.token and handler.headers.get("Authorization") != f"Bearer {self.token}":
+            handler.send_error(401)
+            return
+        length = int(handler.headers.get("Content-Length", 0))
+        if length > self.max_body_bytes:
+            handler.close_connection = True
+            self._reply(handler, 413, {"error": f"batch larger than {self.max_body_bytes} bytes"})
+            return
+        body = handler.rfile.read(length)
+        self.bytes_received += length
+        delay_s = self.delay_s + (length / self.uplink_bytes_s if self.uplink_bytes_s else 0.0)
+        if delay_s:
+            time.sleep(delay_s)
+        if self.random.random() < self.fail_rate:
+            self.failed += 1
+            self._reply(handler, 503, {"error": "injected failure"})
+            return
+        try:
+            if handler.headers.get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+            batch = json.loads(body)
+            duplicate = self._store(batch)
+        except (OSError, ValueError, KeyError) as e:
+            self._reply(handler, 400, {"error": str(e)})
+            return
+        if self.random.random() < self.drop_ack_rate:
+            # Stored, but the agent never hears about it and has to send the batch again
+            self.dropped_acks += 1
+            handler.close_connection = True
+            return
+        self._reply(handler, 200, {"batch_id": batch["batch_id"], "duplicate": duplicate})
+
+    # True when the batch was already stored
+    def _store(self, batch):
+        conn = self.store.conn
+        with self._lock:
+            try:
+                conn.execute("INSERT INTO sync_batches VALUES (?, ?, ?, datetime('now'))",
+                             (batch["batch_id"], batch.get("device"), len(batch["records"])))
+            except sqlite3.IntegrityError:
+                self.duplicates += 1
+                return True
+            try:
+                for record in batch["records"]:
+                    image = record.get("image")
+                    fields = {field: record.get(field) for field in FIELDS}
+                    # The device's own records name no vehicle; here, the device is the vehicle
+                    fields["vehicles"] = fields["vehicles"] or batch.get("device")
+                    self.store.add(fields, base64.b64decode(image) if image else None)
+            except Exception:
+                conn.rollback()
+                raise
+            self.store.commit()
+            self.batches += 1
+            self.records += len(batch["records"])
+            return False
+
+    def stats(self):
+        return {"batches": self.batches, "records": self.records, "duplicates": self.duplicates,
+                "bytes_received": self.bytes_received, "failed": self.failed, "dropped_acks": self.dropped_acks}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in central server for the sync agent")
+    parser.add_argument("db", help="detection store the batches go into")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--token", help="bearer token the agent must send")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered 503")
+    parser.add_argument("--drop-ack-rate", type=float, default=0.0,
+                        help="share of stored batches whose answer is dropped")
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="added to every response")
+    parser.add_argument("--uplink-kbit", type=float, help="emulated uplink speed, kbit/s")
+    args = parser.parse_args()
+
+    receiver = SyncReceiver(args.db, args.host, args.port, args.token, args.fail_rate, args.drop_ack_rate,
+                            args.delay_ms / 1000, args.uplink_kbit * 125 if args.uplink_kbit else None).start()
+    print(f"Receiving batches on {receiver.url}")
+    try:
+        while True:
+            time.sleep(60)
+            print(receiver.stats())
+    except KeyboardInterrupt:
+        receiver.stop()
@@ -0,0 +1,6 @@
+# conftest.py
+# The modules live flat in the repository root, as the scripts import them
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
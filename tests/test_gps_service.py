@@ -0,0 +1,66 @@
+# test_gps_service.py
+# GPSService's fix ring buffer against the fake AT modem: interpolation between fixes, and no
+# position before the first fix.
+
+import time
+
+import pytest
+
+from fake_gps import FakeATModem, FakeTrack
+from gps_service import NO_FIX, ATPollSource, Fix, GPSService
+from nmea_benchmark import error_m
+
+def wait_for(condition, timeout_s=5.0):
+    deadline = time.monotonic() + timeout_s
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_empty_buffer_has_no_position():
+    service = GPSService(ATPollSource(FakeATModem()))
+    assert service.latest() is None
+    assert service.position_at(time.monotonic()) == NO_FIX
+
+def test_modem_without_fix_leaves_buffer_empty():
+    modem = FakeATModem(has_fix=False, response_delay=0.01, timeout=0.05)
+    service = GPSService(ATPollSource(modem, timeout=0.1), poll_interval=0.01).start()
+    try:
+        wait_for(lambda: service.empty_polls >= 3)
+        assert service.fix_count == 0
+        assert service.position_at(time.monotonic()) == NO_FIX
+    finally:
+        service.stop()
+
+def test_interpolates_between_fixes():
+    service = GPSService(None)
+    service.add_fix(Fix(10.0, -33.0, 18.0, 40.0))
+    service.add_fix(Fix(11.0, -33.001, 18.002, 44.0))
+    lat, lon, alt = service.position_at(10.25)
+    assert lat == pytest.approx(-33.00025)
+    assert lon == pytest.approx(18.0005)
+    assert alt == pytest.approx(41.0)
+
+def test_position_before_oldest_and_after_newest_fix():
+    service = GPSService(None, max_age=5.0, max_extrapolation=2.0)
+    service.add_fix(Fix(10.0, -33.0, 18.0, 40.0))
+    service.add_fix(Fix(11.0, -33.001, 18.0, 40.0))
+    # Just before the oldest fix: that fix; long before: nothing
+    assert service.position_at(9.0) == (-33.0, 18.0, 40.0)
+    assert service.position_at(4.0) == NO_FIX
+    # Extrapolated along the last leg for max_extrapolation, then held; nothing once stale
+    assert service.position_at(12.0)[0] == pytest.approx(-33.002)
+    assert service.position_at(14.0)[0] == pytest.approx(-33.003)
+    assert service.position_at(17.0) == NO_FIX
+
+def test_polled_fixes_follow_the_fake_vehicle():
+    track = FakeTrack(speed_mps=12.0)
+    modem = FakeATModem(track, response_delay=0.01, timeout=0.2)
+    service = GPSService(ATPollSource(modem, timeout=0.5), poll_interval=0.05).start()
+    try:
+        wait_for(lambda: service.fix_count >= 4)
+    finally:
+        service.stop()
+    first, second = service._fixes[-2], service._fixes[-1]
+    t = (first.t + second.t) / 2
+    # Fixes are stamped on receipt, response_delay after the modem read its position
+    assert error_m(track, service.position_at(t), t - modem.response_delay) < 1.0
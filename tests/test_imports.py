@@ -0,0 +1,20 @@
+# test_imports.py
+# Importing the detector must not pull in Hailo or GStreamer; they are imported when the
+# pipeline is set up. Run in a fresh interpreter, since the replay tests put stand-ins for
+# them into this one's sys.modules.
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+def test_detector_imports_without_hailo_or_gstreamer():
+    check = (
+        "import sys\n"
+        "import pothole_detection\n"
+        "loaded = sorted(m for m in ('gi', 'hailo', 'hailo_apps_infra') if m in sys.modules)\n"
+        "assert not loaded, loaded\n"
+        "assert pothole_detection.user_app_callback_class is None\n"
+    )
+    result = subprocess.run([sys.executable, "-c", check], cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
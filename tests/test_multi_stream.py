@@ -0,0 +1,69 @@
+# test_multi_stream.py
+# Two streams replayed through one app_callback, as hailoroundrobin interleaves two cameras: each
+# stream's potholes are counted and logged under its own name, and the "all" row adds them up.
+
+import argparse
+import csv
+import datetime
+import json
+
+import replay
+from detection_store import DetectionStore
+
+FPS = 30
+
+# One track of 10 frames starting at each of the given frames
+def write_sidecar(path, starts):
+    frames = []
+    for track_id, start in enumerate(starts, 1):
+        for frame in range(start, start + 10):
+            frames.append({"frame": frame, "detections": [
+                {"bbox": [260, 330, 360, 400], "confidence": 0.9, "track_id": track_id}]})
+    with open(path, "w") as f:
+        json.dump({"fps": FPS, "frames": frames}, f)
+
+# A fix a second, 30 m apart, so no pothole is a duplicate of another
+def write_gps_log(path, seconds=8):
+    t0 = datetime.datetime(2025, 5, 1, 8, 0, 0)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Timestamp", "Latitude", "Longitude", "Altitude (m)"])
+        for s in range(seconds):
+            writer.writerow([f"{t0 + datetime.timedelta(seconds=s):%Y-%m-%d %H:%M:%S}", -33.93 + s * 2.7e-4, 18.52, 40])
+
+def report_rows(output):
+    rows = {}
+    lines = output.splitlines()
+    header = next(i for i, line in enumerate(lines) if line.startswith("stream "))
+    names = [cell.strip() for cell in lines[header].split("|")]
+    for line in lines[header + 1:]:
+        cells = [cell.strip() for cell in line.split("|")]
+        if len(cells) != len(names):
+            break
+        rows[cells[0]] = dict(zip(names, cells))
+    return rows
+
+def test_two_stream_replay_counts(tmp_path, capsys):
+    front, rear, gps = tmp_path / "front.json", tmp_path / "rear.json", tmp_path / "gps.csv"
+    write_sidecar(front, [0, 60, 120])  # potholes at 0, 2 and 4 s
+    write_sidecar(rear, [30, 90])       # and at 1 and 3 s
+    write_gps_log(gps)
+    out = str(tmp_path / "replay.db")
+    args = argparse.Namespace(
+        source=None, detections=str(front), stream=[(None, str(rear))], workers=0, vehicles=False,
+        gps=str(gps), nmea=None, gps_offset=0.0, target="detection", fps=None, frames=None, size=(640, 480),
+        realtime=False, display=False, eager=False, out=out, clips=None, sample_every=None, report=None,
+        quiet=True, verbose=False)
+    replay.replay(args)
+
+    rows = report_rows(capsys.readouterr().out)
+    assert set(rows) == {"sink_0", "sink_1", "all"}
+    assert (rows["sink_0"]["frames"], rows["sink_0"]["dets"], rows["sink_0"]["logged"]) == ("130", "30", "3")
+    assert (rows["sink_1"]["frames"], rows["sink_1"]["dets"], rows["sink_1"]["logged"]) == ("100", "20", "2")
+    assert (rows["all"]["frames"], rows["all"]["dets"], rows["all"]["logged"]) == ("230", "50", "5")
+    assert rows["all"]["dups"] == "0"
+
+    store = DetectionStore(out, readonly=True)
+    per_stream = dict(store.conn.execute("SELECT stream, COUNT(*) FROM detections GROUP BY stream").fetchall())
+    store.close()
+    assert per_stream == {"sink_0": 3, "sink_1": 2}
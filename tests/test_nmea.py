@@ -0,0 +1,85 @@
+# test_nmea.py
+# NMEAStreamParser and NMEAStreamSource against the fake receiver on a pseudo-terminal: corrupted
+# sentences, sentences split across reads, and falling back to AT polling when the port is silent.
+
+import time
+
+import serial
+
+from fake_gps import FakeATModem, FakeNMEADevice, FakeTrack, nmea_sentences
+from gps_service import ATPollSource, FallbackSource, GPSService, NMEAStreamSource
+from nmea import EpochAssembler, NMEAStreamParser
+
+def test_bad_checksums_are_counted_and_skipped():
+    track = FakeTrack()
+    good = b"".join(nmea_sentences(track, track.t0))
+    bad = bytearray(good)
+    bad[8] ^= 0x20  # inside the first sentence (RMC)
+    parser = NMEAStreamParser()
+    fixes = parser.feed(bytes(bad))
+    assert [fix.kind for fix in fixes] == ["GGA", "VTG"]
+    assert parser.checksum_errors == 1
+    assert parser.sentences == 2
+
+def test_sentences_split_across_reads():
+    track = FakeTrack()
+    data = b"".join(s for i in range(20) for s in nmea_sentences(track, track.t0 + i / 10))
+    whole = NMEAStreamParser().feed(data)
+    parser = NMEAStreamParser()
+    split = []
+    for start in range(0, len(data), 7):
+        split += parser.feed(data[start:start + 7])
+    assert split == whole
+    assert len(split) == 60
+    assert parser.checksum_errors == 0
+    assert parser.discarded_bytes == 0
+
+def test_pty_stream_in_small_reads():
+    with FakeNMEADevice(rate_hz=20) as device:
+        ser = serial.Serial(device.port, timeout=0.2)
+        parser = NMEAStreamParser()
+        assembler = EpochAssembler()
+        epochs = []
+        deadline = time.monotonic() + 5.0
+        try:
+            while len(epochs) < 5 and time.monotonic() < deadline:
+                # Short reads end mid-sentence most of the time
+                for fix in parser.feed(ser.read(5)):
+                    merged = assembler.add(fix, time.monotonic())
+                    if merged is not None:
+                        epochs.append(merged[1])
+        finally:
+            ser.close()
+    assert len(epochs) >= 5
+    assert parser.checksum_errors == 0
+    assert all(epoch.lat is not None and epoch.alt is not None and epoch.speed_mps is not None
+               for epoch in epochs)
+
+def test_pty_stream_with_corrupt_sentences():
+    with FakeNMEADevice(rate_hz=20, corrupt_every=4) as device:
+        source = NMEAStreamSource(ser=serial.Serial(device.port, timeout=0.2), probe_s=2.0)
+        try:
+            source.start()
+            fixes = [source.read_fix() for _ in range(10)]
+        finally:
+            source.close()
+    assert all(fix is not None and fix.lat is not None for fix in fixes)
+    assert source.parser.checksum_errors > 0
+
+def test_falls_back_to_polling_without_nmea():
+    # The NMEA port exists but nothing streams on it
+    device = FakeNMEADevice()
+    try:
+        stream = NMEAStreamSource(ser=serial.Serial(device.port, timeout=0.05), probe_s=0.3)
+        polling = ATPollSource(FakeATModem(response_delay=0.01, timeout=0.2), timeout=0.5)
+        source = FallbackSource(stream, polling)
+        service = GPSService(source, poll_interval=0.02).start()
+        deadline = time.monotonic() + 5.0
+        while service.fix_count < 2 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        service.stop()
+    finally:
+        device.stop()
+    assert source.active is polling
+    assert not source.streaming
+    assert service.fix_count >= 2
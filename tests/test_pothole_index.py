@@ -0,0 +1,45 @@
+# test_pothole_index.py
+# PotholeIndex queries while other request threads add records, as under the threaded Flask server
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pothole-webui"))
+from pothole_index import PotholeIndex, Record
+
+def record(i):
+    # Spread over many grid cells, so adding records keeps adding cells
+    return Record(i, -34.0 + (i % 97) * 0.013, 18.0 + (i // 97) * 0.011, 0.1 + (i % 7) * 0.05, "", 0.8, False)
+
+def test_queries_during_concurrent_adds(tmp_path):
+    index = PotholeIndex(str(tmp_path / "none.db"), str(tmp_path / "none.csv"))
+    index.extend(record(i) for i in range(1, 101))
+    errors = []
+    done = threading.Event()
+
+    def add():
+        for start in range(101, 20001, 50):
+            index.extend(record(i) for i in range(start, start + 50))
+        done.set()
+
+    def query():
+        try:
+            while not done.is_set():
+                bbox = (17.9, -34.1, 19.0, -32.7)
+                items, _, total = index.query(bbox, min_area=0.2, limit=500)
+                assert all(item.area >= 0.2 for item in items)
+                assert all(item.id <= total for item in items)
+                assert [item.id for item in items] == sorted(item.id for item in items)
+                assert index.get(total) is not None
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=add)] + [threading.Thread(target=query) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    items, cursor, total = index.query(limit=20000)
+    assert total == 20000 and len(items) == 20000 and cursor is None
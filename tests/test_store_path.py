@@ -0,0 +1,30 @@
+# test_store_path.py
+# The detector and the web UI must agree on where the detection store is: the web UI's API,
+# images, clips and log uploads all read the store the detector writes.
+
+import importlib
+import json
+import os
+import sys
+
+import pytest
+
+import startup
+
+WEBUI_DIR = os.path.join(os.path.dirname(os.path.abspath(startup.__file__)), "pothole-webui")
+
+@pytest.mark.parametrize("overrides", [{}, {"db_path": "logs/drive.db"}, {"db_path": "/var/lib/pothole/log.db"}])
+def test_detector_and_webui_use_one_store(tmp_path, monkeypatch, overrides):
+    config_path = tmp_path / "pothole_detection.json"
+    config_path.write_text(json.dumps(overrides))
+    monkeypatch.setenv(startup.CONFIG_ENV, str(config_path))
+    detector_db = startup.load_config()["db_path"]
+
+    monkeypatch.syspath_prepend(WEBUI_DIR)
+    for name in ("app", "log_merge"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    app = importlib.import_module("app")
+    log_merge = importlib.import_module("log_merge")
+    assert app.STORE_PATH == detector_db
+    assert app.index.store_path == detector_db
+    assert log_merge.default_db() == detector_db
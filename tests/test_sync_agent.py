@@ -0,0 +1,103 @@
+# test_sync_agent.py
+# SyncAgent against the stand-in receiver: failed requests and lost acknowledgements, a restart
+# with a batch still pending, and batches the server rejects as too large. Every record must end
+# up on the receiver exactly once.
+
+import os
+
+import pytest
+
+from sync_agent import MIN_BATCH_RECORDS, SyncAgent, SyncError
+from sync_benchmark import synthetic_log
+from sync_receiver import SyncReceiver
+
+RECORDS = 120
+
+@pytest.fixture
+def log_path(tmp_path):
+    path = str(tmp_path / "pothole_log.db")
+    synthetic_log(path, RECORDS)
+    return path
+
+def upload_all(agent, attempts=200):
+    for _ in range(attempts):
+        try:
+            agent.sync_once()
+        except (OSError, SyncError):
+            agent.failures += 1
+            continue
+        if agent.lag() == 0:
+            return
+    pytest.fail(f"{agent.lag()} records still waiting")
+
+def received(receiver):
+    return receiver.store.conn.execute("SELECT COUNT(*), COUNT(DISTINCT frame) FROM detections").fetchone()
+
+def test_failures_and_lost_acks_deliver_every_record_once(tmp_path, log_path):
+    receiver = SyncReceiver(str(tmp_path / "central.db"), port=0, fail_rate=0.3, drop_ack_rate=0.3,
+                            seed=1).start()
+    agent = SyncAgent(log_path, receiver.url, str(tmp_path / "cursor.json"), device="van1", batch_records=10)
+    try:
+        upload_all(agent)
+        stats = receiver.stats()
+        assert stats["failed"] > 0
+        assert stats["dropped_acks"] > 0
+        assert agent.duplicates > 0  # batches stored, then acknowledged again
+        assert tuple(received(receiver)) == (RECORDS, RECORDS)
+    finally:
+        agent.stop()
+        receiver.stop()
+
+def test_restart_resends_the_pending_batch(tmp_path, log_path):
+    receiver = SyncReceiver(str(tmp_path / "central.db"), port=0, drop_ack_rate=1.0).start()
+    cursor = str(tmp_path / "cursor.json")
+    agent = SyncAgent(log_path, receiver.url, cursor, device="van1", batch_records=50)
+    try:
+        # The batch is stored but its acknowledgement never arrives
+        with pytest.raises(OSError):
+            agent.sync_once(max_batches=1)
+        assert agent.cursor.pending is not None
+        agent.stop()
+        assert tuple(received(receiver)) == (50, 50)
+
+        receiver.drop_ack_rate = 0.0
+        agent = SyncAgent(log_path, receiver.url, cursor, device="van1", batch_records=50)
+        assert agent.cursor.pending is not None
+        upload_all(agent)
+        assert agent.duplicates == 1
+        assert receiver.stats()["duplicates"] == 1
+        assert tuple(received(receiver)) == (RECORDS, RECORDS)
+        assert os.path.exists(cursor)
+        assert agent.cursor.last_id == RECORDS and agent.cursor.pending is None
+    finally:
+        agent.stop()
+        receiver.stop()
+
+def test_too_large_batches_are_halved(tmp_path, log_path):
+    # Half the records carry a ~10 kB crop: 200 of them are far above the limit, 10-25 are not
+    receiver = SyncReceiver(str(tmp_path / "central.db"), port=0, max_body_bytes=200_000).start()
+    agent = SyncAgent(log_path, receiver.url, str(tmp_path / "cursor.json"), device="van1",
+                      batch_records=200, compress_level=0)
+    try:
+        upload_all(agent)
+        assert agent.max_batch_records < 200
+        assert agent.batch_records <= agent.max_batch_records
+        assert receiver.stats()["duplicates"] == 0
+        assert tuple(received(receiver)) == (RECORDS, RECORDS)
+    finally:
+        agent.stop()
+        receiver.stop()
+
+def test_batch_that_cannot_shrink_is_an_error(tmp_path, log_path):
+    # Every batch is rejected as too large, down to the smallest the agent sends
+    receiver = SyncReceiver(str(tmp_path / "central.db"), port=0, max_body_bytes=0).start()
+    agent = SyncAgent(log_path, receiver.url, str(tmp_path / "cursor.json"), device="van1", batch_records=200)
+    try:
+        with pytest.raises(SyncError, match="413"):
+            agent.sync_once()
+        assert agent.max_batch_records == MIN_BATCH_RECORDS
+        assert agent.cursor.last_id == 0 and agent.cursor.pending is None
+        assert tuple(received(receiver)) == (0, 0)
+    finally:
+        agent.stop()
+        receiver.stop()
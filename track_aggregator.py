@@ -0,0 +1,163 @@
+# track_aggregator.py
+# Per-track aggregation of detections. While the Hailo tracker keeps a pothole's id alive only the
+# best frame (confidence x crop sharpness) and a bounded sample of size estimates are kept. When
+# the track ends or times out a single record is emitted with the best crop and the median area,
+# so GPS tagging, dedup and JPEG encoding run once per pothole instead of once per frame.
+# With a post-processing pool the crops are scored in worker processes: observe_deferred() asks
+# for a crop and offer() applies it when it comes back, and a track is held until its crops are in.
+
+import itertools
+from collections import deque
+
+import cv2
+import numpy as np
+
+# Laplacian variance at which a crop scores half of its confidence
+SHARPNESS_HALF = 100.0
+
+def sharpness(crop):
+    if crop is None or crop.size == 0:
+        return 0.0
+    gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY) if crop.ndim == 3 else crop
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+class TrackState:
+    __slots__ = ("track_id", "first_seen", "last_seen", "frames", "areas", "max_confidence",
+                 "best_score", "best_confidence", "best_time", "best_frame", "best_crop", "pending")
+
+    def __init__(self, track_id, t, max_area_samples):
+        self.track_id = track_id
+        self.first_seen = t
+        self.last_seen = t
+        self.frames = 0
+        self.areas = deque(maxlen=max_area_samples)
+        self.max_confidence = 0.0
+        self.best_score = -1.0
+        self.best_confidence = 0.0
+        self.best_time = t
+        self.best_frame = None
+        self.best_crop = None
+        self.pending = 0  # crops requested from the pool and not yet offered
+
+    def median_area(self):
+        return float(np.median(self.areas)) if self.areas else 0.0
+
+class TrackAggregator:
+    # pending_grace_s: how much longer than timeout_s a track waits for crops still in the pool
+    def __init__(self, timeout_s=1.0, max_area_samples=64, pending_grace_s=2.0):
+        self.timeout_s = timeout_s
+        self.max_area_samples = max_area_samples
+        self.pending_grace_s = pending_grace_s
+        self.tracks = {}
+        # Untracked detections waiting for their crop, by their negative id
+        self._awaiting = {}
+        self._untracked_ids = itertools.count(-1, -1)
+
+        self.detections = 0
+        self.crops_sampled = 0
+        self.tracks_started = 0
+        self.tracks_emitted = 0
+
+    # crop_fn is only called when the detection could become the track's best frame, so most
+    # frames of a track never materialize a crop. A track_id of 0 means the pipeline runs without
+    # a tracker; such a detection is its own track and is returned as finished right away.
+    def observe(self, track_id, t, frame_id, confidence, area_m2, crop_fn):
+        state, untracked = self._update(track_id, t, area_m2, confidence)
+
+        # score = confidence * s / (s + SHARPNESS_HALF) can never exceed the confidence
+        if confidence > state.best_score:
+            crop = crop_fn()
+            self.crops_sampled += 1
+            self._score(state, t, frame_id, confidence, sharpness(crop), crop)
+
+        if untracked:
+            self.tracks_emitted += 1
+            return state
+        return None
+
+    # observe() for crops scored elsewhere: returns the key to offer() the crop under when the
+    # detection could become the track's best frame, otherwise None
+    def observe_deferred(self, track_id, t, frame_id, confidence, area_m2):
+        state, untracked = self._update(track_id, t, area_m2, confidence)
+        if untracked:
+            self._awaiting[state.track_id] = state
+        elif confidence <= state.best_score:
+            return None
+        state.pending += 1
+        self.crops_sampled += 1
+        return state.track_id
+
+    # The crop (None if it couldn't be made) and its sharpness for a key from observe_deferred().
+    # Returns the state of an untracked detection, which is finished with it.
+    def offer(self, key, t, frame_id, confidence, crop_sharpness, crop):
+        state = self.tracks.get(key) or self._awaiting.pop(key, None)
+        if state is None:
+            return None  # expired after the grace period
+        state.pending -= 1
+        self._score(state, t, frame_id, confidence, crop_sharpness, crop)
+        if key < 0:
+            self.tracks_emitted += 1
+            return state
+        return None
+
+    def _update(self, track_id, t, area_m2, confidence):
+        self.detections += 1
+        untracked = not track_id
+        if untracked:
+            track_id = next(self._untracked_ids)
+        state = self.tracks.get(track_id)
+        if state is None:
+            state = TrackState(track_id, t, self.max_area_samples)
+            self.tracks_started += 1
+            if not untracked:
+                self.tracks[track_id] = state
+
+        state.last_seen = t
+        state.frames += 1
+        state.areas.append(area_m2)
+        state.max_confidence = max(state.max_confidence, confidence)
+        return state, untracked
+
+    def _score(self, state, t, frame_id, confidence, s, crop):
+        score = confidence * s / (s + SHARPNESS_HALF)
+        if score > state.best_score or state.best_crop is None:
+            state.best_score = score
+            state.best_confidence = confidence
+            state.best_time = t
+            state.best_frame = frame_id
+            if crop is not None and crop.base is not None:
+                crop = crop.copy()
+            state.best_crop = crop
+
+    # Returns the tracks that have not been seen for timeout_s (and have their crops back, or
+    # have waited pending_grace_s longer for them)
+    def expire(self, now):
+        finished = [state for state in self.tracks.values() if now - state.last_seen > self.timeout_s
+                    and (not state.pending or now - state.last_seen > self.timeout_s + self.pending_grace_s)]
+        for state in finished:
+            del self.tracks[state.track_id]
+        if self._awaiting:
+            lost = [state for state in self._awaiting.values()
+                    if now - state.last_seen > self.timeout_s + self.pending_grace_s]
+            for state in lost:
+                del self._awaiting[state.track_id]
+            finished += lost
+        self.tracks_emitted += len(finished)
+        return finished
+
+    def flush(self):
+        finished = list(self.tracks.values()) + list(self._awaiting.values())
+        self.tracks.clear()
+        self._awaiting.clear()
+        self.tracks_emitted += len(finished)
+        return finished
+
+    def stats(self):
+        return {
+            "detections": self.detections,
+            "crops_sampled": self.crops_sampled,
+            "tracks_started": self.tracks_started,
+            "tracks_emitted": self.tracks_emitted,
+            "live_tracks": len(self.tracks) + len(self._awaiting),
+            "detections_per_record": self.detections / self.tracks_emitted if self.tracks_emitted else 0,
+        }
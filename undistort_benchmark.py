@@ -0,0 +1,57 @@
+# undistort_benchmark.py
+# Micro-benchmark of the per-frame undistortion cost:
+#   cv2.undistort      - the original callback path, map rebuilt every frame
+#   remap (display)    - cached fixed-point maps, full frame
+#   roi (headless)     - cached maps, only box corners and box pixels
+
+import time
+import cv2
+import numpy as np
+
+from undistortion import Undistorter
+
+RESOLUTIONS = [(640, 480), (1280, 720)]
+BOXES_PER_FRAME = 3
+ITERATIONS = 200
+
+def make_boxes(width, height, count, rng):
+    w = rng.integers(width // 10, width // 5, count)
+    h = rng.integers(height // 10, height // 5, count)
+    x = rng.integers(0, width - w)
+    y = rng.integers(0, height - h)
+    return np.stack([x, y, x + w, y + h], axis=1)
+
+def timed(fn, iterations=ITERATIONS):
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1000
+
+if __name__ == "__main__":
+    undistorter = Undistorter.from_file()
+    rng = np.random.default_rng(0)
+
+    print("--- Undistortion cost per frame ---")
+    for width, height in RESOLUTIONS:
+        frame = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+        boxes = make_boxes(width, height, BOXES_PER_FRAME, rng)
+        out = np.empty_like(frame)
+
+        start = time.perf_counter()
+        undistorter.maps(width, height)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        def roi_mode():
+            corrected = undistorter.undistort_boxes(boxes)
+            for x_min, y_min, x_max, y_max in np.rint(corrected).astype(int):
+                undistorter.undistort_crop(frame, x_min, y_min, x_max - x_min, y_max - y_min)
+
+        legacy = timed(lambda: cv2.undistort(frame, undistorter.K, undistorter.dist))
+        full = timed(lambda: undistorter.undistort_frame(frame, out))
+        roi = timed(roi_mode)
+
+        print(f"{width}x{height} (one-off map build {build_ms:.1f} ms)")
+        print(f"  cv2.undistort      : {legacy:7.3f} ms")
+        print(f"  remap (display)    : {full:7.3f} ms  ({legacy / full:5.1f}x)")
+        print(f"  roi   (headless)   : {roi:7.3f} ms  ({legacy / roi:5.1f}x, {BOXES_PER_FRAME} boxes)")
@@ -0,0 +1,85 @@
+# undistortion.py
+# Cached lens undistortion. cv2.undistort() rebuilds the distortion map on every call; here the
+# initUndistortRectifyMap tables are built once per resolution and kept in OpenCV's fixed-point
+# form (CV_16SC2 coordinates + CV_16UC1 interpolation weights, 6 bytes per pixel instead of 8).
+#
+# Two ways to use it:
+#   undistort_frame() - full-frame remap, for when the annotated frame is displayed
+#   undistort_boxes() + undistort_crop() - headless, only box corners and box pixels are corrected
+#                                           (undistort_crop_rows() also reads only the raw rows needed)
+
+import os
+import cv2
+import numpy as np
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CALIBRATION = os.path.join(base_dir, "new_camera_calibration.npz")
+
+class Undistorter:
+    def __init__(self, K, dist):
+        self.K = np.asarray(K, dtype=np.float64)
+        self.dist = np.asarray(dist, dtype=np.float64)
+        self._maps = {}  # (width, height) -> (map1, map2)
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_CALIBRATION):
+        data = np.load(path)
+        return cls(data["K"], data["dist"])
+
+    def maps(self, width, height):
+        maps = self._maps.get((width, height))
+        if maps is None:
+            maps = cv2.initUndistortRectifyMap(self.K, self.dist, None, self.K, (width, height), cv2.CV_16SC2)
+            self._maps[(width, height)] = maps
+        return maps
+
+    def undistort_frame(self, frame, out=None):
+        map1, map2 = self.maps(frame.shape[1], frame.shape[0])
+        return cv2.remap(frame, map1, map2, cv2.INTER_LINEAR, dst=out)
+
+    # Maps an Nx2 array of raw pixel coordinates to undistorted pixel coordinates
+    def undistort_points(self, points):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        return cv2.undistortPoints(points, self.K, self.dist, P=self.K).reshape(-1, 2)
+
+    # Nx4 raw (x_min, y_min, x_max, y_max) boxes -> axis-aligned boxes around the undistorted corners
+    def undistort_boxes(self, boxes):
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        if len(boxes) == 0:
+            return boxes
+        corners = boxes[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 2)
+        corners = self.undistort_points(corners).reshape(-1, 4, 2)
+        return np.hstack([corners.min(axis=1), corners.max(axis=1)])
+
+    # Slices of the cached maps covering an (undistorted) box, or None when it is outside the frame
+    def crop_maps(self, frame_w, frame_h, x, y, w, h):
+        map1, map2 = self.maps(frame_w, frame_h)
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, frame_w), min(y + h, frame_h)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return map1[y0:y1, x0:x1], map2[y0:y1, x0:x1]
+
+    # Returns the pixels of the undistorted image inside the (undistorted) box, reading from the
+    # raw frame through the matching slice of the cached maps
+    def undistort_crop(self, raw_frame, x, y, w, h):
+        frame_h, frame_w = raw_frame.shape[:2]
+        maps = self.crop_maps(frame_w, frame_h, x, y, w, h)
+        if maps is None:
+            return None
+        return cv2.remap(raw_frame, maps[0], maps[1], cv2.INTER_LINEAR)
+
+    # Same crop, but only the band of raw rows the remap reads is fetched: read_rows(top, bottom)
+    # returns raw rows [top, bottom) at full width. Bilinear interpolation reads one row below
+    # the integer map position, hence the + 2.
+    def undistort_crop_rows(self, read_rows, frame_w, frame_h, x, y, w, h):
+        maps = self.crop_maps(frame_w, frame_h, x, y, w, h)
+        if maps is None:
+            return None
+        map1, map2 = maps
+        rows = map1[..., 1]
+        top = min(max(int(rows.min()), 0), frame_h - 1)
+        bottom = max(min(int(rows.max()) + 2, frame_h), top + 1)
+        shifted = map1.copy()
+        shifted[..., 1] -= top
+        return cv2.remap(read_rows(top, bottom), shifted, map2, cv2.INTER_LINEAR)